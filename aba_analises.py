@@ -8,80 +8,13 @@ import re
 import os
 import plotly.express as px
 import matplotlib.pyplot as plt
+from modules.codebook import remover_categorias_vazias
+from modules.store import consultar_desligamentos, valores_distintos
 
 # ---------------------------------------------------------
 # FUNÇÕES AUXILIARES
 # ---------------------------------------------------------
 
-# --- 1. DICIONÁRIOS ---
-DE_PARA_CAUSAS = {
-    'Não se Aplica': 'NA', 'Descarga Atmosférica': 'DAT', 'Queimada': 'QMD',
-    'Queimadas': 'QMD', 'Curicaca / Aves': 'CRC', 'Excremento de Pássaro': 'CRC',
-    'Vegetação': 'VGT', 'Outros': 'OTR', 'EXPLOSÃO': 'EXP', 'ACIDENTAL': 'DAC',
-    'PROTEÇÃO, MEDIÇÃO E CONTROLE': 'PMC', 'FALHA EM ACESSÓRIOS E COMPONENTES': 'FAC',
-    'Equipamentos e Acessórios': 'FAC', 'INDETERMINADA': 'IND', 'Causa indeterminada': 'IND',
-    'CONDIÇÕES ANORMAIS DE OPERAÇÃO': 'CAO', 'ERRO DE AJUSTE': 'EDA', 'RAJADA DE VENTO': 'RDV',
-    'Queda de Torre': 'QTR', 'Condições Metereológicas Adversas': 'CMA',
-    'Falhas humanas': 'FHU', 'Colisão Avião Agricola': 'CAA', 'Causa Externa a FT': 'CEFT'
-}
-
-DE_LINHA_SIGLA = {
-    'LT 500kV Serra da Mesa - Samambaia': 'LT SMSB C3',
-    'LT 500kV Serra da Mesa - Gurupi': 'LT SMGU C2',
-    'LT 500kV Gurupi - Miracema': 'LT GUMC C2',
-    'LT 500kV Colinas - Miracema': 'LT COMC C2',
-    'LT 500kV Imperatriz - Colinas': 'LT IZCO C2',
-    'LT 500kV Serra da Mesa - Serra da Mesa 2': 'LT SMSD',
-    'LT 500kV Serra da Mesa 2 - Rio das Éguas': 'LT SDRDE',
-    'LT 500kV Rio das Éguas - Bom Jesus da Lapa': 'LT RDEBJD',
-    'LT 500kV MIRACEMA-GURUPI C2': 'LT GUMC C2',
-    'LT 500kV RIO DAS ÉGUAS-B JESUS LAPA II': 'LT RDEBJD',
-    'LT 500kV LAJEADO-MIRACEMA C1': 'LT LJMC C1',
-    'LT 500kV GURUPI-SERRA DA MESA C2': 'LT SMGU C2',
-    'LT 500kV SERRA DA MESA II-RIO DAS ÉGUAS': 'LT SDRDE',
-    'LT 230 kV BRASNORTE - NOVA MUTUM 1': 'LT BNNM C1',
-    'LT 230 kV BRASNORTE - NOVA MUTUM 2': 'LT BNNM C2',
-    'LT 230kV BARREIRAS/RIO GRANDE II C1': 'LT RGDBRA C1',
-    'LT 230kV BARREIRAS II/RIO GRANDE II C1': 'LT BRABRD C1',
-    'LT 500kV COLINAS-MIRACEMA C2': 'LT COMC C2',
-    'LT 230kV LAJEADO-PALMAS C1': 'LT LJPL C1',
-    'LT 500kV SERRA DA MESA-SAMAMBAIA C3': 'LT SMSB C3',
-    'LT 500kV LAJEADO-MIRACEMA C2': 'LT LJMC C2',
-    'LT 500kV SERRA DA MESA-SERRA DA MESA II': 'LT SMSD',
-    'LT 230kV JAURU-JUBA C2': 'LT JUJB C2',
-    'LT 230kV JAURU-JUBA C1': 'LT JUJB C2',
-    'LT 230kV LAJEADO-PALMAS C2': 'LT LJPL C2',
-    'LT 230 kV BRASNORTE - NOVA MUTUM 1 / LT 230 kV BRASNORTE - NOVA MUTUM 2': 'LT BNNM C1 / LT BNNM C2 '
-}
-
-DE_FASE = {
-    'A': 'AN',
-    'AG': 'AN',
-    'AT': 'AN',
-    'B': 'BN',
-    'BG': 'BN',
-    'BT': 'BN',
-    'C': 'CN',
-    'CG': 'CN',
-    'CT': 'CN',
-    'V': 'CN',
-    'FV': 'CN',
-    'ABN': 'AB',
-    'ABG': 'AB',
-    'ABT': 'AB',
-    'BCN': 'BC',
-    'BCG': 'BC',
-    'BCT': 'BC',
-    'CAN': 'CA',
-    'CAG': 'CA',
-    'CAT': 'CA',
-    'ABG': 'ABN',
-    'ABT': 'ABN',
-    'BCG': 'BCN',
-    'BCT': 'BCN',
-    'CAG': 'CAN',
-    'CAT': 'CAN',
-}
 # --- 2. FUNÇÕES DE SUPORTE ---
 
 # -----------------------
@@ -444,10 +377,12 @@ def _normalize_and_map_columns(df: pd.DataFrame):
 
 # --- 2. INTERFACE DE ANÁLISES ---
 
-def aba_analises(df_desl_sincronizado):
+def aba_analises(df_desl_sincronizado, fonte=None):
     """
     Recebe apenas o DataFrame já processado pelo app.py 
     ou lê o arquivo 'Desligamentos forçados Taesa.xlsx'.
+    fonte: importação da base no banco local (modules.store); quando
+    informada, opções e filtros são resolvidos por consulta indexada.
     """
     st.title("📊 Painel de Análise de Desligamentos")
 
@@ -471,31 +406,46 @@ def aba_analises(df_desl_sincronizado):
     # Filtro de Concessão
     #m1.metric("Ocorrências no Filtro", len(df_filtrado))
     with m1:
-        opcoes_conc = ["TODAS"] + sorted(df_desl_sincronizado['Concessão'].unique().tolist())
-        conc_sel = st.selectbox("Concessão", opcoes_conc)
-        df_filtrado = df_desl_sincronizado.copy()
-       
-        if conc_sel != "TODAS":
-            df_filtrado = df_filtrado[df_filtrado['Concessão'] == conc_sel]
-            st.text(f"{len(df_filtrado)} Ocorrências na {conc_sel}")
+        if fonte:
+            opcoes_conc = ["TODAS"] + [str(c) for c in valores_distintos('desligamentos', 'Concessão', fonte)]
         else:
-            st.text(f"{len(df_filtrado)} Ocorrências na {conc_sel}")
-        
-        
+            opcoes_conc = ["TODAS"] + sorted(df_desl_sincronizado['Concessão'].unique().tolist())
+        conc_sel = st.selectbox("Concessão", opcoes_conc)
+
     with m2:
-        opcoes_ano = ["TODOS"] + sorted([str(a) for a in df_desl_sincronizado['Ano'].unique()], reverse=True)
+        if fonte:
+            anos = valores_distintos('desligamentos', 'Ano', fonte)
+        else:
+            anos = df_desl_sincronizado['Ano'].unique()
+        opcoes_ano = ["TODOS"] + sorted([str(a) for a in anos], reverse=True)
         # ano_min=min(df_filtrado['Ano'])
         # ano_max=max(df_filtrado['Ano'])
         # ano_Selecionado=st.slider("Ano",ano_min,ano_max,None,1)
         
         ano_sel = st.selectbox("Ano", opcoes_ano)
-        df_filtrado = df_desl_sincronizado.copy()
-         # Filtro de Ano
-        if ano_sel != "TODOS":
-            df_filtrado = df_filtrado[df_filtrado['Ano'] == int(ano_sel)]
-            st.text(f"{len(df_filtrado)} Ocorrências em {ano_sel}")
+
+    # os dois filtros valem juntos (antes o de Ano descartava o de Concessão)
+    filtros = {}
+    if conc_sel != "TODAS":
+        filtros['Concessão'] = conc_sel
+    if ano_sel != "TODOS":
+        filtros['Ano'] = int(ano_sel)
+
+    if fonte:
+        df_filtrado = consultar_desligamentos(fonte, filtros)
+    else:
+        mascara = pd.Series(True, index=df_desl_sincronizado.index)
+        for coluna, valor in filtros.items():
+            mascara &= df_desl_sincronizado[coluna] == valor
+        df_filtrado = df_desl_sincronizado[mascara]
+
+    m1.text(f"{len(df_filtrado)} Ocorrências na {conc_sel}")
+    if ano_sel != "TODOS":
+        m2.text(f"{len(df_filtrado)} Ocorrências em {ano_sel}")
     
     # --- LÓGICA DE FILTRAGEM ---
+    # categorias sem ocorrência no filtro não entram nos gráficos
+    df_filtrado = remover_categorias_vazias(df_filtrado)
 
     st.divider()
 
@@ -572,7 +522,8 @@ def aba_analises(df_desl_sincronizado):
             index='FT', 
             columns=['Mes_Num', 'Mês'], 
             values='Concessão', 
-            aggfunc='count'
+            aggfunc='count',
+            observed=True
         ).fillna(0)
 
         # Reordenar colunas para garantir Jan -> Dez
@@ -618,7 +569,8 @@ def aba_analises(df_desl_sincronizado):
             index='Causa', 
             columns=['Mes_Num', 'Mês'], 
             values='Concessão', 
-            aggfunc='count'
+            aggfunc='count',
+            observed=True
         ).fillna(0)
 
         # Ordenar cronologicamente de Jan a Dez
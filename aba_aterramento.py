@@ -3,6 +3,9 @@ import pandas as pd
 import numpy as np
 import plotly.express as px # Importação para gráficos interativos
 import re
+import sqlite3
+
+from modules.store import COLUNAS_RESISTENCIA, consultar_resistencias, faixa, importar_resistencias, valores_distintos
 
 
 def aba_aterramento(source):
@@ -39,9 +42,7 @@ def aba_aterramento(source):
             # Carregar dados de Resistência de Aterramento
             # Assumindo que o arquivo está na pasta local
             df_resistencia = pd.read_excel(RESISTENCIA_FILE, sheet_name='LT Torre', header=0) # Nome da planilha de Resistência
-            df_resistencia.columns = ['ID', 'Linha de Transmissão', 'Número Operação', 'Tipo de Torre', 'Fase de Aterramento', 'Data da medição da resistência do aterramento', 
-                                    'Última Medição Resistência de aterramento (Ω)', 'Supervisor', 'Melhoria Aterramento', 'Data Medição', 'Medição Paralelo Antes (Ω)', 
-                                    'Medição Paralelo Depois (Ω)', 'Medição Oposto Antes (Ω)', 'Medição Oposto Depois (Ω)', 'Fases Implementadas']
+            df_resistencia.columns = COLUNAS_RESISTENCIA
             
             # Carregar dados de Desligamentos Forçados (ajustando o cabeçalho)
             df_ocorrencias = pd.read_excel(OCORRENCIAS_FILE, sheet_name='Ocorrências', header=0) # Nome da planilha de Ocorrências
@@ -95,6 +96,12 @@ def aba_aterramento(source):
     # Carrega os dados de análise apenas uma vez
     df_resistencia, df_ocorrencias = load_data_analise()
 
+    # Medições também no banco local: filtros de LT/faixa viram consulta indexada
+    try:
+        fonte_resistencias = importar_resistencias(RESISTENCIA_FILE) if not df_resistencia.empty else None
+    except (OSError, ValueError, sqlite3.Error):
+        fonte_resistencias = None
+
     # Processa o cruzamento
     if not df_resistencia.empty and not df_ocorrencias.empty:
         df_cruzado = prepare_and_merge_data(df_resistencia, df_ocorrencias)
@@ -108,9 +115,7 @@ def aba_aterramento(source):
             # Carregar dados de Resistência de Aterramento
             # Assumindo que o arquivo está na pasta local
             df_resistencia = pd.read_excel(RESISTENCIA_FILE, sheet_name='LT Torre', header=0) # Nome da planilha de Resistência
-            df_resistencia.columns = ['ID', 'Linha de Transmissão', 'Número Operação', 'Tipo de Torre', 'Fase de Aterramento', 'Data da medição da resistência do aterramento', 
-                                    'Última Medição Resistência de aterramento (Ω)', 'Supervisor', 'Melhoria Aterramento', 'Data Medição', 'Medição Paralelo Antes (Ω)', 
-                                    'Medição Paralelo Depois (Ω)', 'Medição Oposto Antes (Ω)', 'Medição Oposto Depois (Ω)', 'Fases Implementadas']
+            df_resistencia.columns = COLUNAS_RESISTENCIA
             
             # Carregar dados de Desligamentos Forçados (ajustando o cabeçalho)
             df_ocorrencias = pd.read_excel(OCORRENCIAS_FILE, sheet_name='Ocorrências', header=0) # Nome da planilha de Ocorrências
@@ -219,7 +224,11 @@ def aba_aterramento(source):
             st.header("⚙️ Filtros de Aterramento")
             
             # 1. Filtro por Linha de Transmissão
-            todas_lts_resistencia = sorted(df_resistencia['Linha de Transmissão'].astype(str).unique())
+            if fonte_resistencias:
+                todas_lts_resistencia = sorted(str(lt) for lt in valores_distintos(
+                    'resistencias', 'Linha de Transmissão', fonte_resistencias))
+            else:
+                todas_lts_resistencia = sorted(df_resistencia['Linha de Transmissão'].astype(str).unique())
             lt_selecionada = st.selectbox(
                 "🔹 Linha de Transmissão:", 
                 ['Todas'] + todas_lts_resistencia,
@@ -227,15 +236,23 @@ def aba_aterramento(source):
             )
 
             # 2. Filtro por Faixa de Resistência
-            # Filtra o DataFrame de acordo com a seleção
-            df_filtrado = df_resistencia[df_resistencia['Linha de Transmissão'] == lt_selecionada]
-           # Calcula min e max apenas do DataFrame filtrado
-            if not df_filtrado.empty:
-                min_resistencia = float(df_filtrado['Última Medição Resistência de aterramento (Ω)'].min())
-                max_resistencia = float(df_filtrado['Última Medição Resistência de aterramento (Ω)'].max())
+            if fonte_resistencias:
+                # MIN/MAX direto no banco, na LT escolhida (ou em todas)
+                min_resistencia, max_resistencia = faixa(
+                    'resistencias', 'Última Medição Resistência de aterramento (Ω)', fonte_resistencias,
+                    {'Linha de Transmissão': lt_selecionada} if lt_selecionada != 'Todas' else None)
+                if min_resistencia is None:
+                    min_resistencia, max_resistencia = 0.0, 999.0
             else:
-                min_resistencia = 0.0
-                max_resistencia = 999.0
+                # Filtra o DataFrame de acordo com a seleção
+                df_filtrado = df_resistencia[df_resistencia['Linha de Transmissão'] == lt_selecionada]
+               # Calcula min e max apenas do DataFrame filtrado
+                if not df_filtrado.empty:
+                    min_resistencia = float(df_filtrado['Última Medição Resistência de aterramento (Ω)'].min())
+                    max_resistencia = float(df_filtrado['Última Medição Resistência de aterramento (Ω)'].max())
+                else:
+                    min_resistencia = 0.0
+                    max_resistencia = 999.0
                 
             # Arredonda para o inteiro mais próximo para o slider, mas mantém o float para a filtragem
             resistencia_range = st.slider(
@@ -248,17 +265,22 @@ def aba_aterramento(source):
             )
             
             # --- APLICAR OS FILTROS ---
-            df_resistencia_filtrada = df_resistencia.copy()
+            if fonte_resistencias:
+                df_resistencia_filtrada = consultar_resistencias(
+                    fonte_resistencias, lt=lt_selecionada if lt_selecionada != 'Todas' else None,
+                    resistencia=resistencia_range)
+            else:
+                df_resistencia_filtrada = df_resistencia.copy()
 
-            # Filtrar por LT
-            if lt_selecionada != 'Todas':
-                df_resistencia_filtrada = df_resistencia_filtrada[df_resistencia_filtrada['Linha de Transmissão'] == lt_selecionada]
-            
-            # Filtrar por Faixa de Resistência
-            df_resistencia_filtrada = df_resistencia_filtrada[
-                (df_resistencia_filtrada['Última Medição Resistência de aterramento (Ω)'] >= resistencia_range[0]) &
-                (df_resistencia_filtrada['Última Medição Resistência de aterramento (Ω)'] <= resistencia_range[1])
-            ]
+                # Filtrar por LT
+                if lt_selecionada != 'Todas':
+                    df_resistencia_filtrada = df_resistencia_filtrada[df_resistencia_filtrada['Linha de Transmissão'] == lt_selecionada]
+                
+                # Filtrar por Faixa de Resistência
+                df_resistencia_filtrada = df_resistencia_filtrada[
+                    (df_resistencia_filtrada['Última Medição Resistência de aterramento (Ω)'] >= resistencia_range[0]) &
+                    (df_resistencia_filtrada['Última Medição Resistência de aterramento (Ω)'] <= resistencia_range[1])
+                ]
             
             # --- EXIBIÇÃO DOS DADOS FILTRADOS ---
             st.info(f"Mostrando **{len(df_resistencia_filtrada)}** medições filtradas.")
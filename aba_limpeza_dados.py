@@ -6,76 +6,8 @@ import openpyxl
 import os
 import plotly.express as px
 import plotly.graph_objects as go
+from modules.codebook import CODEBOOKS, aplicar_mapeamentos, remover_categorias_vazias, resumo_nao_mapeados
 
-# --- 1. DICIONÁRIOS ---
-DE_PARA_CAUSAS = {
-    'Não se Aplica': 'NA', 'Descarga Atmosférica': 'DAT', 'Queimada': 'QMD',
-    'Queimadas': 'QMD', 'Curicaca / Aves': 'CRC', 'Excremento de Pássaro': 'CRC',
-    'Vegetação': 'VGT', 'Outros': 'OTR', 'EXPLOSÃO': 'EXP', 'ACIDENTAL': 'DAC',
-    'PROTEÇÃO, MEDIÇÃO E CONTROLE': 'PMC', 'FALHA EM ACESSÓRIOS E COMPONENTES': 'FAC',
-    'Equipamentos e Acessórios': 'FAC', 'INDETERMINADA': 'IND', 'Causa indeterminada': 'IND',
-    'CONDIÇÕES ANORMAIS DE OPERAÇÃO': 'CAO', 'ERRO DE AJUSTE': 'EDA', 'RAJADA DE VENTO': 'RDV',
-    'Queda de Torre': 'QTR', 'Condições Metereológicas Adversas': 'CMA',
-    'Falhas humanas': 'FHU', 'Colisão Avião Agricola': 'CAA', 'Causa Externa a FT': 'CEFT'
-}
-
-DE_LINHA_SIGLA = {
-    'LT 500kV Serra da Mesa - Samambaia': 'LT SMSB C3',
-    'LT 500kV Serra da Mesa - Gurupi': 'LT SMGU C2',
-    'LT 500kV Gurupi - Miracema': 'LT GUMC C2',
-    'LT 500kV Colinas - Miracema': 'LT COMC C2',
-    'LT 500kV Imperatriz - Colinas': 'LT IZCO C2',
-    'LT 500kV Serra da Mesa - Serra da Mesa 2': 'LT SMSD',
-    'LT 500kV Serra da Mesa 2 - Rio das Éguas': 'LT SDRDE',
-    'LT 500kV Rio das Éguas - Bom Jesus da Lapa': 'LT RDEBJD',
-    'LT 500kV MIRACEMA-GURUPI C2': 'LT GUMC C2',
-    'LT 500kV RIO DAS ÉGUAS-B JESUS LAPA II': 'LT RDEBJD',
-    'LT 500kV LAJEADO-MIRACEMA C1': 'LT LJMC C1',
-    'LT 500kV GURUPI-SERRA DA MESA C2': 'LT SMGU C2',
-    'LT 500kV SERRA DA MESA II-RIO DAS ÉGUAS': 'LT SDRDE',
-    'LT 230 kV BRASNORTE - NOVA MUTUM 1': 'LT BNNM C1',
-    'LT 230 kV BRASNORTE - NOVA MUTUM 2': 'LT BNNM C2',
-    'LT 230kV BARREIRAS/RIO GRANDE II C1': 'LT RGDBRA C1',
-    'LT 230kV BARREIRAS II/RIO GRANDE II C1': 'LT BRABRD C1',
-    'LT 500kV COLINAS-MIRACEMA C2': 'LT COMC C2',
-    'LT 230kV LAJEADO-PALMAS C1': 'LT LJPL C1',
-    'LT 500kV SERRA DA MESA-SAMAMBAIA C3': 'LT SMSB C3',
-    'LT 500kV LAJEADO-MIRACEMA C2': 'LT LJMC C2',
-    'LT 500kV SERRA DA MESA-SERRA DA MESA II': 'LT SMSD',
-    'LT 230kV JAURU-JUBA C2': 'LT JUJB C2',
-    'LT 230kV JAURU-JUBA C1': 'LT JUJB C2',
-    'LT 230kV LAJEADO-PALMAS C2': 'LT LJPL C2',
-    'LT 230 kV BRASNORTE - NOVA MUTUM 1 / LT 230 kV BRASNORTE - NOVA MUTUM 2': 'LT BNNM C1 / LT BNNM C2 '
-}
-
-DE_FASE = {
-    'A': 'AN',
-    'AG': 'AN',
-    'AT': 'AN',
-    'B': 'BN',
-    'BG': 'BN',
-    'BT': 'BN',
-    'C': 'CN',
-    'CG': 'CN',
-    'CT': 'CN',
-    'V': 'CN',
-    'FV': 'CN',
-    'ABN': 'AB',
-    'ABG': 'AB',
-    'ABT': 'AB',
-    'BCN': 'BC',
-    'BCG': 'BC',
-    'BCT': 'BC',
-    'CAN': 'CA',
-    'CAG': 'CA',
-    'CAT': 'CA',
-    'ABG': 'ABN',
-    'ABT': 'ABN',
-    'BCG': 'BCN',
-    'BCT': 'BCN',
-    'CAG': 'CAN',
-    'CAT': 'CAN',
-}
 # --- 2. FUNÇÕES DE SUPORTE ---
 
 
@@ -86,22 +18,11 @@ def autolabel(barras, ax):
                     xytext=(0, 3), textcoords="offset points", ha='center', va='bottom')
 
 
-def sincronizar_fluxo_total(df_upload):
-    """
-    Versão adaptada para Streamlit que recebe o DataFrame do upload 
-    e limpa os dados para as demais abas.
-    """
-    st.subheader("🧹 Processamento e Limpeza de Dados")
-
-    if df_upload is None or df_upload.empty:
-        st.warning("Aguardando upload de dados para processar...")
-        return
-
+def _limpar_desligamentos(df, col_ref):
+    """Remove linhas sem concessão/ruído 'SUTIÃ' e datas inválidas, criando a coluna 'Ano'."""
     # 1. Limpeza de "SUTIÃ" e Ruídos de Legenda
     # Filtramos onde a Concessão não é nula e não contém o termo fantasma
-    col_ref = 'Concessão' if 'Concessão' in df_upload.columns else df_upload.columns[0]
-
-    df_dados = df_upload[df_upload[col_ref].notna()].copy()
+    df_dados = df[df[col_ref].notna()].copy()
 
     # Filtro rigoroso contra o erro de codificação "SUTIÃ"
     df_dados = df_dados[~df_dados[col_ref].astype(
@@ -114,14 +35,26 @@ def sincronizar_fluxo_total(df_upload):
         df_dados['Ano'] = df_dados['Data'].dt.year.fillna(0).astype(int)
         # Remove datas inválidas (Ano 0)
         df_dados = df_dados[df_dados['Ano'] > 0]
+    return df_dados
 
-    # 2. Aplicação dos Dicionários (De-Para)
-    if 'Causa' in df_dados.columns:
-        df_dados['Causa'] = df_dados['Causa'].replace(DE_PARA_CAUSAS)
-    if 'FT' in df_dados.columns:
-        df_dados['FT'] = df_dados['FT'].replace(DE_LINHA_SIGLA)
-    if 'Fase' in df_dados.columns:
-        df_dados['Fase'] = df_dados['Fase'].replace(DE_FASE)
+
+def sincronizar_fluxo_total(df_upload):
+    """
+    Versão adaptada para Streamlit que recebe o DataFrame do upload 
+    e limpa os dados para as demais abas.
+    """
+    st.subheader("🧹 Processamento e Limpeza de Dados")
+
+    if df_upload is None or df_upload.empty:
+        st.warning("Aguardando upload de dados para processar...")
+        return
+
+    col_ref = 'Concessão' if 'Concessão' in df_upload.columns else df_upload.columns[0]
+
+    df_dados = _limpar_desligamentos(df_upload, col_ref)
+    opcoes_conc = sorted(df_dados[col_ref].unique().tolist())
+    # Removemos o ano '0' da lista de escolha caso haja datas inválidas
+    anos_disponiveis = sorted([a for a in df_dados['Ano'].unique() if a > 0], reverse=True)
 
     # --- 3. NOVOS FILTROS DE INTERFACE ---
     st.write("### 🔍 Refinar Seleção")
@@ -129,24 +62,29 @@ def sincronizar_fluxo_total(df_upload):
     
     with c1:
         # Filtro de Concessão
-        opcoes_conc = ["TODAS"] + sorted(df_dados[col_ref].unique().tolist())
-        conc_escolhida = st.selectbox("Filtrar por Concessão:", opcoes_conc)
+        conc_escolhida = st.selectbox("Filtrar por Concessão:", ["TODAS"] + opcoes_conc)
 
     with c2:
         # Filtro de Ano
-        # Removemos o ano '0' da lista de escolha caso haja datas inválidas
-        anos_disponiveis = sorted([a for a in df_dados['Ano'].unique() if a > 0], reverse=True)
         opcoes_ano = ["TODOS"] + [str(a) for a in anos_disponiveis]
         ano_escolhido = st.selectbox("Filtrar por Ano:", opcoes_ano)
 
-    # --- 4. APLICAÇÃO DOS FILTROS NO DATAFRAME ---
-    df_filtrado = df_dados.copy()
-
+    # --- 4. APLICAÇÃO DOS FILTROS ---
+    filtros = {}
     if conc_escolhida != "TODAS":
-        df_filtrado = df_filtrado[df_filtrado[col_ref] == conc_escolhida]
-    
+        filtros[col_ref] = conc_escolhida
     if ano_escolhido != "TODOS":
-        df_filtrado = df_filtrado[df_filtrado['Ano'] == int(ano_escolhido)]
+        filtros['Ano'] = int(ano_escolhido)
+
+    df_filtrado = df_dados
+    for coluna, valor in filtros.items():
+        df_filtrado = df_filtrado[df_filtrado[coluna] == valor]
+
+    # Aplicação dos Dicionários (De-Para) -> colunas category
+    df_filtrado, nao_mapeados = aplicar_mapeamentos(df_filtrado, CODEBOOKS)
+    if nao_mapeados:
+        st.warning(f"⚠️ Valores sem correspondência nos dicionários: {resumo_nao_mapeados(nao_mapeados)}")
+    df_filtrado = remover_categorias_vazias(df_filtrado)
 
     # --- 5. FINALIZAÇÃO E ESTADO ---
     # Salvamos o resultado filtrado para que a aba de análises o consuma
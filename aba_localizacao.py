@@ -1,36 +1,232 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+import json
 import os
 import re
-from io import BytesIO
-from collections import defaultdict
-
-def _excel_file_and_sheets_from_source(source):
+from modules.data_loader import open_workbook
+from modules.tower_index import abas_lt, indice_torres
+from modules.lt_plot import altitude_png, dados_altitude, diagrama_png, perfil_png
+from modules.transposicao import NOMES_POSICAO, codigos_transposicao, tabela_transposicao
+from modules.retroanalise import retroanalisar
+from modules.localizacao_falta import METODOS, comprimentos_lt, estimar_km
+from modules.linear_referencing import pontos_geojson, referencia_linear
+from modules.store import consultar_resistencias, fonte_recente
+
+try:  # mapa da retroanálise: folium e streamlit-folium são opcionais
+    from streamlit_folium import st_folium
+    from modules.map_utils import camadas_retroanalise, gerar_mapa, resistencias_por_lt
+    _TEM_MAPA = True
+except ImportError:
+    _TEM_MAPA = False
+
+# Limite de torres desenhadas no diagrama (a tabela lista todas as candidatas da faixa)
+MAX_TORRES_DIAGRAMA = 15
+
+# st.fragment nas versões novas do Streamlit, experimental_fragment nas anteriores
+_fragment = getattr(st, "fragment", None) or st.experimental_fragment
+
+
+@_fragment
+def _painel_busca(workbook, indice, transposicao, referencia, abas, concessao_escolhida, lt_escolhida, fase_escolhida, metodo,
+                  comprimento, torres_jbju_map, df_altitude=None):
     """
-    Dado source (str caminho ou UploadedFile / file-like),
-    retorna (excel_file_like, sheet_names_list, bytes_data_if_buffer)
-    excel_file_like pode ser usado em pd.read_excel(excel_file_like, sheet_name=...)
-    Se source for UploadedFile, retornamos também os bytes (data) para múltiplas leituras.
+    KM de busca, estimativa do método e diagrama da LT escolhida. Roda como
+    fragmento: mudar o KM refaz só este trecho (consulta ao índice de torres
+    em memória), sem reler a planilha nem recalcular os seletores acima.
     """
-    if isinstance(source, str):
-        # caminho local
-        excel_path = source
-        excel_file_like = excel_path
-        sheet_names = pd.ExcelFile(excel_path).sheet_names
-        return excel_file_like, sheet_names, None
+    # 4. KM de Busca
+    col_km, col_km_b, col_tol = st.columns([1, 1, 1])
+    with col_km:
+        valor_busca = st.number_input(
+            "🎯 KM de Busca:",
+            min_value=0.0,
+            step=0.1,
+            format="%.2f",
+            value=0.0,
+            help="Distância em KM a partir do Terminal A.",
+            key='filter_km_localizacao'
+        )
+    with col_km_b:
+        leitura_b = st.number_input(
+            "📡 Leitura Terminal B (opcional):",
+            min_value=0.0,
+            step=0.1,
+            format="%.2f",
+            value=0.0,
+            help="Distância em KM lida no Terminal B (a partir de B). Usada pelos métodos de dois terminais; 0 = sem leitura.",
+            key='filter_km_b_localizacao'
+        )
+    with col_tol:
+        tolerancia_pct = st.number_input("± Tolerância (% da LT):", min_value=0.0, max_value=20.0, step=0.5,
+                                         value=0.0, format="%.1f", key='filter_tolerancia_localizacao',
+                                         help="Faixa de busca em % do comprimento da LT (KM_LT). 0 = incerteza do método.")
+
+    # --- ESTIMATIVA DO KM PELO MÉTODO SELECIONADO ---
+    # a leitura informada (e a do Terminal B, se houver) passa pelo método; o KM
+    # estimado vira o KM de busca e a faixa de incerteza é desenhada no gráfico
+    km_faixa = None
+    if valor_busca > 0:
+        leitura_b_km = leitura_b if leitura_b > 0 else np.nan
+        leituras = ({"tw_a": valor_busca, "tw_b": leitura_b_km} if metodo == "TW"
+                    else {"prot_a": valor_busca, "prot_b": leitura_b_km})
+        estimativa = estimar_km(metodo, comprimento if comprimento is not None else np.nan, **leituras)
+        if estimativa["valido"][0]:
+            valor_busca = float(estimativa["km"][0])
+            km_faixa = (float(estimativa["km_min"][0]), float(estimativa["km_max"][0]))
+            st.caption(f"⚙️ {metodo} (terminal {estimativa['terminal'][0]}): KM estimado {valor_busca:.2f} "
+                       f"— faixa {km_faixa[0]:.2f} a {km_faixa[1]:.2f} km (± {estimativa['incerteza'][0]:.2f} km)")
+        else:
+            st.caption(f"⚙️ {metodo}: sem comprimento da LT para estimar a incerteza; usando o KM informado.")
+        # tolerância manual em % do comprimento substitui a incerteza do método
+        if tolerancia_pct > 0 and comprimento is not None:
+            tolerancia_km = tolerancia_pct / 100 * comprimento
+            km_faixa = (max(0.0, valor_busca - tolerancia_km), min(float(comprimento), valor_busca + tolerancia_km))
+            st.caption(f"📐 Tolerância manual: ± {tolerancia_km:.2f} km ({tolerancia_pct:.1f}% de {comprimento:.2f} km)")
+
+    st.markdown("### 📈 Representação da Sequência de Fases")
+
+    graph_placeholder = st.empty()
+    torres_na_janela_df = None
+
+    if valor_busca <= 0:
+        graph_placeholder.info("Informe o 'KM de Busca' (maior que 0) para localizar as torres.")
+    elif lt_escolhida not in abas:
+        graph_placeholder.error(f"❌ Não foi possível encontrar a aba '{lt_escolhida}' no arquivo principal. Verifique se o nome confere.")
     else:
-        # file-like (UploadedFile)
-        try:
-            source.seek(0)
-        except Exception:
-            pass
-        data = source.read()
-        buf = BytesIO(data)
-        sheet_names = pd.ExcelFile(buf).sheet_names
-        # note: for further reads we'll use BytesIO(data) again
-        return data, sheet_names, data
+        # KM, descrição (D) e fases (E) já normalizados e ordenados no índice de torres
+        km_col = "km"
+        desc_col = "descricao"
+        fase_seq_col = "fases"
+
+        if lt_escolhida not in indice:
+            motivo = indice.ignoradas.get(lt_escolhida, "aba não indexada")
+            graph_placeholder.error(f"❌ Não foi possível usar a aba '{lt_escolhida}': {motivo}.")
+            return
+
+        # busca binária na fatia da LT: primeira torre com KM >= busca
+        km_torres = indice.km_da_lt(lt_escolhida)
+        idx_central = indice.proxima_torre(lt_escolhida, valor_busca)
+
+        if idx_central is not None:
+
+            if km_faixa is not None:
+                # candidatas = todas as torres com KM dentro da faixa (duas buscas binárias),
+                # sempre incluindo o vão da busca (anterior e central)
+                inicio_faixa, fim_faixa = indice.faixa_km(lt_escolhida, *km_faixa)
+                start_idx = min(inicio_faixa, max(0, idx_central - 1))
+                end_idx = max(fim_faixa - 1, idx_central)
+            else:
+                start_idx = max(0, idx_central - 3)
+                end_idx = min(len(km_torres) - 1, idx_central + 3)
+            df_candidatas = indice.janela(lt_escolhida, start_idx, end_idx)
+
+            # o diagrama mostra no máximo MAX_TORRES_DIAGRAMA torres em volta da central
+            if end_idx - start_idx + 1 > MAX_TORRES_DIAGRAMA:
+                start_idx = max(start_idx, idx_central - MAX_TORRES_DIAGRAMA // 2)
+                end_idx = min(end_idx, start_idx + MAX_TORRES_DIAGRAMA - 1)
+            df_plot = indice.janela(lt_escolhida, start_idx, end_idx)
+
+            # torre central: código e figura (Torres JBJU nas LTs da BRASNORTE)
+            is_brasnorte = concessao_escolhida == "BRASNORTE"
+            km_central = df_plot.loc[idx_central, km_col]
+            current_code = str(df_plot.loc[idx_central, fase_seq_col]).strip().upper()
+            imagem_torre_central_excel = None
+            if is_brasnorte and current_code in torres_jbju_map:
+                imagem_torre_central_excel = torres_jbju_map[current_code][2]
+
+            # Plotagem: PNG do cache (por LT, janela, fase e KM) ou desenhado agora
+            codigos = {codigo: seq for codigo, (_, seq, _) in torres_jbju_map.items()} if is_brasnorte else None
+            col_fig, col_gap = graph_placeholder.columns([3, 0.1])
+            with col_fig:
+                st.image(diagrama_png(workbook, indice, lt_escolhida, start_idx, end_idx, idx_central,
+                                      fase_escolhida, valor_busca, km_faixa, codigos),
+                         use_column_width=True)
+
+                # posição física da fase em defeito no KM de busca (busca binária nos trechos da LT)
+                posicao_fase, seq_trecho = transposicao.posicao(lt_escolhida, valor_busca, fase_escolhida)
+                if posicao_fase:
+                    st.info(f"🧭 No KM {valor_busca:.2f} a fase {fase_escolhida[0]} está na posição "
+                            f"**{NOMES_POSICAO[posicao_fase]}** (sequência {seq_trecho}).")
+                # posição no terreno (referência linear pelas coordenadas das torres)
+                if lt_escolhida in referencia:
+                    lat_busca, lon_busca = referencia.km_para_coordenadas(lt_escolhida, valor_busca)
+                    if not np.isnan(lat_busca[0]):
+                        st.caption(f"📍 KM {valor_busca:.2f} no terreno: {lat_busca[0]:.6f}, {lon_busca[0]:.6f}")
+                with st.expander("🔀 Trechos de transposição da LT"):
+                    st.dataframe(transposicao.trechos(lt_escolhida), use_container_width=True)
+
+                # perfil da LT inteira (por trecho de transposição), com zoom até a janela do diagrama;
+                # o conteúdo do expander roda mesmo recolhido, então só desenha quando pedido
+                with st.expander("🗺️ Perfil de transposição da LT inteira"):
+                    mostrar_perfil = st.checkbox("Mostrar perfil", key="perfil_mostrar_localizacao")
+                    km_inicio_lt, km_fim_lt = float(km_torres[0]), float(km_torres[-1])
+                    janela_km = (float(df_plot[km_col].iloc[0]), float(df_plot[km_col].iloc[-1]))
+                    if not mostrar_perfil:
+                        faixa_perfil = None
+                    elif st.checkbox("🔎 Aproximar na janela do diagrama", key="perfil_zoom_janela_localizacao"):
+                        margem = max(janela_km[1] - janela_km[0], 1.0)
+                        faixa_perfil = (max(km_inicio_lt, janela_km[0] - margem), min(km_fim_lt, janela_km[1] + margem))
+                    elif km_fim_lt > km_inicio_lt:
+                        faixa_perfil = st.slider("Trecho (km):", min_value=km_inicio_lt, max_value=km_fim_lt,
+                                                 value=(km_inicio_lt, km_fim_lt), step=0.1,
+                                                 key=f"perfil_km_localizacao_{lt_escolhida}")
+                    else:
+                        faixa_perfil = (km_inicio_lt, km_fim_lt + 1.0)
+                    if faixa_perfil is not None:
+                        st.image(perfil_png(workbook, indice, transposicao, lt_escolhida, *faixa_perfil,
+                                            fase=fase_escolhida, janela_km=janela_km),
+                                 use_column_width=True)
+
+                # perfil de altitude, só quando a aba da LT traz uma coluna de altitude (ver dados_altitude);
+                # como no perfil de transposição, só desenha quando pedido
+                if df_altitude is not None:
+                    with st.expander("⛰️ Perfil de altitude da LT"):
+                        if st.checkbox("Mostrar perfil de altitude", key="altitude_mostrar_localizacao"):
+                            st.image(altitude_png(workbook, df_altitude, lt_escolhida,
+                                                  torre_central=str(df_plot.loc[idx_central, desc_col]).strip(),
+                                                  km_busca=valor_busca),
+                                     use_column_width=True)
+                
+                col_tabela, col_imagem = st.columns([2, 2])
+                st.markdown("---") # Separador para o gráfico
+
+                # --- Exibição da Imagem da Torre Central ---
+                with col_imagem:
+                    st.markdown("### 🖼️ Figura da Torre")
+                    if imagem_torre_central_excel and imagem_torre_central_excel.strip():
+                        
+                        caminho_excel = imagem_torre_central_excel.strip()
+                        caminho_final = os.path.normpath(caminho_excel)
+
+                        imagem_carregada = False
+                        
+                        if os.path.exists(caminho_final):
+                            st.image(caminho_final, caption=f"Torre {current_code}")
+                        else:
+                            st.warning(f"Imagem da torre ({current_code}) não encontrada no caminho: {caminho_final}")
+                    else:
+                        st.info("Caminho da imagem não especificado ou torre não mapeada.")
+
+                # --- Tabela de Torres no Vão ---
+                with col_tabela:
+                    st.markdown("### 📋 Torres no Vão de Análise")
+                    if len(df_candidatas) > len(df_plot):
+                        st.caption(f"{len(df_candidatas)} torres candidatas na faixa; o diagrama mostra as "
+                                   f"{len(df_plot)} mais próximas da central.")
+                    # Seleciona as colunas a serem exibidas para a tabela
+                    torres_na_janela_df = df_candidatas[['km', desc_col, fase_seq_col]].rename(
+                        columns={'km': 'KM', desc_col: 'Torre', fase_seq_col: 'Sequência de Fases'}
+                    )
+                    # Adiciona um marcador visual para a torre central
+                    torres_na_janela_df['Status'] = np.where(torres_na_janela_df['KM'] == km_central, '🎯 Central', '')
+                    
+                    st.dataframe(torres_na_janela_df, use_container_width=True)
+
+        else:
+            graph_placeholder.warning(f"Nenhuma torre encontrada após o KM {valor_busca:.2f}. Verifique a aba '{lt_escolhida}'.")
+
+
 
 def aba_localizacao(source):
     """
@@ -45,20 +241,16 @@ def aba_localizacao(source):
         return
 
     try:
-        excel_file_like, abas, buffer_bytes = _excel_file_and_sheets_from_source(source)
-        # st.write("buffer_bytes",buffer_bytes)
-        # st.write("abas",list(abas))
+        # a planilha é aberta uma única vez e compartilhada entre sessões
+        workbook = open_workbook(source)
+        abas = workbook.sheet_names
     except Exception as e:
         st.error(f"Erro ao abrir o arquivo Excel: {e}")
         return
 
     # --- Leitura da aba Dados ---
     try:
-        if buffer_bytes is None:
-            df_dados = pd.read_excel(excel_file_like, sheet_name="DADOS").fillna("")
-            #st.write("dados", list(df_dados))
-        else:
-            df_dados = pd.read_excel(BytesIO(buffer_bytes), sheet_name="DADOS").fillna("")
+        df_dados = workbook.sheet("DADOS").fillna("")
     except Exception as e:
         st.error(f"Erro ao ler a aba 'DADOS': {e}")
         return
@@ -73,20 +265,28 @@ def aba_localizacao(source):
     todas_concessoes = sorted(df_dados["CONCESSÕES"].unique().tolist())
     todas_concessoes = [c for c in todas_concessoes if c != ""]
 
+    # Pré-carrega todas as abas de LT (A:E) em paralelo; depois da 1ª vez fica em memória/disco
+    # abas de LT da DADOS e também as que a DADOS não lista: a retroanálise liga a FT pelo nome da aba
+    lts_localizador = abas_lt(workbook, df_dados["LT"])
+    with st.spinner("Carregando abas das LTs..."):
+        workbook.preload(lts_localizador, usecols="A:E")
+        # índice de KM de todas as LTs, montado uma vez por planilha e compartilhado entre sessões
+        indice = indice_torres(workbook, lts_localizador)
+
     # --- Leitura da aba KM_LT ---
     comprimento = None
     terminal_a = "Não Encontrado"
     if "KM_LT" in abas:
         try:
-            if buffer_bytes is None:
-                df_km = pd.read_excel(excel_file_like, sheet_name="KM_LT").fillna("")
-            else:
-                df_km = pd.read_excel(BytesIO(buffer_bytes), sheet_name="KM_LT").fillna("")
+            df_km = workbook.sheet("KM_LT").fillna("")
         except Exception:
             df_km = pd.DataFrame()
     else:
         df_km = pd.DataFrame()
 
+    # referência linear KM <-> coordenadas (LTs com latitude/longitude nas torres)
+    referencia = referencia_linear(workbook, lts_localizador, comprimentos_lt(df_km))
+
     # -----------------------------------------------------------
     # LÓGICA: IDENTIFICAR COLUNAS NA KM_LT (COLUNA A, B, C)
     # -----------------------------------------------------------
@@ -105,10 +305,7 @@ def aba_localizacao(source):
     torres_jbju_map = {}
     if "Torres JBJU" in abas:
         try:
-            if buffer_bytes is None:
-                df_jbju = pd.read_excel(excel_file_like, sheet_name="Torres JBJU").fillna("")
-            else:
-                df_jbju = pd.read_excel(BytesIO(buffer_bytes), sheet_name="Torres JBJU").fillna("")
+            df_jbju = workbook.sheet("Torres JBJU").fillna("")
         except Exception:
             df_jbju = pd.DataFrame()
 
@@ -128,8 +325,13 @@ def aba_localizacao(source):
             if "Torres JBJU" in abas:
                 st.warning("⚠️ A aba 'Torres JBJU' deve ter pelo menos 5 colunas para ler o Caminho da Imagem da COLUNA E. (A, B, C, D, E)")
 
+    # --- TABELA DE TRANSPOSIÇÃO (trechos por LT, compartilhada entre sessões) ---
+    # nas LTs da BRASNORTE a coluna FASES traz o código da torre (Torres JBJU); o mesmo vale na retroanálise
+    codigos_por_lt = codigos_transposicao(df_dados, df_jbju) if torres_jbju_map else {}
+    transposicao = tabela_transposicao(workbook, indice, {lt: c for lt, c in codigos_por_lt.items() if lt in indice})
+
     # 1. Concessão
-    col1,col2,col3,col4,col5=st.columns([1,1,1,1,1])
+    col1,col2,col3,col4=st.columns([1,1,1,1])
     with col1:
         concessao_escolhida = st.selectbox("🔹 CONCESSÃO:", todas_concessoes, key='filter_concessao_localizacao')
 
@@ -150,20 +352,9 @@ def aba_localizacao(source):
         fase_escolhida = st.selectbox("🔹 Fase Defeito:", ['AG', 'BG', 'CG'], key='filter_fase_localizacao')
     with col4:
         metodo = st.selectbox("⚙️ Método:",
-                                    ["Sequência Negativa", "TW", "SIGRA 1 Terminal", "SIGRA 2 Terminais"],
+                                    METODOS,
                                     key='filter_metodo_localizacao')
 
-    # 4. KM de Busca
-    with col5:
-        valor_busca = st.number_input(
-            "🎯 KM de Busca:",
-            min_value=0.0,
-            step=0.1,
-            format="%.2f",
-            value=0.0,
-            help="Distância em KM a partir do Terminal A.",
-            key='filter_km_localizacao'
-        )
 
     # ==========================================================
     # >>> LAYOUT DA SIDEBAR: TERMINAL A e COMPRIMENTO <<<
@@ -197,236 +388,56 @@ def aba_localizacao(source):
         else:
             st.warning("Comprimento N/D", icon="⚠️")
 
-    #st.markdown("---")
-    
+
     # ==========================================================
-    # >>> LAYOUT DA ÁREA PRINCIPAL: GRÁFICO, TABELA E IMAGEM <<<
+    # >>> LAYOUT DA ÁREA PRINCIPAL: BUSCA AO VIVO, GRÁFICO, TABELA E IMAGEM <<<
     # ==========================================================
     if lt_escolhida:
-        st.markdown("### 📈 Representação da Sequência de Fases")
-
-        graph_placeholder = st.empty()
-        col_btn, col_gap_btn = st.columns([1, 5])
-        with col_btn:
-            plotar_clicado = st.button("🔍 Plotar Resultados")
-
-        torres_na_janela_df = None
-
-        if plotar_clicado and lt_escolhida in abas and valor_busca > 0:
-            # prepara um buffer novo para leitura dessa aba LT específica
-            try:
-                if buffer_bytes is None:
-                    # source is a path str
-                    df_lt = pd.read_excel(excel_file_like, sheet_name=lt_escolhida)
-                else:
-                    df_lt = pd.read_excel(BytesIO(buffer_bytes), sheet_name=lt_escolhida)
-            except Exception as e:
-                graph_placeholder.error(f"❌ Erro ao ler a aba '{lt_escolhida}': {e}")
-                return
-
-            # padroniza nomes de colunas
-            df_lt.columns = [str(c).strip().lower().replace(' ', '') for c in df_lt.columns]
-
-            # Definindo colunas esperadas na aba da LT
-            km_col = "km"
-            desc_col = df_lt.columns[3] if len(df_lt.columns) >= 4 else "descrição"
-            fase_seq_col = "fases"
-
-            cols_ok = km_col in df_lt.columns and fase_seq_col in df_lt.columns
-
-            if not cols_ok:
-                graph_placeholder.error(f"❌ Colunas esperadas (KM e FASES) não encontradas na aba {lt_escolhida}.")
-                return
-            if not (len(df_lt.columns) >= 4):
-                graph_placeholder.error(f"❌ A aba '{lt_escolhida}' deve ter pelo menos 4 colunas (A, B, C, D) para ler a descrição na Coluna D.")
-                return
-
-            df_lt = df_lt.dropna(subset=[km_col])
-            df_lt[km_col] = pd.to_numeric(df_lt[km_col], errors="coerce")
-            df_lt = df_lt.dropna(subset=[km_col]).sort_values(km_col).reset_index(drop=True)
-
-            torre_idx = df_lt[df_lt[km_col] >= valor_busca].index
-
-            if len(torre_idx) > 0:
-                idx_central = torre_idx[0]
-
-                start_idx = max(0, idx_central - 3)
-                end_idx = min(len(df_lt) - 1, idx_central + 3)
-
-                df_plot = df_lt.loc[start_idx:end_idx].copy()
-                df_plot["x_pos"] = np.linspace(1, 9, len(df_plot))
-
-                Y_POS_FIXED = {1: 3, 2: 2, 3: 1}
-                fase_points = defaultdict(list)
-
-                km_central = 0.0
-                imagem_torre_central_excel = None
-                current_code = ""
-
-                for index, row in df_plot.iterrows():
-                    x = row["x_pos"]
-                    raw_seq_or_code = str(row[fase_seq_col]).strip().upper()
-                    seq_fase_real = raw_seq_or_code
-                    tower_label = str(row[desc_col]).strip()
-                    caminho_imagem = None
-                    is_brasnorte = concessao_escolhida == "BRASNORTE"
-
-                    if is_brasnorte and raw_seq_or_code in torres_jbju_map:
-                        figura_ref_jbju, seq_fase_real_map, caminho_imagem_map = torres_jbju_map.get(raw_seq_or_code, ("", raw_seq_or_code, None))
-                        seq_fase_real = seq_fase_real_map
-                        caminho_imagem = caminho_imagem_map
-
-                    if index == idx_central:
-                        km_central = row[km_col]
-                        x_central = x
-                        imagem_torre_central_excel = caminho_imagem
-                        current_code = raw_seq_or_code
-
-                    if len(seq_fase_real) == 3:
-                        fases_na_torre = {
-                            seq_fase_real[0]: Y_POS_FIXED[1],
-                            seq_fase_real[1]: Y_POS_FIXED[2],
-                            seq_fase_real[2]: Y_POS_FIXED[3]
-                        }
-                        for fase_letra, y_pos in fases_na_torre.items():
-                            fase_points[fase_letra].append((x, y_pos))
-
-                # Plotagem
-                col_fig, col_gap = graph_placeholder.columns([3, 0.1])
-                with col_fig:
-                    fig, ax = plt.subplots(figsize=(12, 5))
-                    ax.set_xlim(0, 10)
-                    ax.set_ylim(0, 5)
-                    ax.axis("off")
-
-                    y_start_torre = 0.8
-                    y_end_torre = 3.2
-                    FASE_COLORS = {"A": "orange", "B": "green", "C": "purple"}
-
-                    # 1. Desenha as Linhas de Fase (Transposição)
-                    for fase_letra, points in fase_points.items():
-                        if points:
-                            x_coords = [p[0] for p in points]
-                            y_coords = [p[1] for p in points]
-
-                            color = FASE_COLORS.get(fase_letra, "gray")
-                            linewidth = 3 if fase_letra == fase_escolhida else 1.5
-                            linestyle = '-' if fase_letra == fase_escolhida else '--'
-
-                            ax.plot(x_coords, y_coords, color=color, linewidth=linewidth, linestyle=linestyle, alpha=0.7, zorder=1)
-
-                            if len(x_coords) > 0:
-                                ax.text(x_coords[-1] + 0.1, y_coords[-1], f"Fase {fase_letra}", va="center", fontsize=10, color=color)
-
-                    # 2. Desenha as Torres e Rótulos
-                    for index, row in df_plot.iterrows():
-                        x = row["x_pos"]
-                        is_central = index == idx_central
-
-                        line_color = "red" if is_central else "gray"
-                        line_style = "-" if is_central else "--"
-                        line_width = 3 if is_central else 1.5
-
-                        ax.vlines(x, y_start_torre, y_end_torre,
-                                  colors=line_color, linestyles=line_style, linewidth=line_width, zorder=3)
-
-                        km_text = f"{row[km_col]:.2f} km"
-
-                        tower_label_plot = str(row[desc_col]).strip()
-                        current_code_plot = str(row[fase_seq_col]).strip().upper()
-                        seq_to_display = current_code_plot
-
-                        if is_brasnorte and current_code_plot in torres_jbju_map:
-                            _, seq_fase_real, _ = torres_jbju_map[current_code_plot]
-                            seq_to_display = seq_fase_real
-
-                        ax.text(x, 0.7, f"Torre: {tower_label_plot}\n{km_text}", ha="center", fontsize=9, color=line_color if is_central else "black")
-
-                        ax.text(x, y_end_torre + 0.1, f"Seq: {seq_to_display}", ha="center", fontsize=9,
-                                bbox=dict(facecolor='white', alpha=0.8, edgecolor=line_color if is_central else 'gray', boxstyle='round,pad=0.3'),
-                                zorder=4)
-
-                    # 3. Desenha o KM de Busca (Lógica de interpolação mantida)
-                    x_busca = x_central
-                    if valor_busca != km_central:
-                        torre_ant = df_lt[(df_lt[km_col] < valor_busca)].iloc[-1] if not df_lt[df_lt[km_col] < valor_busca].empty else None
-                        torre_prox = df_lt[(df_lt[km_col] >= valor_busca)].iloc[0] if not df_lt[df_lt[km_col] >= valor_busca].empty else None
-
-                        if torre_ant is not None and torre_prox is not None:
-                            km_ant = torre_ant[km_col]
-                            km_prox = torre_prox[km_col]
-
-                            x_ant_idx = df_plot.index[df_plot[km_col] == km_ant].tolist()
-                            x_prox_idx = df_plot.index[df_plot[km_col] == km_prox].tolist()
-
-                            if x_ant_idx and x_prox_idx and km_prox > km_ant:
-                                x_ant = df_plot.loc[x_ant_idx[0], "x_pos"]
-                                x_prox = df_plot.loc[x_prox_idx[0], "x_pos"]
-
-                                distancia_total = km_prox - km_ant
-                                distancia_relativa = valor_busca - km_ant
-                                proporcao = distancia_relativa / distancia_total
-                                x_busca = x_ant + proporcao * (x_prox - x_ant)
-
-                    ax.vlines(x_busca, y_start_torre, y_end_torre, colors="blue", linestyles="dotted", linewidth=2, zorder=5)
-                    ax.text(x_busca, 0.4, f"KM de Busca: {valor_busca:.2f}", ha="center", color="blue", fontsize=10,
-                            bbox=dict(facecolor='lightblue', alpha=0.7, edgecolor='blue', boxstyle='round,pad=0.3'), zorder=6)
-
-                    # Destaque do PONTO do KM de busca na fase afetada
-                    target_fase_points = fase_points.get(fase_escolhida)
-                    if target_fase_points:
-                        x_coords = [p[0] for p in target_fase_points]
-                        y_coords = [p[1] for p in target_fase_points]
-                        for i in range(len(x_coords) - 1):
-                            if x_coords[i] <= x_busca <= x_coords[i + 1]:
-                                x1, y1 = x_coords[i], y_coords[i]
-                                x2, y2 = x_coords[i + 1], y_coords[i + 1]
-                                if x2 - x1 != 0:
-                                    y_busca = y1 + (y2 - y1) * (x_busca - x1) / (x2 - x1)
-                                    ax.plot(x_busca, y_busca, 'o', markersize=10, color='red', markeredgecolor='black', zorder=10)
-                                    break
-
-                    st.pyplot(fig)
-                    
-                    col_tabela, col_imagem = st.columns([2, 2])
-                    st.markdown("---") # Separador para o gráfico
-
-                    # --- Exibição da Imagem da Torre Central ---
-                    with col_imagem:
-                        st.markdown("### 🖼️ Figura da Torre")
-                        if imagem_torre_central_excel and imagem_torre_central_excel.strip():
-                            
-                            caminho_excel = imagem_torre_central_excel.strip()
-                            caminho_final = os.path.normpath(caminho_excel)
-
-                            imagem_carregada = False
-                            
-                            if os.path.exists(caminho_final):
-                                st.image(caminho_final, caption=f"Torre {current_code}")
-                            else:
-                                st.warning(f"Imagem da torre ({current_code}) não encontrada no caminho: {caminho_final}")
-                        else:
-                            st.info("Caminho da imagem não especificado ou torre não mapeada.")
-
-                    # --- Tabela de Torres no Vão ---
-                    with col_tabela:
-                        st.markdown("### 📋 Torres no Vão de Análise")
-                        # Seleciona as colunas a serem exibidas para a tabela
-                        torres_na_janela_df = df_plot[['km', desc_col, fase_seq_col]].rename(
-                            columns={'km': 'KM', desc_col: 'Torre', fase_seq_col: 'Sequência de Fases'}
-                        )
-                        # Adiciona um marcador visual para a torre central
-                        torres_na_janela_df['Status'] = np.where(torres_na_janela_df['KM'] == km_central, '🎯 Central', '')
-                        
-                        st.dataframe(torres_na_janela_df, use_container_width=True)
-
-            else:
-                graph_placeholder.warning(f"Nenhuma torre encontrada após o KM {valor_busca:.2f}. Verifique a aba '{lt_escolhida}'.")
-
-        elif plotar_clicado and valor_busca <= 0:
-            graph_placeholder.error("Por favor, insira um 'KM de Busca' válido (maior que 0).")
-        elif plotar_clicado and lt_escolhida not in abas:
-            graph_placeholder.error(f"❌ Não foi possível encontrar a aba '{lt_escolhida}' no arquivo principal. Verifique se o nome confere.")
+        # altitude verificada aqui, fora do fragmento: mudar o KM não relê a aba da LT
+        _painel_busca(workbook, indice, transposicao, referencia, abas, concessao_escolhida, lt_escolhida, fase_escolhida, metodo,
+                      comprimento, torres_jbju_map, dados_altitude(workbook, lt_escolhida))
     else:
         st.info("Selecione uma Concessão e uma LT para iniciar a análise de localização de torres.")
 
+    # ==========================================================
+    # >>> RETROANÁLISE: TODOS OS DESLIGAMENTOS DE UMA VEZ <<<
+    # ==========================================================
+    with st.expander("🗂️ Retroanálise em lote (todos os desligamentos)"):
+        df_historico = st.session_state.get("df_analise")
+        if df_historico is None or df_historico.empty:
+            st.info("Carregue a base de desligamentos na Home para localizar todo o histórico.")
+        else:
+            origem_km = st.selectbox("KM usado:", ["KM registrado"] + METODOS, key="metodo_retroanalise",
+                                     help="KM registrado na base ou estimado pelo método a partir das leituras dos terminais.")
+            if st.button("▶️ Localizar todas as ocorrências", key="btn_retroanalise"):
+                metodo_lote = None if origem_km == "KM registrado" else origem_km
+                try:
+                    resultado = retroanalisar(df_historico, indice, metodo_lote, comprimentos_lt(df_km), transposicao,
+                                              referencia)
+                except ValueError as e:
+                    st.error(f"❌ {e}")
+                else:
+                    st.caption(" · ".join(f"{status}: {n}" for status, n in resultado["Status"].value_counts().items()))
+                    tabela = pd.concat([df_historico[[c for c in ("Data", "FT", "Fase", "Causa") if c in df_historico.columns]],
+                                        resultado], axis=1)
+                    st.dataframe(tabela, use_container_width=True)
+                    st.download_button("⬇️ Baixar CSV", tabela.to_csv(index=False, sep=";", decimal=",").encode("utf-8-sig"),
+                                       file_name="retroanalise.csv", mime="text/csv")
+                    if resultado["Latitude"].notna().any():
+                        st.download_button("⬇️ Baixar GeoJSON (pontos)",
+                                           json.dumps(pontos_geojson(tabela), ensure_ascii=False).encode("utf-8"),
+                                           file_name="retroanalise.geojson", mime="application/geo+json")
+
+                    # torres com os desligamentos localizados e a resistência medida (aba de aterramento -> banco local)
+                    if _TEM_MAPA:
+                        fonte_resistencias = fonte_recente("resistencias")
+                        resistencias = (resistencias_por_lt(consultar_resistencias(fonte_resistencias))
+                                        if fonte_resistencias else {})
+                        camadas = camadas_retroanalise(workbook, resultado, resistencias)
+                        if camadas:
+                            st_folium(gerar_mapa(None, camadas), key="mapa_retroanalise", height=500,
+                                      use_container_width=True, returned_objects=[])
+                        else:
+                            st.caption("🗺️ Nenhuma LT com desligamentos localizados tem coordenadas nas torres.")
+                    else:
+                        st.caption("🗺️ Instale folium e streamlit-folium para ver as torres no mapa.")
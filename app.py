@@ -1,10 +1,15 @@
 import streamlit as st
 import pandas as pd
 import os
+import sqlite3
 from streamlit_option_menu import option_menu
 from io import BytesIO
-from modules.data_loader import load_sheet_from_path_or_buffer
+from modules.data_loader import load_sheet_from_path_or_buffer, read_sheet_cached, sheet_names_cached, limpar_cache_disco, resumo_tempos_carga
 from modules.preprocess import prepare_lt_dataframe
+from modules.etl_desligamentos import verificar_indice
+from modules.etl_tarefas import iniciar_sincronizacao, tarefa_atual
+from modules.codebook import categorizar, resumo_nao_mapeados
+from modules.store import importar_desligamentos
 from aba_transposicao import aba_transposicao
 from aba_analises import aba_analises
 from aba_llm import aba_llm
@@ -20,160 +25,70 @@ global upload_aterr
 global upload_desl
 
 st.set_page_config(page_title="Desligamentos Forçados GMBR", layout="wide")
-# --- 1. DICIONÁRIOS ---
-DE_PARA_CAUSAS = {
-    'Não se Aplica': 'NA', 'Descarga Atmosférica': 'DAT', 'Queimada': 'QMD',
-    'Queimadas': 'QMD', 'Curicaca / Aves': 'CRC', 'Excremento de Pássaro': 'CRC',
-    'Vegetação': 'VGT', 'Outros': 'OTR', 'EXPLOSÃO': 'EXP', 'ACIDENTAL': 'DAC',
-    'PROTEÇÃO, MEDIÇÃO E CONTROLE': 'PMC', 'FALHA EM ACESSÓRIOS E COMPONENTES': 'FAC',
-    'Equipamentos e Acessórios': 'FAC', 'INDETERMINADA': 'IND', 'Causa indeterminada': 'IND',
-    'CONDIÇÕES ANORMAIS DE OPERAÇÃO': 'CAO', 'ERRO DE AJUSTE': 'EDA', 'RAJADA DE VENTO': 'RDV',
-    'Queda de Torre': 'QTR', 'Condições Metereológicas Adversas': 'CMA',
-    'Falhas humanas': 'FHU', 'Colisão Avião Agricola': 'CAA', 'Causa Externa a FT': 'CEFT'
-}
-
-DE_LINHA_SIGLA = {
-    'LT 500kV Serra da Mesa - Samambaia': 'LT SMSB C3',
-    'LT 500kV Serra da Mesa - Gurupi': 'LT SMGU C2',
-    'LT 500kV Gurupi - Miracema': 'LT GUMC C2',
-    'LT 500kV Colinas - Miracema': 'LT COMC C2',
-    'LT 500kV Imperatriz - Colinas': 'LT IZCO C2',
-    'LT 500kV Serra da Mesa - Serra da Mesa 2': 'LT SMSD',
-    'LT 500kV Serra da Mesa 2 - Rio das Éguas': 'LT SDRDE',
-    'LT 500kV Rio das Éguas - Bom Jesus da Lapa': 'LT RDEBJD',
-    'LT 500kV MIRACEMA-GURUPI C2': 'LT GUMC C2',
-    'LT 500kV RIO DAS ÉGUAS-B JESUS LAPA II': 'LT RDEBJD',
-    'LT 500kV LAJEADO-MIRACEMA C1': 'LT LJMC C1',
-    'LT 500kV GURUPI-SERRA DA MESA C2': 'LT SMGU C2',
-    'LT 500kV SERRA DA MESA II-RIO DAS ÉGUAS': 'LT SDRDE',
-    'LT 230 kV BRASNORTE - NOVA MUTUM 1': 'LT BNNM C1',
-    'LT 230 kV BRASNORTE - NOVA MUTUM 2': 'LT BNNM C2',
-    'LT 230kV BARREIRAS/RIO GRANDE II C1': 'LT RGDBRA C1',
-    'LT 230kV BARREIRAS II/RIO GRANDE II C1': 'LT BRABRD C1',
-    'LT 500kV COLINAS-MIRACEMA C2': 'LT COMC C2',
-    'LT 230kV LAJEADO-PALMAS C1': 'LT LJPL C1',
-    'LT 500kV SERRA DA MESA-SAMAMBAIA C3': 'LT SMSB C3',
-    'LT 500kV LAJEADO-MIRACEMA C2': 'LT LJMC C2',
-    'LT 500kV SERRA DA MESA-SERRA DA MESA II': 'LT SMSD',
-    'LT 230kV JAURU-JUBA C2': 'LT JUJB C2',
-    'LT 230kV JAURU-JUBA C1': 'LT JUJB C2',
-    'LT 230kV LAJEADO-PALMAS C2': 'LT LJPL C2',
-    'LT 230 kV BRASNORTE - NOVA MUTUM 1 / LT 230 kV BRASNORTE - NOVA MUTUM 2': 'LT BNNM C1 / LT BNNM C2 '
-}
-
-DE_FASE = {
-    'A': 'AN',
-    'AG': 'AN',
-    'AT': 'AN',
-    'B': 'BN',
-    'BG': 'BN',
-    'BT': 'BN',
-    'C': 'CN',
-    'CG': 'CN',
-    'CT': 'CN',
-    'V': 'CN',
-    'FV': 'CN',
-    'ABN': 'AB',
-    'ABG': 'AB',
-    'ABT': 'AB',
-    'BCN': 'BC',
-    'BCG': 'BC',
-    'BCT': 'BC',
-    'CAN': 'CA',
-    'CAG': 'CA',
-    'CAT': 'CA',
-    'ABG': 'ABN',
-    'ABT': 'ABN',
-    'BCG': 'BCN',
-    'BCT': 'BCN',
-    'CAG': 'CAN',
-    'CAT': 'CAN',
-}
+# st.fragment só virou estável no Streamlit 1.37
+_fragment = getattr(st, "fragment", None) or st.experimental_fragment
 
-DE_TORRE={
-    'T': 'Torre ',
-    'TORRE': 'Torre ',
-}
 
 def _read_first_sheet(path_or_buffer):
     """Lê o primeiro sheet de um caminho ou UploadedFile e retorna DataFrame."""
-    if isinstance(path_or_buffer, str):
-        xls = pd.ExcelFile(path_or_buffer)
-    else:
-        # UploadedFile: posiciona no início
-        try:
-            path_or_buffer.seek(0)
-        except Exception:
-            pass
-        xls = pd.ExcelFile(path_or_buffer)
-    first = xls.sheet_names[0]
-    return pd.read_excel(xls, sheet_name=first)
+    first = sheet_names_cached(path_or_buffer)[0]
+    return read_sheet_cached(path_or_buffer, first)
 
 
 
         
-def processar_e_salvar_desligamentos(p1_path, p2_path, saida_path):
-    try:
-        if not (os.path.exists(p1_path) and os.path.exists(p2_path)):
-            return False
-            
-        # 1. Leitura da Planilha 1 (Base de comparação)
-        df1 = pd.read_excel(p1_path)
-        
-        # 2. Abrir Planilha 2 para manipular abas
-        xls2 = pd.ExcelFile(p2_path)
-        abas_p2 = xls2.sheet_names
-        
-        # Identificar qual aba da Planilha 2 contém as ocorrências para sincronizar
-        # Se houver uma aba chamada 'Ocorrencia', usamos ela, senão usamos a primeira
-        aba_alvo = 'Ocorrencia' if 'Ocorrencia' in abas_p2 else abas_p2[0]
-        
-        # 3. Criar o arquivo de saída preservando as abas
-        with pd.ExcelWriter(saida_path, engine='xlsxwriter') as writer:
-            
-            for sheet in abas_p2:
-                df_sheet = pd.read_excel(xls2, sheet_name=sheet)
-                
-                if sheet == aba_alvo:
-                    # --- LÓGICA DE SINCRONIZAÇÃO (Apenas para esta aba) ---
-                    df_sinc = pd.concat([df1, df_sheet], ignore_index=True, sort=False)
-                    
-                    # Limpeza e Formatação
-                    if 'Data' in df_sinc.columns:
-                        df_sinc['Data'] = pd.to_datetime(df_sinc['Data'], errors='coerce')
-                        df_sinc['Ano'] = df_sinc['Data'].dt.year.fillna(0).astype(int)
-                        df_sinc = df_sinc[df_sinc['Ano'] > 0]
+def processar_e_salvar_desligamentos(p1_path, p2_path, saida_path, modo="incremental"):
+    """
+    Dispara a sincronização Planilha1 + Planilha2 -> base consolidada em segundo plano.
+    modo="incremental" só acrescenta ocorrências novas; "completo" reprocessa tudo.
+    Retorna a tarefa; enquanto ela roda, a base anterior continua valendo.
+    """
+    tarefa = iniciar_sincronizacao(p1_path, p2_path, saida_path, modo=modo)
+    # quando nada mudou a conferência leva milissegundos: evita piscar a barra de progresso
+    tarefa.aguardar(0.2)
+    return tarefa
 
-                    if 'Hora' in df_sinc.columns:
-                        df_sinc['Hora'] = pd.to_datetime(df_sinc['Hora'], errors='coerce')
 
-                    # Sincronização por chaves únicas
-                    chaves = ['Concessão', 'Data', 'FT']
-                    if 'Hora' in df_sinc.columns: chaves.append('Hora')
-                    df_sinc = df_sinc.drop_duplicates(subset=chaves, keep='first')
+def _mostrar_resultado_etl(resultado_etl):
+    if not resultado_etl:
+        return
+    if resultado_etl["modo"] == "atualizado":
+        st.success(f"⏭️ Base de Desligamentos já atualizada, processamento pulado ({resultado_etl['segundos'] * 1000:.0f} ms).")
+    elif resultado_etl["modo"] == "completo":
+        st.success(f"✅ Base de Desligamentos reconstruída: {resultado_etl['novas']} ocorrências ({resultado_etl['segundos']:.1f}s).")
+    elif resultado_etl["novas"]:
+        st.success(f"✅ Base de Desligamentos sincronizada: {resultado_etl['novas']} novas ocorrências ({resultado_etl['segundos']:.2f}s).")
+    else:
+        st.success(f"✅ Base de Desligamentos verificada, nenhuma ocorrência nova ({resultado_etl['segundos']:.2f}s).")
+    if resultado_etl["atrasadas"]:
+        st.warning(f"⚠️ {resultado_etl['atrasadas']} ocorrências anteriores à última sincronização não foram incluídas. "
+                   "Use 'Reconstruir Base de Desligamentos' para reprocessar o histórico.")
+    if resultado_etl["nao_mapeados"]:
+        st.warning(f"⚠️ Valores sem correspondência nos dicionários: {resumo_nao_mapeados(resultado_etl['nao_mapeados'])}")
+
+
+def _painel_sincronizacao(saida_path, recarregar=False):
+    """
+    Andamento da sincronização em segundo plano. Com recarregar=True (versão
+    em fragmento, que se repete a cada segundo) roda o app de novo quando a
+    base nova fica pronta, para as abas passarem a usá-la.
+    """
+    tarefa = tarefa_atual(saida_path)
+    if tarefa is None:
+        return
+    if tarefa.em_execucao:
+        st.progress(tarefa.progresso, text=f"⏳ Sincronizando Base de Desligamentos: {tarefa.mensagem}")
+        st.caption("Os dados abaixo são da base anterior até a nova ficar pronta.")
+    elif tarefa.estado == "erro":
+        st.error(f"Erro no processamento multi-aba: {tarefa.mensagem}")
+    else:
+        _mostrar_resultado_etl(tarefa.resultado)
+        if (recarregar and tarefa.resultado and tarefa.resultado["modo"] != "atualizado"
+                and st.session_state.get("etl_recarregada") != id(tarefa)):
+            st.session_state["etl_recarregada"] = id(tarefa)
+            st.rerun()
 
-                    # Aplicar Dicionários
-                    df_sinc['Causa'] = df_sinc['Causa'].replace(DE_PARA_CAUSAS) if 'Causa' in df_sinc.columns else df_sinc['Causa']
-                    df_sinc['FT'] = df_sinc['FT'].replace(DE_LINHA_SIGLA) if 'FT' in df_sinc.columns else df_sinc['FT']
-                    df_sinc['Fase'] = df_sinc['Fase'].replace(DE_FASE) if 'Fase' in df_sinc.columns else df_sinc
-                    df_sinc['Torre'] = df_sinc['Torre'].replace(DE_TORRE) if 'Torre' in df_sinc.columns else df_sinc
-                    
-                    # Formatação Final
-                    if 'Data' in df_sinc.columns: df_sinc['Data'] = df_sinc['Data'].dt.date
-                    if 'Hora' in df_sinc.columns: df_sinc['Hora'] = df_sinc['Hora'].dt.time
-                    
-                    # Salva a aba sincronizada
-                    df_sinc.to_excel(writer, sheet_name=sheet, index=False)
-                else:
-                    # --- CÓPIA SIMPLES (Para as outras abas) ---
-                    df_sheet.to_excel(writer, sheet_name=sheet, index=False)
-                    
-        return True
 
-    except Exception as e:
-        st.error(f"Erro no processamento multi-aba: {e}")
-        return False
-    
 def carregar_desligamentos_e_aterramento(): #upload_localizador,upload_aterr,upload_desl
     st.subheader("⚙️ Configuração de Dados")
 
@@ -185,10 +100,22 @@ def carregar_desligamentos_e_aterramento(): #upload_localizador,upload_aterr,upl
     DEFAULT_EXCEL_PATH = "Localizador de Vão.xlsx"
 
     # --- MOMENTO 1: PROCESSAMENTO AUTOMÁTICO ---
-    # Rodamos o processamento antes de qualquer carregamento
-    sucesso_etl = processar_e_salvar_desligamentos(p1, p2, ARQ_DESL)
-    if sucesso_etl:
-        st.success("✅ Base de Desligamentos sincronizada.")
+    # O processamento roda em segundo plano; o restante da página usa a base atual
+    modo_etl = "completo" if st.button("🔄 Reconstruir Base de Desligamentos") else "incremental"
+    tarefa_etl = processar_e_salvar_desligamentos(p1, p2, ARQ_DESL, modo=modo_etl)
+    if modo_etl == "completo" and tarefa_etl.modo != "completo":
+        st.info("Já há uma sincronização em andamento; reconstrua a base quando ela terminar.")
+    if tarefa_etl.em_execucao:
+        _fragment(run_every=1)(_painel_sincronizacao)(ARQ_DESL, recarregar=True)
+    else:
+        _painel_sincronizacao(ARQ_DESL)
+    if st.button("🧮 Verificar Índice de Duplicidade") and os.path.exists(ARQ_DESL):
+        verificacao = verificar_indice(ARQ_DESL, reparar=True)
+        if verificacao["ok"]:
+            st.success(f"✅ Índice de duplicidade íntegro: {verificacao['no_indice']} chaves.")
+        else:
+            st.warning(f"⚠️ Índice refeito a partir da base ({verificacao['na_base']} chaves): "
+                       f"{verificacao['faltando']} faltavam e {verificacao['sobrando']} sobravam.")
 
     # --- MOMENTO 2: CARREGAMENTO DOS ARQUIVOS (Upload ou Local) ---
     upload_localizador = st.file_uploader("Upload: Localizador de Vão", type=["xlsx"], key="upl_localizador")
@@ -230,10 +157,19 @@ def carregar_desligamentos_e_aterramento(): #upload_localizador,upload_aterr,upl
         target_desl = upload_desl if upload_desl else (ARQ_DESL if os.path.exists(ARQ_DESL) else None)
         
         if target_desl:
-            xls = pd.ExcelFile(target_desl)
-            df_desl = pd.read_excel(xls, sheet_name=xls.sheet_names[0])
-            if "Dados" in xls.sheet_names:
-                df_desl_dados = pd.read_excel(xls, sheet_name="Dados")
+            abas_desl = sheet_names_cached(target_desl)
+            # A base consolidada já sai normalizada do ETL: Causa/FT/Fase só viram category, sem remapear
+            df_desl, fora_categorias = categorizar(read_sheet_cached(target_desl, abas_desl[0]))
+            if fora_categorias:
+                st.sidebar.warning(f"Valores fora dos dicionários na base: {resumo_nao_mapeados(fora_categorias)}")
+            if "Dados" in abas_desl:
+                df_desl_dados = read_sheet_cached(target_desl, "Dados")
+            # cópia indexada no banco local para os filtros das abas (só reimporta se a base mudou)
+            try:
+                st.session_state['fonte_desligamentos'] = importar_desligamentos(target_desl)
+            except (OSError, ValueError, sqlite3.Error) as e:
+                st.session_state.pop('fonte_desligamentos', None)
+                st.sidebar.warning(f"Banco local indisponível, filtros em memória: {e}")
             #origem = "Sincronizado via D:/" if not upload_desl else "Upload"
         else:
             st.sidebar.warning("Base de Desligamentos não encontrada.")
@@ -266,8 +202,11 @@ def main():
         st.session_state['dados_carregados'] = True
         
         st.write("### Bem-vindo ao Sistema!")
+        with st.expander("⏱️ Tempos de carga das planilhas (frio x cache)"):
+            st.dataframe(resumo_tempos_carga(), use_container_width=True)
         if st.button("🗑️ Limpeza Total do Cache"):
             st.cache_data.clear()
+            limpar_cache_disco()
             st.rerun()
 
     elif escolha == "📊 Análises":
@@ -275,7 +214,7 @@ def main():
         df_para_analise = st.session_state.get("df_analise")
         
         if df_para_analise is not None and not df_para_analise.empty:
-            aba_analises(df_para_analise)
+            aba_analises(df_para_analise, st.session_state.get('fonte_desligamentos'))
         else:
             # Caso o usuário vá direto para Análises sem passar pela Home
             st.info("Sincronizando dados automáticos para análise...")
@@ -0,0 +1,35 @@
+"""
+Compara leitura fria (parse do Excel) x quente (cache em disco) das planilhas do repositório.
+Uso: python -m benchmarks.bench_cache
+"""
+import os
+import tempfile
+import time
+
+import modules.data_loader as data_loader
+
+PLANILHAS = ["Localizador de Vão.xlsx", "Planilha1.xlsx", "Planilha2.xlsx"]
+
+
+def _medir(path, abas):
+    inicio = time.perf_counter()
+    for aba in abas:
+        data_loader.read_sheet_cached(path, aba)
+    return time.perf_counter() - inicio
+
+
+def main():
+    data_loader.CACHE_DIR = tempfile.mkdtemp(prefix="bench_cache_")
+    print(f"{'planilha':<28}{'abas':>6}{'frio (s)':>12}{'quente (s)':>12}{'ganho':>9}")
+    for path in PLANILHAS:
+        if not os.path.exists(path):
+            continue
+        abas = data_loader.sheet_names_cached(path)
+        frio = _medir(path, abas)
+        quente = _medir(path, abas)
+        print(f"{path:<28}{len(abas):>6}{frio:>12.3f}{quente:>12.3f}{frio / quente:>8.1f}x")
+    data_loader.limpar_cache_disco()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Compara as engines de leitura do Excel nas planilhas do repositório:
+listagem de abas, leitura completa, leitura projetada (A:E) e streaming de linhas.
+Uso: python -m benchmarks.bench_excel_backends
+"""
+import os
+import time
+import warnings
+
+import pandas as pd
+
+import modules.data_loader as data_loader
+
+PLANILHAS = ["Localizador de Vão.xlsx", "Planilha1.xlsx", "Planilha2.xlsx"]
+
+
+def _tempo(func, *args, **kwargs):
+    inicio = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - inicio
+
+
+def _ler_projetado(path, abas, engine):
+    excel = pd.ExcelFile(path, engine=engine)
+    for aba in abas:
+        try:
+            excel.parse(aba, usecols="A:E")
+        except ValueError:
+            # aba com menos de 5 colunas
+            excel.parse(aba)
+
+
+def _engines():
+    engines = ["openpyxl"]
+    if data_loader._TEM_CALAMINE:
+        engines.append("calamine")
+    return engines
+
+
+def main():
+    warnings.simplefilter("ignore")
+    for path in PLANILHAS:
+        if not os.path.exists(path):
+            continue
+        abas = data_loader.list_sheet_names(path)
+        print(f"\n{path} ({len(abas)} abas)")
+        print(f"  listar abas  zip: {_tempo(data_loader.list_sheet_names, path):.4f}s"
+              f"  pd.ExcelFile: {_tempo(lambda: pd.ExcelFile(path).sheet_names):.4f}s")
+        for engine in _engines():
+            completo = _tempo(pd.read_excel, path, sheet_name=None, engine=engine)
+            projetado = _tempo(_ler_projetado, path, abas, engine)
+            streaming = _tempo(lambda: [sum(1 for _ in data_loader.iter_sheet_rows(path, aba, columns=[0, 1], engine=engine))
+                                        for aba in abas])
+            print(f"  {engine:<9} completo: {completo:.3f}s  A:E: {projetado:.3f}s  streaming: {streaming:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
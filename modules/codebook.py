@@ -0,0 +1,244 @@
+import hashlib
+import json
+import numpy as np
+import pandas as pd
+
+# --- DICIONÁRIOS (fonte única para o app, ETL e abas de análise) ---
+DE_PARA_CAUSAS = {
+    'Não se Aplica': 'NA', 'Descarga Atmosférica': 'DAT', 'Queimada': 'QMD',
+    'Queimadas': 'QMD', 'Curicaca / Aves': 'CRC', 'Excremento de Pássaro': 'CRC',
+    'Vegetação': 'VGT', 'Outros': 'OTR', 'EXPLOSÃO': 'EXP', 'ACIDENTAL': 'DAC',
+    'PROTEÇÃO, MEDIÇÃO E CONTROLE': 'PMC', 'FALHA EM ACESSÓRIOS E COMPONENTES': 'FAC',
+    'Equipamentos e Acessórios': 'FAC', 'INDETERMINADA': 'IND', 'Causa indeterminada': 'IND',
+    'CONDIÇÕES ANORMAIS DE OPERAÇÃO': 'CAO', 'ERRO DE AJUSTE': 'EDA', 'RAJADA DE VENTO': 'RDV',
+    'Queda de Torre': 'QTR', 'Condições Metereológicas Adversas': 'CMA',
+    'Falhas humanas': 'FHU', 'Colisão Avião Agricola': 'CAA', 'Causa Externa a FT': 'CEFT'
+}
+
+DE_LINHA_SIGLA = {
+    'LT 500kV Serra da Mesa - Samambaia': 'LT SMSB C3',
+    'LT 500kV Serra da Mesa - Gurupi': 'LT SMGU C2',
+    'LT 500kV Gurupi - Miracema': 'LT GUMC C2',
+    'LT 500kV Colinas - Miracema': 'LT COMC C2',
+    'LT 500kV Imperatriz - Colinas': 'LT IZCO C2',
+    'LT 500kV Serra da Mesa - Serra da Mesa 2': 'LT SMSD',
+    'LT 500kV Serra da Mesa 2 - Rio das Éguas': 'LT SDRDE',
+    'LT 500kV Rio das Éguas - Bom Jesus da Lapa': 'LT RDEBJD',
+    'LT 500kV MIRACEMA-GURUPI C2': 'LT GUMC C2',
+    'LT 500kV RIO DAS ÉGUAS-B JESUS LAPA II': 'LT RDEBJD',
+    'LT 500kV LAJEADO-MIRACEMA C1': 'LT LJMC C1',
+    'LT 500kV GURUPI-SERRA DA MESA C2': 'LT SMGU C2',
+    'LT 500kV SERRA DA MESA II-RIO DAS ÉGUAS': 'LT SDRDE',
+    'LT 230 kV BRASNORTE - NOVA MUTUM 1': 'LT BNNM C1',
+    'LT 230 kV BRASNORTE - NOVA MUTUM 2': 'LT BNNM C2',
+    'LT 230kV BARREIRAS/RIO GRANDE II C1': 'LT RGDBRA C1',
+    'LT 230kV BARREIRAS II/RIO GRANDE II C1': 'LT BRABRD C1',
+    'LT 500kV COLINAS-MIRACEMA C2': 'LT COMC C2',
+    'LT 230kV LAJEADO-PALMAS C1': 'LT LJPL C1',
+    'LT 500kV SERRA DA MESA-SAMAMBAIA C3': 'LT SMSB C3',
+    'LT 500kV LAJEADO-MIRACEMA C2': 'LT LJMC C2',
+    'LT 500kV SERRA DA MESA-SERRA DA MESA II': 'LT SMSD',
+    'LT 230kV JAURU-JUBA C2': 'LT JUJB C2',
+    'LT 230kV JAURU-JUBA C1': 'LT JUJB C2',
+    'LT 230kV LAJEADO-PALMAS C2': 'LT LJPL C2',
+    'LT 230 kV BRASNORTE - NOVA MUTUM 1 / LT 230 kV BRASNORTE - NOVA MUTUM 2': 'LT BNNM C1 / LT BNNM C2 '
+}
+
+# As chaves ABG/ABT, BCG/BCT e CAG/CAT apareciam duas vezes no dicionário
+# original; como no literal Python, vale a última (bifásico-terra -> ABN/BCN/CAN).
+DE_FASE = {
+    'A': 'AN', 'AG': 'AN', 'AT': 'AN',
+    'B': 'BN', 'BG': 'BN', 'BT': 'BN',
+    'C': 'CN', 'CG': 'CN', 'CT': 'CN', 'V': 'CN', 'FV': 'CN',
+    'ABN': 'AB', 'ABG': 'ABN', 'ABT': 'ABN',
+    'BCN': 'BC', 'BCG': 'BCN', 'BCT': 'BCN',
+    'CAN': 'CA', 'CAG': 'CAN', 'CAT': 'CAN',
+}
+
+# 'Torre' é texto livre ('T 123', 'Torre 45'...): continua com replace simples
+DE_TORRE = {
+    'T': 'Torre ',
+    'TORRE': 'Torre ',
+}
+
+
+def normalizar_chave(valor):
+    """Chave de busca: sem espaços nas pontas, espaços internos únicos, sem diferença de caixa."""
+    return " ".join(str(valor).split()).casefold()
+
+
+class Codebook:
+    """
+    Dicionário de-para compilado: categorias fixas (valores de destino, na
+    ordem do dicionário) e uma tabela chave normalizada -> código inteiro.
+    Os valores de destino também são chaves (mapeiam para si mesmos), exceto
+    quando o dicionário tem uma chave explícita igual a um destino apontando
+    para outro (ex.: DE_FASE, 'ABG' -> 'ABN' e 'ABN' -> 'AB'). Nesse caso o
+    codebook é "encadeado": aplicar duas vezes muda o resultado, então ele só
+    serve para dados brutos e precisa ser declarado com encadeado=True (senão
+    a construção falha). Dados já normalizados passam por categorizar(), que
+    não remapeia nada.
+    """
+
+    def __init__(self, de_para, nome="", encadeado=False):
+        self.nome = nome
+        self.de_para = dict(de_para)
+        self.categorias = pd.Index(list(dict.fromkeys(self.de_para.values())))
+        codigos = {}
+        for origem, destino in self.de_para.items():
+            chave = normalizar_chave(origem)
+            codigo = self.categorias.get_loc(destino)
+            if codigos.get(chave, codigo) != codigo:
+                raise ValueError(f"Codebook '{nome}': '{origem}' colide com outra chave "
+                                 f"após normalização e aponta para outro destino ({destino}).")
+            codigos[chave] = codigo
+        # destinos que também são chave explícita para outro destino (ex.: 'ABN' -> 'AB')
+        self.encadeados = {destino: self.categorias[codigos[normalizar_chave(destino)]]
+                           for codigo, destino in enumerate(self.categorias)
+                           if codigos.get(normalizar_chave(destino), codigo) != codigo}
+        if self.encadeados and not encadeado:
+            pares = ", ".join(f"'{d}' -> '{o}'" for d, o in self.encadeados.items())
+            raise ValueError(f"Codebook '{nome}': valores de destino que também são chaves para outro "
+                             f"destino ({pares}); aplicar duas vezes mudaria o resultado. "
+                             f"Use encadeado=True se isso for intencional.")
+        # destino -> ele mesmo, sem sobrepor uma chave explícita (ex.: 'ABN' -> 'AB')
+        for codigo, destino in enumerate(self.categorias):
+            codigos.setdefault(normalizar_chave(destino), codigo)
+        self._codigos = codigos
+        # só os destinos: usado por categorizar (valores já normalizados)
+        self._destinos = {normalizar_chave(destino): codigo for codigo, destino in enumerate(self.categorias)}
+
+    @property
+    def idempotente(self):
+        """True se aplicar o codebook num resultado dele não altera nada."""
+        return not self.encadeados
+
+    @property
+    def versao(self):
+        """Hash curto do conteúdo, para invalidar caches e bases derivadas."""
+        texto = json.dumps(self.de_para, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(texto.encode("utf-8")).hexdigest()[:16]
+
+    def codigo(self, valor):
+        """Código do valor no codebook, ou -1 se não mapeado."""
+        return self._codigos.get(normalizar_chave(valor), -1)
+
+    def aplicar(self, serie):
+        """
+        Aplica o codebook numa Series (dados brutos) e retorna (Series
+        category, não mapeados). A busca no dicionário é feita só nos valores
+        distintos (factorize); as linhas recebem o código por um único take.
+        Valores sem correspondência viram categorias extras (texto original) e
+        são contados em {valor: ocorrências}; vazios continuam NaN.
+        """
+        return self._categorias(serie, self._codigos)
+
+    def categorizar(self, serie):
+        """
+        Converte uma Series já normalizada (saída de aplicar, ex.: a base
+        consolidada) em category com as categorias do codebook, sem remapear:
+        só valores iguais a um destino entram nas categorias fixas. Mesmo
+        retorno de aplicar; é idempotente mesmo em codebooks encadeados.
+        """
+        return self._categorias(serie, self._destinos)
+
+    def _categorias(self, serie, codigos_por_chave):
+        codigos_linha, unicos = pd.factorize(serie, use_na_sentinel=True)
+        tabela = np.fromiter((codigos_por_chave.get(normalizar_chave(v), -1) for v in unicos),
+                             dtype=np.int64, count=len(unicos))
+
+        extras = {}
+        for i in np.flatnonzero(tabela < 0):
+            texto = str(unicos[i]).strip()
+            tabela[i] = len(self.categorias) + extras.setdefault(texto, len(extras))
+
+        # sentinela no fim: o código -1 do factorize (vazio) cai nela e continua -1
+        codigos = np.append(tabela, -1).take(codigos_linha)
+        categorias = self.categorias.append(pd.Index(list(extras), dtype=object))
+        resultado = pd.Series(pd.Categorical.from_codes(codigos, categories=categorias),
+                              index=serie.index, name=serie.name)
+
+        nao_mapeados = {}
+        if extras:
+            contagem = np.bincount(codigos[codigos >= len(self.categorias)] - len(self.categorias),
+                                   minlength=len(extras))
+            nao_mapeados = {texto: int(contagem[i]) for texto, i in extras.items()}
+        return resultado, nao_mapeados
+
+
+CODEBOOKS = {
+    'Causa': Codebook(DE_PARA_CAUSAS, 'Causa'),
+    'FT': Codebook(DE_LINHA_SIGLA, 'FT'),
+    # encadeado de propósito: 'ABG' -> 'ABN' e 'ABN' (bruto) -> 'AB', como no dicionário original
+    'Fase': Codebook(DE_FASE, 'Fase', encadeado=True),
+}
+
+# Colunas da base consolidada e o dicionário aplicado em cada uma
+MAPEAMENTOS = {**CODEBOOKS, 'Torre': DE_TORRE}
+
+
+def versao_mapeamentos(mapeamentos=None):
+    """Hash curto de todos os dicionários (codebooks pela própria versão)."""
+    mapeamentos = MAPEAMENTOS if mapeamentos is None else mapeamentos
+    texto = json.dumps(mapeamentos, sort_keys=True, ensure_ascii=False,
+                       default=lambda o: o.versao if isinstance(o, Codebook) else str(o))
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()[:16]
+
+
+def aplicar_mapeamentos(df, mapeamentos=None):
+    """
+    Aplica os dicionários nas colunas presentes de uma cópia de df.
+    Codebooks geram colunas category; dicionários simples usam replace.
+    Retorna (df, {coluna: {valor não mapeado: ocorrências}}).
+    """
+    mapeamentos = MAPEAMENTOS if mapeamentos is None else mapeamentos
+    df = df.copy()
+    relatorio = {}
+    for coluna, de_para in mapeamentos.items():
+        if coluna not in df.columns:
+            continue
+        if isinstance(de_para, Codebook):
+            df[coluna], nao_mapeados = de_para.aplicar(df[coluna])
+            if nao_mapeados:
+                relatorio[coluna] = nao_mapeados
+        else:
+            df[coluna] = df[coluna].replace(de_para)
+    return df, relatorio
+
+
+def categorizar(df, codebooks=None):
+    """
+    Colunas de codebook de uma base já normalizada (ex.: a consolidada ou a
+    cópia no banco local) como category, sem aplicar os dicionários de novo.
+    Retorna (df, {coluna: {valor fora das categorias: ocorrências}}).
+    """
+    codebooks = CODEBOOKS if codebooks is None else codebooks
+    df = df.copy()
+    relatorio = {}
+    for coluna, codebook in codebooks.items():
+        if coluna not in df.columns:
+            continue
+        df[coluna], fora = codebook.categorizar(df[coluna])
+        if fora:
+            relatorio[coluna] = fora
+    return df, relatorio
+
+
+def remover_categorias_vazias(df):
+    """Remove categorias sem ocorrência (após filtros) para value_counts/pivots não listarem zeros."""
+    df = df.copy()
+    for coluna in df.columns:
+        if isinstance(df[coluna].dtype, pd.CategoricalDtype):
+            df[coluna] = df[coluna].cat.remove_unused_categories()
+    return df
+
+
+def resumo_nao_mapeados(relatorio, limite=10):
+    """Texto curto com os valores não mapeados por coluna (os mais frequentes primeiro)."""
+    partes = []
+    for coluna, valores in relatorio.items():
+        ordenados = sorted(valores.items(), key=lambda kv: -kv[1])
+        amostra = ", ".join(f"'{v}' ({n})" for v, n in ordenados[:limite])
+        resto = f" e mais {len(ordenados) - limite}" if len(ordenados) > limite else ""
+        partes.append(f"{coluna}: {amostra}{resto}")
+    return "; ".join(partes)
@@ -0,0 +1,107 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Uma trava sem sinal de vida (mtime) há mais que isso é considerada abandonada
+TRAVA_VALIDADE_S = float(os.environ.get("LOCALIZADOR_TRAVA_VALIDADE_S", "300"))
+_INTERVALO_ESPERA_S = 0.25
+
+
+def caminho_temporario(destino):
+    """Arquivo temporário ao lado do destino, único por processo e thread."""
+    return f"{destino}.{os.getpid()}-{threading.get_ident()}.tmp"
+
+
+def substituir_atomico(tmp, destino, tentativas=20, intervalo=0.1):
+    """
+    os.replace com novas tentativas: no Windows a troca falha enquanto outro
+    processo está com o destino aberto para leitura.
+    """
+    for tentativa in range(tentativas):
+        try:
+            os.replace(tmp, destino)
+            return
+        except PermissionError:
+            if tentativa == tentativas - 1:
+                raise
+            time.sleep(intervalo)
+
+
+def _criar_trava(caminho, token):
+    try:
+        fd = os.open(caminho, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"token": token, "pid": os.getpid(), "host": socket.gethostname(), "desde": time.time()}, f)
+    return True
+
+
+def _token_da_trava(caminho):
+    """Token gravado na trava (None se ela não existe, está vazia ou é de uma versão sem token)."""
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            return json.load(f).get("token")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _trava_abandonada(caminho, validade):
+    try:
+        return time.time() - os.stat(caminho).st_mtime > validade
+    except FileNotFoundError:
+        return False
+
+
+@contextmanager
+def trava_arquivo(path, espera=None, validade=None, ao_esperar=None):
+    """
+    Trava exclusiva entre processos e sessões baseada em '<path>.lock'
+    (criação exclusiva, funciona no Windows e em pastas de rede).
+    espera: segundos até desistir com TimeoutError (None = indefinidamente).
+    ao_esperar(): chamado a cada volta enquanto outra sessão segura a trava.
+    Entrega uma função renovar() que atualiza o sinal de vida da trava;
+    travas sem renovação há mais de `validade` segundos são descartadas.
+    """
+    caminho = path + ".lock"
+    validade = TRAVA_VALIDADE_S if validade is None else validade
+    token = uuid.uuid4().hex
+    inicio = time.monotonic()
+    while not _criar_trava(caminho, token):
+        dono = _token_da_trava(caminho)
+        if _trava_abandonada(caminho, validade):
+            # outra sessão pode ter descartado a mesma trava e criado a sua nesse meio
+            # tempo: só remove se o token ainda for o da trava vista como abandonada
+            if _token_da_trava(caminho) == dono and _trava_abandonada(caminho, validade):
+                try:
+                    os.remove(caminho)
+                except OSError:
+                    pass
+            continue
+        if espera is not None and time.monotonic() - inicio > espera:
+            raise TimeoutError(f"'{caminho}' continua travado após {espera:.0f}s")
+        if ao_esperar is not None:
+            ao_esperar()
+        time.sleep(_INTERVALO_ESPERA_S)
+
+    def renovar():
+        if _token_da_trava(caminho) != token:
+            return
+        try:
+            os.utime(caminho)
+        except OSError:
+            pass
+
+    try:
+        yield renovar
+    finally:
+        # se a trava expirou e outra sessão assumiu, a trava agora é dela
+        if _token_da_trava(caminho) == token:
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
@@ -1,14 +1,561 @@
-# modules/data_loader.py
+import atexit
+import hashlib
+import json
+import multiprocessing
+import os
+import posixpath
+import threading
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import pandas as pd
 import streamlit as st
 from io import BytesIO
 
+from modules.concorrencia import caminho_temporario, substituir_atomico
 
-@st.cache_data
-def load_sheet_from_path_or_buffer(path_or_buffer, sheet_name):
+# Diretório do cache em disco: cada aba convertida vira um arquivo colunar
+CACHE_DIR = os.environ.get("LOCALIZADOR_CACHE_DIR", ".cache_planilhas")
+# Limite total do cache; as entradas usadas há mais tempo são removidas primeiro (LRU)
+CACHE_MAX_BYTES = int(os.environ.get("LOCALIZADOR_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+# Processos usados na leitura paralela de abas (limitado também pelo nº de abas pendentes)
+PARALLEL_MAX_WORKERS = int(os.environ.get("LOCALIZADOR_MAX_WORKERS", min(4, os.cpu_count() or 1)))
+
+try:
+    import pyarrow  # noqa: F401  (Parquet é opcional, pickle é o fallback)
+    _TEM_PARQUET = True
+except ImportError:
+    _TEM_PARQUET = False
+
+try:
+    import python_calamine  # noqa: F401  (engine rápida opcional, pandas >= 2.2)
+    _TEM_CALAMINE = True
+except ImportError:
+    _TEM_CALAMINE = False
+
+# Histórico das leituras desta execução: frio = parse do Excel, quente = cache em disco
+# (só as últimas TEMPOS_CARGA_MAX leituras, para não crescer durante a vida do servidor)
+TEMPOS_CARGA_MAX = 500
+_TEMPOS_CARGA = deque(maxlen=TEMPOS_CARGA_MAX)
+
+
+def read_all_bytes(buffer):
+    """Lê todo o conteúdo de um UploadedFile / file-like e volta o cursor ao início."""
+    try:
+        buffer.seek(0)
+    except Exception:
+        pass
+    data = buffer.read()
+    try:
+        buffer.seek(0)
+    except Exception:
+        pass
+    return data
+
+
+def _como_fonte_excel(path_or_buffer):
+    """Converte a origem para algo aceito por pd.ExcelFile (caminho ou BytesIO)."""
+    if isinstance(path_or_buffer, str):
+        return path_or_buffer
+    if isinstance(path_or_buffer, (bytes, bytearray)):
+        return BytesIO(path_or_buffer)
+    return BytesIO(read_all_bytes(path_or_buffer))
+
+
+def excel_engine(engine=None):
+    """
+    Engine do pandas para ler Excel: a informada, a da variável
+    LOCALIZADOR_EXCEL_ENGINE, calamine quando instalado, senão openpyxl.
+    """
+    engine = engine or os.environ.get("LOCALIZADOR_EXCEL_ENGINE")
+    if engine:
+        return engine
+    return "calamine" if _TEM_CALAMINE else "openpyxl"
+
+
+def list_sheet_names(path_or_buffer):
+    """Nomes das abas lidos direto de xl/workbook.xml, sem abrir nenhuma planilha."""
+    with zipfile.ZipFile(_como_fonte_excel(path_or_buffer)) as zf:
+        with zf.open("xl/workbook.xml") as f:
+            return [el.get("name") for _, el in ET.iterparse(f) if el.tag.rsplit("}", 1)[-1] == "sheet"]
+
+
+def _indices_colunas(cabecalho, columns):
+    if columns is None:
+        return list(range(len(cabecalho)))
+    nomes = [str(c).strip().lower() if c is not None else "" for c in cabecalho]
+    indices = []
+    for c in columns:
+        if isinstance(c, int):
+            indices.append(c)
+        elif str(c).strip().lower() in nomes:
+            indices.append(nomes.index(str(c).strip().lower()))
+        else:
+            raise ValueError(f"Coluna '{c}' não encontrada no cabeçalho.")
+    return indices
+
+
+def iter_sheet_rows(path_or_buffer, sheet_name, columns=None, engine=None):
+    """
+    Percorre as linhas de uma aba em streaming (modo read-only), sem montar DataFrame.
+    A primeira tupla é o cabeçalho. columns (nomes do cabeçalho ou índices 0-based)
+    projeta apenas as colunas pedidas.
+    """
+    engine = excel_engine(engine)
+    fonte = _como_fonte_excel(path_or_buffer)
+    if engine == "calamine":
+        from python_calamine import CalamineWorkbook
+        wb = CalamineWorkbook.from_path(fonte) if isinstance(fonte, str) else CalamineWorkbook.from_filelike(fonte)
+        linhas = iter(wb.get_sheet_by_name(sheet_name).iter_rows())
+        fechar = None
+    else:
+        import openpyxl
+        wb = openpyxl.load_workbook(fonte, read_only=True, data_only=True)
+        linhas = wb[sheet_name].iter_rows(values_only=True)
+        fechar = wb.close
+
+    try:
+        cabecalho = next(linhas, None)
+        if cabecalho is None:
+            return
+        indices = _indices_colunas(cabecalho, columns)
+        yield tuple(cabecalho[i] for i in indices)
+        for linha in linhas:
+            yield tuple(linha[i] if i < len(linha) else None for i in indices)
+    finally:
+        if fechar is not None:
+            fechar()
+
+
+def fingerprint_source(path_or_buffer):
+    """
+    Identifica o conteúdo de uma planilha.
+    Caminho local: caminho absoluto + mtime + tamanho (sem ler o arquivo).
+    Upload / bytes: SHA-256 do conteúdo.
+    """
     if isinstance(path_or_buffer, str):
-        return pd.read_excel(path_or_buffer, sheet_name=sheet_name)
+        info = os.stat(path_or_buffer)
+        chave = f"{os.path.abspath(path_or_buffer)}|{info.st_mtime_ns}|{info.st_size}".encode("utf-8")
+    elif isinstance(path_or_buffer, (bytes, bytearray)):
+        chave = bytes(path_or_buffer)
     else:
-        path_or_buffer.seek(0)
-        data = path_or_buffer.read()
-        return pd.read_excel(BytesIO(data), sheet_name=sheet_name)
+        chave = read_all_bytes(path_or_buffer)
+    return hashlib.sha256(chave).hexdigest()[:32]
+
+
+def _caminho_cache(fingerprint, sheet_name, ext):
+    nome_aba = hashlib.sha1(str(sheet_name).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(CACHE_DIR, f"{fingerprint}_{nome_aba}{ext}")
+
+
+def _ler_do_cache(fingerprint, sheet_name):
+    for ext in (".parquet", ".pkl"):
+        path = _caminho_cache(fingerprint, sheet_name, ext)
+        if not os.path.exists(path):
+            continue
+        try:
+            df = pd.read_parquet(path) if ext == ".parquet" else pd.read_pickle(path)
+        except Exception:
+            # entrada corrompida (ex.: gravação interrompida) -> descarta e relê do Excel
+            _remover_silencioso(path)
+            continue
+        # marca como usada agora para a política LRU
+        os.utime(path, None)
+        return df
+    return None
+
+
+def _gravar_no_cache(df, fingerprint, sheet_name):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # nomes de coluna não-texto (ex.: 42.03) não voltam iguais do Parquet -> pickle
+    if _TEM_PARQUET and all(isinstance(c, str) for c in df.columns):
+        path = _caminho_cache(fingerprint, sheet_name, ".parquet")
+        tmp = caminho_temporario(path)
+        try:
+            df.to_parquet(tmp)
+            substituir_atomico(tmp, path)
+            _aplicar_limite_lru()
+            return
+        except Exception:
+            # colunas com tipos mistos não cabem em Parquet -> pickle
+            _remover_silencioso(tmp)
+    path = _caminho_cache(fingerprint, sheet_name, ".pkl")
+    tmp = caminho_temporario(path)
+    df.to_pickle(tmp)
+    substituir_atomico(tmp, path)
+    _aplicar_limite_lru()
+
+
+def _remover_silencioso(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _aplicar_limite_lru(limite_bytes=None):
+    """Remove as entradas menos usadas recentemente até o cache caber no limite."""
+    limite_bytes = CACHE_MAX_BYTES if limite_bytes is None else limite_bytes
+    if not os.path.isdir(CACHE_DIR):
+        return
+    entradas = []
+    for nome in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, nome)
+        if nome.endswith(".tmp") or not os.path.isfile(path):
+            continue
+        info = os.stat(path)
+        entradas.append((info.st_mtime, info.st_size, path))
+    total = sum(e[1] for e in entradas)
+    for _, tamanho, path in sorted(entradas):
+        if total <= limite_bytes:
+            break
+        _remover_silencioso(path)
+        total -= tamanho
+
+
+def ler_json_cache(fingerprint, chave):
+    """Objeto gravado por gravar_json_cache para (fingerprint, chave), ou None se não houver."""
+    path = _caminho_cache(fingerprint, chave, ".json")
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            obj = json.load(f)
+    except (OSError, ValueError):
+        _remover_silencioso(path)
+        return None
+    os.utime(path, None)
+    return obj
+
+
+def gravar_json_cache(obj, fingerprint, chave):
+    """Grava um objeto JSON no cache em disco (mesmo diretório e limite LRU das abas)."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _caminho_cache(fingerprint, chave, ".json")
+    tmp = caminho_temporario(path)
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, separators=(",", ":"))
+    substituir_atomico(tmp, path)
+    _aplicar_limite_lru()
+
+
+def limpar_cache_disco():
+    """Apaga todo o cache em disco das planilhas."""
+    if os.path.isdir(CACHE_DIR):
+        for nome in os.listdir(CACHE_DIR):
+            _remover_silencioso(os.path.join(CACHE_DIR, nome))
+    _TEMPOS_CARGA.clear()
+
+
+def sheet_names_cached(path_or_buffer):
+    """Lista as abas da planilha; após a primeira leitura vem do cache em disco."""
+    fingerprint = fingerprint_source(path_or_buffer)
+    path = os.path.join(CACHE_DIR, f"{fingerprint}_abas.json")
+    if os.path.exists(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                abas = json.load(f)
+            os.utime(path, None)
+            return abas
+        except (OSError, ValueError):
+            _remover_silencioso(path)
+
+    abas = list_sheet_names(path_or_buffer)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = caminho_temporario(path)
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(abas, f, ensure_ascii=False)
+    substituir_atomico(tmp, path)
+    return abas
+
+
+def _chave_aba(sheet_name, usecols):
+    return sheet_name if usecols is None else f"{sheet_name}|{usecols!r}"
+
+
+def read_sheet_cached(path_or_buffer, sheet_name, usecols=None):
+    """
+    Lê uma aba do Excel passando pelo cache colunar em disco.
+    A chave é o fingerprint do conteúdo, então reruns e sessões diferentes
+    reaproveitam o parse; o Excel só é lido quando o arquivo muda.
+    usecols segue pd.read_excel e entra na chave do cache.
+    """
+    if isinstance(sheet_name, int):
+        sheet_name = sheet_names_cached(path_or_buffer)[sheet_name]
+
+    inicio = time.perf_counter()
+    fingerprint = fingerprint_source(path_or_buffer)
+    chave = _chave_aba(sheet_name, usecols)
+    df = _ler_do_cache(fingerprint, chave)
+    origem = "quente"
+    if df is None:
+        df = pd.read_excel(_como_fonte_excel(path_or_buffer), sheet_name=sheet_name,
+                           usecols=usecols, engine=excel_engine())
+        _gravar_no_cache(df, fingerprint, chave)
+        origem = "frio"
+
+    _registrar_tempo(path_or_buffer, sheet_name, origem, time.perf_counter() - inicio)
+    return df
+
+
+def _registrar_tempo(path_or_buffer, sheet_name, origem, segundos):
+    _TEMPOS_CARGA.append({
+        "fonte": path_or_buffer if isinstance(path_or_buffer, str) else getattr(path_or_buffer, "name", "upload"),
+        "aba": sheet_name,
+        "origem": origem,
+        "segundos": segundos,
+    })
+
+
+class Workbook:
+    """
+    Planilha aberta uma única vez.
+    O zip é inflado e sharedStrings/estilos são lidos só na primeira aba que
+    não estiver no cache em disco; cada aba é materializada sob demanda e
+    memorizada no objeto. Os DataFrames devolvidos são cópias, pois a mesma
+    instância é compartilhada entre sessões (ver open_workbook).
+    """
+
+    def __init__(self, path_or_buffer):
+        if not isinstance(path_or_buffer, (str, bytes, bytearray)):
+            path_or_buffer = read_all_bytes(path_or_buffer)
+        self._fonte = path_or_buffer
+        self.fingerprint = fingerprint_source(path_or_buffer)
+        self.sheet_names = sheet_names_cached(path_or_buffer)
+        self._excel = None
+        self._abas = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, sheet_name):
+        return sheet_name in self.sheet_names
+
+    @property
+    def source(self):
+        """Caminho ou bytes da planilha (aceito por read_sheet_cached)."""
+        return self._fonte
+
+    def _arquivo(self):
+        if self._excel is None:
+            self._excel = pd.ExcelFile(_como_fonte_excel(self._fonte), engine=excel_engine())
+        return self._excel
+
+    def sheet(self, sheet_name, usecols=None):
+        """
+        Retorna (cópia de) uma aba, lendo-a do Excel no máximo uma vez.
+        usecols (ex.: "A:E") projeta só as colunas necessárias; se a aba for
+        mais estreita que a projeção, ela é lida inteira.
+        """
+        chave = _chave_aba(sheet_name, usecols)
+        with self._lock:
+            if chave not in self._abas:
+                inicio = time.perf_counter()
+                df = _ler_do_cache(self.fingerprint, chave)
+                origem = "quente"
+                if df is None:
+                    try:
+                        df = self._arquivo().parse(sheet_name, usecols=usecols)
+                    except ValueError:
+                        if usecols is None:
+                            raise
+                        df = self._arquivo().parse(sheet_name)
+                    _gravar_no_cache(df, self.fingerprint, chave)
+                    origem = "frio"
+                self._abas[chave] = df
+                _registrar_tempo(self._fonte, sheet_name, origem, time.perf_counter() - inicio)
+            return self._abas[chave].copy()
+
+    def preload(self, sheet_names=None, usecols=None, max_workers=None):
+        """Materializa de uma vez as abas informadas (todas por padrão) usando o pool de processos."""
+        if sheet_names is None:
+            sheet_names = self.sheet_names
+        with self._lock:
+            faltando = [aba for aba in sheet_names if _chave_aba(aba, usecols) not in self._abas]
+            if faltando:
+                lidas = read_all_sheets_parallel(self._fonte, faltando, usecols=usecols, max_workers=max_workers)
+                for aba, df in lidas.items():
+                    self._abas[_chave_aba(aba, usecols)] = df
+
+    def iter_rows(self, sheet_name, columns=None):
+        """Linhas de uma aba em streaming (ver iter_sheet_rows)."""
+        return iter_sheet_rows(self._fonte, sheet_name, columns=columns)
+
+    def close(self):
+        if self._excel is not None:
+            self._excel.close()
+            self._excel = None
+
+
+@st.cache_resource(max_entries=8)
+def _workbook_compartilhado(fingerprint, _path_or_buffer):
+    return Workbook(_path_or_buffer)
+
+
+def open_workbook(path_or_buffer):
+    """
+    Abre (ou reaproveita) o Workbook do conteúdo informado.
+    A instância é compartilhada por todas as sessões com o mesmo fingerprint.
+    """
+    if not isinstance(path_or_buffer, (str, bytes, bytearray)):
+        path_or_buffer = read_all_bytes(path_or_buffer)
+    return _workbook_compartilhado(fingerprint_source(path_or_buffer), path_or_buffer)
+
+
+def sheet_parts(path_or_buffer):
+    """Mapeia nome da aba -> parte XML dentro do zip (ex.: 'xl/worksheets/sheet1.xml')."""
+    with zipfile.ZipFile(_como_fonte_excel(path_or_buffer)) as zf:
+        return _sheet_parts_zip(zf)
+
+
+def _sheet_parts_zip(zf):
+    alvos = {}
+    with zf.open("xl/_rels/workbook.xml.rels") as f:
+        for _, el in ET.iterparse(f):
+            if el.tag.rsplit("}", 1)[-1] == "Relationship":
+                alvos[el.get("Id")] = el.get("Target")
+    partes = {}
+    with zf.open("xl/workbook.xml") as f:
+        for _, el in ET.iterparse(f):
+            if el.tag.rsplit("}", 1)[-1] != "sheet":
+                continue
+            rid = next((v for k, v in el.attrib.items() if k.endswith("}id")), None)
+            alvo = alvos.get(rid, "")
+            partes[el.get("name")] = alvo.lstrip("/") if alvo.startswith("/") else posixpath.normpath(posixpath.join("xl", alvo))
+    return partes
+
+
+def _agrupar_abas(path_or_buffer, sheet_names, n_grupos):
+    """Distribui as abas entre os processos pelo tamanho do XML (maior primeiro, grupo mais leve)."""
+    with zipfile.ZipFile(_como_fonte_excel(path_or_buffer)) as zf:
+        partes = _sheet_parts_zip(zf)
+        tamanhos = {aba: zf.getinfo(partes[aba]).file_size if partes.get(aba) in zf.namelist() else 0 for aba in sheet_names}
+    grupos = [[] for _ in range(n_grupos)]
+    cargas = [0] * n_grupos
+    for aba in sorted(sheet_names, key=lambda a: -tamanhos[a]):
+        i = cargas.index(min(cargas))
+        grupos[i].append(aba)
+        cargas[i] += tamanhos[aba]
+    return [g for g in grupos if g]
+
+
+def _parse_sheets_worker(fonte, sheet_names, usecols, engine):
+    """Executado em outro processo: abre a planilha uma vez e lê o grupo de abas recebido."""
+    excel = pd.ExcelFile(_como_fonte_excel(fonte), engine=engine)
+    lidas = {}
+    for aba in sheet_names:
+        try:
+            lidas[aba] = excel.parse(aba, usecols=usecols)
+        except ValueError:
+            if usecols is None:
+                raise
+            # aba mais estreita que a projeção -> lê inteira (mesmo critério do Workbook)
+            lidas[aba] = excel.parse(aba)
+    excel.close()
+    return lidas
+
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def _process_pool():
+    """
+    Pool de processos do servidor, com PARALLEL_MAX_WORKERS processos, criado
+    uma vez e reaproveitado entre leituras (e sessões). Cada leitura só
+    divide as suas abas em grupos; o pool nunca é recriado com outro tamanho,
+    o que derrubaria os envios de outra sessão em andamento.
+    """
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            # spawn: mesmo comportamento no Windows e sem fork do servidor multi-thread do Streamlit
+            _POOL = ProcessPoolExecutor(max_workers=PARALLEL_MAX_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _POOL
+
+
+def _descartar_pool(pool=None):
+    """Encerra o pool (ou só se ainda for `pool`, o que falhou: outra sessão pode já ter criado um novo)."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None and (pool is None or _POOL is pool):
+            _POOL.shutdown(wait=False, cancel_futures=True)
+            _POOL = None
+
+
+atexit.register(_descartar_pool)
+
+
+def read_all_sheets_parallel(path_or_buffer, sheet_names=None, usecols=None, max_workers=None):
+    """
+    Lê várias abas de uma planilha em paralelo num pool de processos.
+    As abas pendentes são divididas em até max_workers grupos de tamanho parecido;
+    cada processo abre a planilha uma vez e lê o seu grupo. Abas já presentes no
+    cache em disco não vão para o pool. O dict devolvido segue sempre a ordem de
+    sheet_names, qualquer que seja a ordem de término. Com um único worker
+    (ex.: máquina de 1 núcleo) a leitura é feita no próprio processo.
+    """
+    if not isinstance(path_or_buffer, (str, bytes, bytearray)):
+        path_or_buffer = read_all_bytes(path_or_buffer)
+    if sheet_names is None:
+        sheet_names = sheet_names_cached(path_or_buffer)
+    fingerprint = fingerprint_source(path_or_buffer)
+    engine = excel_engine()
+
+    lidas = {}
+    pendentes = []
+    for aba in sheet_names:
+        df = _ler_do_cache(fingerprint, _chave_aba(aba, usecols))
+        if df is None:
+            pendentes.append(aba)
+        else:
+            lidas[aba] = df
+
+    inicio = time.perf_counter()
+    workers = min(len(pendentes), max_workers or PARALLEL_MAX_WORKERS, PARALLEL_MAX_WORKERS)
+    novas = None
+    if workers > 1:
+        grupos = _agrupar_abas(path_or_buffer, pendentes, workers)
+        pool = None
+        try:
+            pool = _process_pool()
+            futuros = [pool.submit(_parse_sheets_worker, path_or_buffer, grupo, usecols, engine) for grupo in grupos]
+            novas = {}
+            for futuro in futuros:
+                novas.update(futuro.result())
+        except (BrokenProcessPool, OSError, RuntimeError):
+            # pool indisponível (ex.: sem permissão para criar processos, ou encerrado
+            # por outra sessão -> "cannot schedule new futures after shutdown") -> leitura serial
+            if pool is not None:
+                _descartar_pool(pool)
+            novas = None
+    if novas is None and pendentes:
+        novas = _parse_sheets_worker(path_or_buffer, pendentes, usecols, engine)
+
+    if pendentes:
+        segundos = (time.perf_counter() - inicio) / len(pendentes)
+        for aba in pendentes:
+            lidas[aba] = novas[aba]
+            _gravar_no_cache(novas[aba], fingerprint, _chave_aba(aba, usecols))
+            _registrar_tempo(path_or_buffer, aba, "frio", segundos)
+
+    return {aba: lidas[aba] for aba in sheet_names}
+
+
+def resumo_tempos_carga():
+    """Tempos de leitura frio x quente por planilha/aba (para exibir na Home)."""
+    if not _TEMPOS_CARGA:
+        return pd.DataFrame(columns=["fonte", "aba", "frio (s)", "quente (s)"])
+    df = pd.DataFrame(list(_TEMPOS_CARGA))
+    resumo = df.pivot_table(index=["fonte", "aba"], columns="origem", values="segundos", aggfunc="mean")
+    resumo = resumo.reindex(columns=["frio", "quente"])
+    resumo.columns = ["frio (s)", "quente (s)"]
+    return resumo.reset_index()
+
+
+@st.cache_data
+def load_sheet_from_path_or_buffer(path_or_buffer, sheet_name):
+    return read_sheet_cached(path_or_buffer, sheet_name)
@@ -0,0 +1,405 @@
+import hashlib
+import json
+import os
+import time
+import zipfile
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from modules.data_loader import read_sheet_cached, sheet_names_cached, sheet_parts
+from modules.xlsx_passthrough import anexar_linhas_xlsx, substituir_aba_xlsx
+from modules.concorrencia import caminho_temporario, substituir_atomico, trava_arquivo
+from modules.codebook import MAPEAMENTOS, aplicar_mapeamentos, versao_mapeamentos
+
+# Chaves que identificam uma ocorrência na base consolidada
+CHAVES = ['Concessão', 'Data', 'FT', 'Hora']
+
+
+def caminho_estado(saida_path):
+    """Arquivo com a marca d'água e o resumo do índice da última sincronização."""
+    return saida_path + ".estado.json"
+
+
+def caminho_indice(saida_path):
+    """Índice de duplicidade: hashes uint64 ordenados das chaves já consolidadas."""
+    return saida_path + ".indice.npy"
+
+
+def caminho_manifesto(saida_path):
+    """Arquivo com tamanho, mtime e hash das entradas e da saída da última sincronização."""
+    return saida_path + ".manifesto.json"
+
+
+def _assinatura(path, anterior=None):
+    """
+    Tamanho, mtime e SHA-256 de um arquivo. Se tamanho e mtime batem com a
+    assinatura anterior, o hash é reaproveitado sem ler o arquivo.
+    """
+    info = os.stat(path)
+    if anterior and anterior.get("tamanho") == info.st_size and anterior.get("mtime_ns") == info.st_mtime_ns:
+        return dict(anterior)
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            sha.update(bloco)
+    return {"tamanho": info.st_size, "mtime_ns": info.st_mtime_ns, "sha256": sha.hexdigest()}
+
+
+def _ler_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _gravar_json(path, dados):
+    tmp = caminho_temporario(path)
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(dados, f, ensure_ascii=False)
+    substituir_atomico(tmp, path)
+
+
+def _manifesto(p1_path, p2_path, saida_path, mapeamentos, anterior=None):
+    anterior = anterior or {}
+    arquivos = {"p1": p1_path, "p2": p2_path, "saida": saida_path}
+    return {
+        "mapeamentos": versao_mapeamentos(mapeamentos),
+        **{nome: _assinatura(path, anterior.get(nome)) for nome, path in arquivos.items()},
+    }
+
+
+def _iguais(a, b):
+    """Compara manifestos pelo conteúdo (hash), ignorando mtime."""
+    return a["mapeamentos"] == b.get("mapeamentos") and all(
+        a[nome]["sha256"] == (b.get(nome) or {}).get("sha256") for nome in ("p1", "p2", "saida"))
+
+
+def _aba_alvo(abas_p2):
+    # Se houver uma aba chamada 'Ocorrencia', usamos ela, senão usamos a primeira
+    return 'Ocorrencia' if 'Ocorrencia' in abas_p2 else abas_p2[0]
+
+
+def _normalizar_hora(serie):
+    """
+    Converte 'Hora' (time, datetime ou texto como '14:34 / 14:41') em datetime64
+    com data fixa 1900-01-01; valores sem horário reconhecível viram NaT.
+    """
+    texto = serie.map(lambda v: v.strftime("%H:%M:%S") if hasattr(v, "strftime") and not pd.isna(v) else str(v))
+    hora = texto.str.extract(r"(\d{1,2}:\d{2}(?::\d{2})?)")[0]
+    hora = hora.str.replace(r"^(\d{1,2}:\d{2})$", r"\1:00", regex=True)
+    return pd.to_datetime(hora, format="%H:%M:%S", errors="coerce")
+
+
+def _preparar(df_sinc, mapeamentos):
+    """
+    Limpeza, formatação e dicionários (Data/Ano/Hora continuam como datetime).
+    Retorna (df, valores não mapeados por coluna).
+    """
+    df_sinc = df_sinc.copy()
+    if 'Data' in df_sinc.columns:
+        df_sinc['Data'] = pd.to_datetime(df_sinc['Data'], errors='coerce')
+        df_sinc['Ano'] = df_sinc['Data'].dt.year.fillna(0).astype(int)
+        df_sinc = df_sinc[df_sinc['Ano'] > 0]
+
+    if 'Hora' in df_sinc.columns:
+        df_sinc['Hora'] = _normalizar_hora(df_sinc['Hora'])
+
+    # Aplicar Dicionários (Causa/FT/Fase viram category)
+    return aplicar_mapeamentos(df_sinc, mapeamentos)
+
+
+def _nao_mapeados_nas_linhas(nao_mapeados, df):
+    """Relatório de não mapeados de _preparar recontado só nas linhas de df (sem reaplicar os dicionários)."""
+    relatorio = {}
+    for coluna, valores in nao_mapeados.items():
+        contagem = df[coluna].value_counts()
+        presentes = {valor: int(contagem.get(valor, 0)) for valor in valores if contagem.get(valor, 0)}
+        if presentes:
+            relatorio[coluna] = presentes
+    return relatorio
+
+
+def _finalizar(df_sinc):
+    # Formatação Final
+    df_sinc = df_sinc.copy()
+    if 'Data' in df_sinc.columns: df_sinc['Data'] = df_sinc['Data'].dt.date
+    if 'Hora' in df_sinc.columns: df_sinc['Hora'] = df_sinc['Hora'].dt.time
+    return df_sinc
+
+
+def _chaves_presentes(df):
+    return [c for c in CHAVES if c in df.columns]
+
+
+def hash_linhas(df):
+    """
+    Hash 64 bits das chaves normalizadas de cada linha (texto sem espaços nas
+    pontas, Data 'AAAA-MM-DD', Hora 'HH:MM:SS'), estável entre a entrada e a
+    base consolidada relida do Excel.
+    """
+    chaves = pd.DataFrame(index=df.index)
+    for c in _chaves_presentes(df):
+        if c == 'Data':
+            chaves[c] = pd.to_datetime(df[c], errors='coerce').dt.strftime('%Y-%m-%d')
+        elif c == 'Hora':
+            chaves[c] = _normalizar_hora(df[c]).dt.strftime('%H:%M:%S')
+        else:
+            chaves[c] = df[c].astype(str).str.strip()
+    return pd.util.hash_pandas_object(chaves.fillna(""), index=False).to_numpy(dtype=np.uint64)
+
+
+def ler_indice(saida_path):
+    """Índice gravado ou None se não existir/estiver corrompido (8 bytes por linha da base)."""
+    try:
+        return np.load(caminho_indice(saida_path))
+    except (OSError, ValueError, EOFError):
+        return None
+
+
+def gravar_indice(saida_path, hashes):
+    """Grava os hashes como array uint64 ordenado e sem repetição (troca atômica)."""
+    indice = np.unique(np.asarray(hashes, dtype=np.uint64))
+    tmp = caminho_temporario(caminho_indice(saida_path))
+    with open(tmp, "wb") as f:
+        np.save(f, indice)
+    substituir_atomico(tmp, caminho_indice(saida_path))
+    return indice
+
+
+def contidos_no_indice(indice, hashes):
+    """Máscara de pertinência por busca binária: O(lote · log n), sem carregar o histórico."""
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    if indice is None or len(indice) == 0:
+        return np.zeros(len(hashes), dtype=bool)
+    pos = np.searchsorted(indice, hashes)
+    return indice[np.minimum(pos, len(indice) - 1)] == hashes
+
+
+def _hashes_da_base(saida_path, aba_alvo):
+    return hash_linhas(read_sheet_cached(saida_path, aba_alvo))
+
+
+def verificar_indice(saida_path, reparar=False):
+    """
+    Confere o índice contra a aba alvo da base consolidada.
+    Retorna contagens de chaves na base, no índice, faltando no índice e
+    sobrando nele; com reparar=True regrava o índice a partir da base.
+    """
+    estado = ler_estado(saida_path) or {}
+    abas = sheet_names_cached(saida_path)
+    aba_alvo = estado.get("aba_alvo") if estado.get("aba_alvo") in abas else _aba_alvo(abas)
+    na_base = np.unique(_hashes_da_base(saida_path, aba_alvo))
+    indice = ler_indice(saida_path)
+    no_indice = np.asarray(indice if indice is not None else [], dtype=np.uint64)
+    resultado = {
+        "na_base": len(na_base),
+        "no_indice": len(no_indice),
+        "faltando": int((~contidos_no_indice(no_indice, na_base)).sum()),
+        "sobrando": int((~contidos_no_indice(na_base, no_indice)).sum()),
+    }
+    resultado["ok"] = indice is not None and resultado["faltando"] == 0 and resultado["sobrando"] == 0
+    if reparar and not resultado["ok"]:
+        with trava_arquivo(saida_path):
+            gravar_indice(saida_path, na_base)
+            if estado:
+                _gravar_estado(saida_path, dict(estado, indice_linhas=len(na_base)))
+    return resultado
+
+
+def _indice_atual(saida_path, estado):
+    """Índice em disco; migra a lista 'hashes' de estados antigos ou refaz a partir da base."""
+    indice = ler_indice(saida_path)
+    if indice is not None and len(indice) == estado.get("indice_linhas", len(indice)):
+        return indice
+    if "hashes" in estado:
+        return gravar_indice(saida_path, estado["hashes"])
+    return gravar_indice(saida_path, _hashes_da_base(saida_path, estado["aba_alvo"]))
+
+
+def _instante(df):
+    """Data + Hora de cada linha (Hora ausente conta como 00:00)."""
+    instante = pd.to_datetime(df['Data'], errors='coerce').dt.normalize()
+    if 'Hora' in df.columns:
+        hora = _normalizar_hora(df['Hora'])
+        instante = instante + (hora - pd.Timestamp("1900-01-01")).fillna(pd.Timedelta(0))
+    return instante
+
+
+def _crc_abas(p2_path):
+    """CRC de cada aba lido do diretório do zip (sem descompactar nada)."""
+    partes = sheet_parts(p2_path)
+    with zipfile.ZipFile(p2_path) as zf:
+        return {aba: zf.getinfo(parte).CRC for aba, parte in partes.items() if parte in zf.namelist()}
+
+
+def ler_estado(saida_path):
+    return _ler_json(caminho_estado(saida_path))
+
+
+def _gravar_estado(saida_path, estado):
+    _gravar_json(caminho_estado(saida_path), estado)
+
+
+def _novo_estado(df_consolidado, aba_alvo, crc_abas, mapeamentos, indice):
+    instantes = _instante(df_consolidado) if 'Data' in df_consolidado.columns else pd.Series(dtype="datetime64[ns]")
+    watermark = instantes.max()
+    return {
+        "aba_alvo": aba_alvo,
+        "watermark": None if pd.isna(watermark) else watermark.isoformat(),
+        "indice_linhas": len(indice),
+        "crc_abas": crc_abas,
+        "mapeamentos": versao_mapeamentos(mapeamentos),
+        "atualizado_em": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def _avisar(progresso, fracao, mensagem):
+    """Repassa o andamento (0 a 1) para quem acompanha a sincronização, se houver."""
+    if progresso is not None:
+        progresso(fracao, mensagem)
+
+
+def _ler_entradas(p1_path, p2_path, aba_alvo):
+    df1 = read_sheet_cached(p1_path, 0)
+    df_p2 = read_sheet_cached(p2_path, aba_alvo)
+    return pd.concat([df1, df_p2], ignore_index=True, sort=False)
+
+
+def reconstruir_base(p1_path, p2_path, saida_path, mapeamentos, progresso=None):
+    """Reprocessa todo o histórico e regrava a base consolidada (todas as abas da Planilha 2)."""
+    inicio = time.perf_counter()
+    aba_alvo = _aba_alvo(sheet_names_cached(p2_path))
+
+    # --- LÓGICA DE SINCRONIZAÇÃO (Apenas para a aba alvo) ---
+    _avisar(progresso, 0.1, "Lendo Planilha 1 e Planilha 2")
+    df_sinc = _ler_entradas(p1_path, p2_path, aba_alvo)
+    _avisar(progresso, 0.4, "Aplicando dicionários e removendo duplicadas")
+    df_sinc, nao_mapeados = _preparar(df_sinc, mapeamentos)
+    # Sincronização por chaves únicas (já com os dicionários aplicados, mesmo hash do modo incremental)
+    df_sinc = df_sinc[~pd.Series(hash_linhas(df_sinc)).duplicated(keep='first').to_numpy()]
+
+    # Saída = Planilha 2 com só a aba alvo regenerada; as outras abas são copiadas
+    # no nível do zip (sem reler nem reformatar), com fórmulas e formatação intactas
+    _avisar(progresso, 0.6, f"Gravando a base consolidada ({len(df_sinc)} ocorrências)")
+    substituir_aba_xlsx(p2_path, saida_path, aba_alvo, _finalizar(df_sinc))
+
+    _avisar(progresso, 0.9, "Atualizando índice e estado")
+    indice = gravar_indice(saida_path, hash_linhas(df_sinc))
+    _gravar_estado(saida_path, _novo_estado(df_sinc, aba_alvo, _crc_abas(p2_path), mapeamentos, indice))
+    return {"modo": "completo", "novas": len(df_sinc), "atrasadas": 0, "nao_mapeados": nao_mapeados,
+            "segundos": time.perf_counter() - inicio}
+
+
+def sincronizar_incremental(p1_path, p2_path, saida_path, mapeamentos, estado, crc_abas, progresso=None):
+    """
+    Processa só as ocorrências novas desde a última sincronização:
+    linhas com Data/Hora >= marca d'água cujo hash ainda não está na base.
+    Linhas mais antigas que a marca d'água e desconhecidas são apenas contadas
+    como 'atrasadas' (pedem uma reconstrução completa).
+    """
+    inicio = time.perf_counter()
+    aba_alvo = estado["aba_alvo"]
+    _avisar(progresso, 0.1, "Lendo Planilha 1 e Planilha 2")
+    df_sinc, nao_mapeados = _preparar(_ler_entradas(p1_path, p2_path, aba_alvo), mapeamentos)
+    _avisar(progresso, 0.5, "Procurando ocorrências novas")
+
+    hashes = hash_linhas(df_sinc)
+    # dentro do lote vale a primeira ocorrência de cada chave (como no drop_duplicates)
+    primeira = ~pd.Series(hashes).duplicated(keep='first').to_numpy()
+    indice = _indice_atual(saida_path, estado)
+    conhecidas = contidos_no_indice(indice, hashes)
+    if estado.get("watermark"):
+        recentes = (_instante(df_sinc) >= pd.Timestamp(estado["watermark"])).to_numpy()
+    else:
+        recentes = np.ones(len(df_sinc), dtype=bool)
+
+    df_novas = df_sinc[primeira & ~conhecidas & recentes]
+    # só interessa o que vai ser gravado agora; o restante já foi reportado antes
+    nao_mapeados = _nao_mapeados_nas_linhas(nao_mapeados, df_novas)
+    atrasadas = int((primeira & ~conhecidas & ~recentes).sum())
+
+    if not df_novas.empty:
+        _avisar(progresso, 0.7, f"Acrescentando {len(df_novas)} ocorrências à base")
+        anexar_linhas_xlsx(saida_path, saida_path, aba_alvo, _finalizar(df_novas))
+        novo_watermark = max(pd.Timestamp(estado["watermark"]) if estado.get("watermark") else pd.Timestamp.min,
+                             _instante(df_novas).max())
+        indice = gravar_indice(saida_path, np.concatenate([indice, hash_linhas(df_novas)]))
+        estado = {k: v for k, v in estado.items() if k != "hashes"}
+        estado = dict(estado,
+                      watermark=novo_watermark.isoformat(),
+                      indice_linhas=len(indice),
+                      atualizado_em=datetime.now().isoformat(timespec="seconds"))
+    if not df_novas.empty or estado.get("crc_abas") != crc_abas:
+        _gravar_estado(saida_path, dict(estado, crc_abas=crc_abas))
+
+    return {"modo": "incremental", "novas": len(df_novas), "atrasadas": atrasadas, "nao_mapeados": nao_mapeados,
+            "segundos": time.perf_counter() - inicio}
+
+
+def sincronizar_desligamentos(p1_path, p2_path, saida_path, modo="incremental", mapeamentos=None, progresso=None):
+    """
+    Sincroniza a base consolidada de desligamentos.
+    Primeiro confere o manifesto: se Planilha1, Planilha2, a base gerada e os
+    dicionários não mudaram, retorna modo "atualizado" sem ler nenhuma planilha.
+    modo="incremental" usa a marca d'água quando possível; cai para a
+    reconstrução completa se não houver estado, se a base não existir, se a
+    aba alvo mudar ou se alguma outra aba da Planilha 2 tiver sido alterada.
+    Se os dicionários mudarem (versão do codebook), a base é reconstruída.
+    mapeamentos=None usa os dicionários de modules.codebook.
+    progresso(fracao, mensagem), se informado, recebe o andamento.
+    Só uma sincronização por base roda de cada vez, mesmo entre processos
+    ('<base>.lock'); quem chega depois espera e, como o manifesto é conferido
+    já com a trava, normalmente recebe "atualizado" sem refazer o trabalho.
+    Retorna None se as planilhas de entrada não existirem.
+    """
+    mapeamentos = MAPEAMENTOS if mapeamentos is None else mapeamentos
+    if not (os.path.exists(p1_path) and os.path.exists(p2_path)):
+        return None
+
+    def aguardando():
+        _avisar(progresso, 0.0, "Aguardando a sincronização de outra sessão")
+
+    with trava_arquivo(saida_path, ao_esperar=aguardando) as renovar:
+        def progresso_com_sinal(fracao, mensagem):
+            renovar()
+            _avisar(progresso, fracao, mensagem)
+        return _sincronizar_travado(p1_path, p2_path, saida_path, mapeamentos, modo, progresso_com_sinal)
+
+
+def _sincronizar_travado(p1_path, p2_path, saida_path, mapeamentos, modo, progresso):
+    inicio = time.perf_counter()
+    _avisar(progresso, 0.0, "Conferindo se as planilhas mudaram")
+    anterior = _ler_json(caminho_manifesto(saida_path))
+    if modo == "incremental" and anterior and os.path.exists(saida_path):
+        atual = _manifesto(p1_path, p2_path, saida_path, mapeamentos, anterior)
+        if _iguais(atual, anterior):
+            if any(atual[nome] != anterior.get(nome) for nome in ("p1", "p2", "saida")):
+                # só o mtime mudou (arquivo salvo sem alterações): atualiza para não recalcular o hash
+                _gravar_json(caminho_manifesto(saida_path), dict(anterior, **atual))
+            # as ocorrências atrasadas continuam pendentes até uma reconstrução completa
+            return {"modo": "atualizado", "novas": 0, "atrasadas": anterior.get("atrasadas", 0), "nao_mapeados": {},
+                    "segundos": time.perf_counter() - inicio}
+
+    resultado = _sincronizar(p1_path, p2_path, saida_path, mapeamentos, modo, progresso)
+    manifesto = _manifesto(p1_path, p2_path, saida_path, mapeamentos, anterior)
+    _gravar_json(caminho_manifesto(saida_path), dict(manifesto, atrasadas=resultado["atrasadas"]))
+    _avisar(progresso, 1.0, "Sincronização concluída")
+    return resultado
+
+
+def _sincronizar(p1_path, p2_path, saida_path, mapeamentos, modo, progresso=None):
+    estado = ler_estado(saida_path) if modo == "incremental" else None
+    if (estado is None or not os.path.exists(saida_path)
+            or estado.get("mapeamentos") != versao_mapeamentos(mapeamentos)):
+        return reconstruir_base(p1_path, p2_path, saida_path, mapeamentos, progresso)
+
+    abas_p2 = sheet_names_cached(p2_path)
+    crc_atual = _crc_abas(p2_path)
+    outras_mudaram = any(crc_atual.get(aba) != estado.get("crc_abas", {}).get(aba)
+                         for aba in abas_p2 if aba != estado.get("aba_alvo"))
+    if estado.get("aba_alvo") != _aba_alvo(abas_p2) or outras_mudaram:
+        return reconstruir_base(p1_path, p2_path, saida_path, mapeamentos, progresso)
+
+    return sincronizar_incremental(p1_path, p2_path, saida_path, mapeamentos, estado, crc_atual, progresso)
@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+import traceback
+
+from modules.etl_desligamentos import sincronizar_desligamentos
+
+# Registro do processo: uma tarefa por base consolidada (caminho de saída).
+# Fica no módulo, então sobrevive aos reruns do Streamlit e é compartilhado
+# entre sessões; a última tarefa de cada base continua consultável depois de
+# concluída.
+_TAREFAS = {}
+_TAREFAS_LOCK = threading.Lock()
+
+
+def impressao_arquivos(*paths):
+    """(mtime_ns, tamanho) de cada arquivo, None para os que não existem."""
+    impressao = []
+    for path in paths:
+        try:
+            info = os.stat(path)
+            impressao.append((info.st_mtime_ns, info.st_size))
+        except OSError:
+            impressao.append(None)
+    return tuple(impressao)
+
+
+class TarefaETL:
+    """
+    Sincronização rodando numa thread em segundo plano.
+    estado: "executando", "concluida" ou "erro"; progresso de 0 a 1 com a
+    mensagem da etapa atual; resultado é o dicionário de
+    sincronizar_desligamentos (ou None se as planilhas não existirem).
+    """
+
+    def __init__(self, p1_path, p2_path, saida_path, modo):
+        self.p1_path = p1_path
+        self.p2_path = p2_path
+        self.saida_path = saida_path
+        self.modo = modo
+        self.estado = "executando"
+        self.progresso = 0.0
+        self.mensagem = "Na fila"
+        self.resultado = None
+        self.erro = None
+        self.iniciada_em = time.time()
+        self.concluida_em = None
+        # entradas + base como ficaram ao fim da tarefa (para reaproveitar o resultado)
+        self.impressao_final = None
+        self._thread = threading.Thread(target=self._executar, name=f"etl-{modo}", daemon=True)
+
+    @property
+    def em_execucao(self):
+        return self.estado == "executando"
+
+    def _avancar(self, fracao, mensagem):
+        self.progresso = max(self.progresso, float(fracao))
+        self.mensagem = mensagem
+
+    def _executar(self):
+        try:
+            self.resultado = sincronizar_desligamentos(
+                self.p1_path, self.p2_path, self.saida_path, modo=self.modo, progresso=self._avancar)
+            self.estado = "concluida"
+        except Exception as e:
+            self.erro = f"{e}\n{traceback.format_exc()}"
+            self.mensagem = str(e)
+            self.estado = "erro"
+        finally:
+            self.impressao_final = impressao_arquivos(self.p1_path, self.p2_path, self.saida_path)
+            self.concluida_em = time.time()
+
+    def aguardar(self, segundos=None):
+        """Espera a tarefa terminar (ou o tempo limite); retorna True se terminou."""
+        self._thread.join(segundos)
+        return not self.em_execucao
+
+
+def iniciar_sincronizacao(p1_path, p2_path, saida_path, modo="incremental"):
+    """
+    Dispara a sincronização em segundo plano e retorna a tarefa (single-flight).
+    Se já houver uma tarefa em execução para a mesma base, todas as sessões
+    recebem essa mesma tarefa e aguardam o resultado dela. Se a última tarefa
+    terminou e nem as planilhas nem a base mudaram desde então, o resultado
+    dela é reaproveitado sem abrir outra. Entre processos, a trava de arquivo
+    de sincronizar_desligamentos garante um único escritor; a base é gravada
+    por troca atômica, então quem lê continua vendo a versão anterior.
+    """
+    with _TAREFAS_LOCK:
+        atual = _TAREFAS.get(saida_path)
+        if atual is not None and atual.em_execucao:
+            return atual
+        if (atual is not None and atual.estado == "concluida"
+                and (modo == "incremental" or atual.modo == modo)
+                and atual.impressao_final == impressao_arquivos(p1_path, p2_path, saida_path)):
+            return atual
+        tarefa = TarefaETL(p1_path, p2_path, saida_path, modo)
+        _TAREFAS[saida_path] = tarefa
+        tarefa._thread.start()
+        return tarefa
+
+
+def tarefa_atual(saida_path):
+    """Última tarefa (em execução ou concluída) da base, ou None."""
+    with _TAREFAS_LOCK:
+        return _TAREFAS.get(saida_path)
@@ -1,12 +1,74 @@
+from bisect import bisect_left
+
+import numpy as np
+import pandas as pd
+
+
 def encontrar_torres(km_alvo, km_list):
-    """Retorna (torre anterior, torre posterior) com base no KM informado."""
-    anterior = None
-    posterior = None
+    """
+    Retorna (torre anterior, torre posterior) com base no KM informado.
+    km_list deve estar em ordem crescente (busca binária, O(log n)). Com KMs
+    repetidos vale o primeiro vão que contém o alvo; fora da linha (ou KM
+    inválido) retorna (None, None).
+    """
+    n = len(km_list)
+    if n < 2 or km_alvo is None or km_alvo != km_alvo:
+        return None, None
+
+    posterior = bisect_left(km_list, km_alvo)
+    if posterior == 0:
+        # alvo exatamente na primeira torre: primeiro vão
+        posterior = 1 if km_list[0] == km_alvo else None
+    elif posterior == n:
+        posterior = None
+
+    if posterior is None:
+        return None, None
+    return posterior - 1, posterior
+
+
+def localizar_km(km_alvos, km_torres):
+    """
+    Versão em lote de encontrar_torres: para um array de KMs retorna arrays
+    (anterior, posterior, fracao) numa única busca (np.searchsorted).
+    fracao é a posição do alvo dentro do vão (0 na anterior, 1 na posterior);
+    vãos de comprimento zero (KM repetido) dão fracao 0. KMs fora da linha ou
+    NaN recebem índices -1 e fracao NaN. km_torres deve estar em ordem crescente.
+    """
+    km_torres = np.asarray(km_torres, dtype=float)
+    alvos = np.atleast_1d(np.asarray(km_alvos, dtype=float))
+    n = len(km_torres)
+
+    anterior = np.full(alvos.shape, -1, dtype=np.int64)
+    posterior = np.full(alvos.shape, -1, dtype=np.int64)
+    fracao = np.full(alvos.shape, np.nan)
+    if n < 2:
+        return anterior, posterior, fracao
+
+    pos = np.searchsorted(km_torres, alvos, side="left")
+    # alvo exatamente na primeira torre cai no primeiro vão
+    pos = np.where((pos == 0) & (alvos == km_torres[0]), 1, pos)
+    validos = (pos > 0) & (pos < n) & ~np.isnan(alvos)
+
+    posterior[validos] = pos[validos]
+    anterior[validos] = pos[validos] - 1
+    km_ant = km_torres[anterior[validos]]
+    vao = km_torres[posterior[validos]] - km_ant
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fracao[validos] = np.where(vao > 0, (alvos[validos] - km_ant) / vao, 0.0)
+    return anterior, posterior, fracao
+
+
+def indice_proxima_torre(km_torres, km_alvo):
+    """Índice da primeira torre com KM >= km_alvo (km_torres crescente), ou None se não houver."""
+    i = int(np.searchsorted(np.asarray(km_torres, dtype=float), km_alvo, side="left"))
+    return i if i < len(km_torres) else None
 
-    for i in range(len(km_list) - 1):
-        if km_list[i] <= km_alvo <= km_list[i + 1]:
-            anterior = i
-            posterior = i + 1
-            break
 
-    return anterior, posterior
+def km_numerico(serie):
+    """KM como float aceitando vírgula decimal e texto em volta ('km 210,5'); vazios viram NaN."""
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype(float)
+    texto = serie.astype(object).where(serie.notna(), "").astype(str)
+    texto = texto.str.replace(",", ".", regex=False).str.extract(r"(-?\d+(?:\.\d+)?)")[0]
+    return pd.to_numeric(texto, errors="coerce").astype(float)
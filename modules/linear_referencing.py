@@ -0,0 +1,210 @@
+"""
+Referência linear das LTs: converte um KM a partir do Terminal A em
+latitude/longitude sobre o traçado (interpolando entre as torres vizinhas)
+e uma coordenada de volta no KM do ponto mais próximo da linha. Cada LT
+guarda as torres com coordenada em ordem de KM e o estaqueamento acumulado
+(soma das distâncias entre torres); tudo opera sobre arrays NumPy, então a
+mesma conversão serve para uma estimativa da aba de localização ou para
+todo o histórico de desligamentos (ver retroanalise).
+"""
+import math
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from modules.spatial_index import KM_POR_GRAU, coordenadas_torres, distancia_km
+
+# Pontos por bloco na projeção coordenada -> KM (pontos x segmentos em memória)
+PONTOS_POR_BLOCO = 512
+
+
+def _km_e_coordenadas(df_lt, comprimento=None):
+    """
+    (km, lat, lon) das torres com coordenada, em ordem de KM. Sem a coluna KM
+    preenchida, o KM vem do estaqueamento na ordem da aba, ajustado ao
+    comprimento da LT (KM_LT) quando informado.
+    """
+    lat, lon, validas = coordenadas_torres(df_lt)
+    colunas = [str(c).strip().lower().replace(' ', '') for c in df_lt.columns]
+    km = (pd.to_numeric(df_lt.iloc[:, colunas.index("km")], errors="coerce").to_numpy(dtype=float)
+          if "km" in colunas else np.full(len(df_lt), np.nan))
+
+    com_km = validas & ~np.isnan(km)
+    if com_km.sum() >= 2:
+        ordem = np.argsort(km[com_km], kind="stable")
+        return km[com_km][ordem], lat[com_km][ordem], lon[com_km][ordem]
+
+    lat, lon = lat[validas], lon[validas]
+    estaqueamento = np.concatenate([[0.0], np.cumsum(distancia_km(lat[:-1], lon[:-1], lat[1:], lon[1:]))])
+    if comprimento and len(estaqueamento) > 1 and estaqueamento[-1] > 0:
+        estaqueamento *= comprimento / estaqueamento[-1]
+    return estaqueamento, lat, lon
+
+
+class ReferenciaLinear:
+    """
+    Traçado de todas as LTs com coordenada: arrays concatenados (km, lat,
+    lon e estaqueamento acumulado em km) com offsets por LT, como no
+    IndiceTorres. A LT i ocupa [offsets[i], offsets[i+1]).
+    """
+
+    def __init__(self, lts, offsets, km, lat, lon):
+        self.lts = list(lts)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.km = np.asarray(km, dtype=np.float64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        # distância acumulada ao longo das torres, reiniciada em cada LT
+        passos = np.zeros(len(self.km))
+        if len(self.km) > 1:
+            passos[1:] = distancia_km(self.lat[:-1], self.lon[:-1], self.lat[1:], self.lon[1:])
+        tamanhos = np.diff(self.offsets)
+        inicios = self.offsets[:-1][tamanhos > 0]
+        passos[inicios] = 0.0
+        acumulado = np.cumsum(passos)
+        self.estaqueamento = acumulado - np.repeat(acumulado[inicios], tamanhos[tamanhos > 0])
+        self._posicao = {lt: i for i, lt in enumerate(self.lts)}
+        # compartilhada entre sessões: ninguém deve alterá-la
+        for array in (self.offsets, self.km, self.lat, self.lon, self.estaqueamento):
+            array.flags.writeable = False
+
+    @classmethod
+    def construir(cls, workbook, lts, comprimentos=None):
+        """Monta a referência com as abas de LT que têm latitude e longitude em pelo menos duas torres."""
+        comprimentos = comprimentos or {}
+        lts_ok, kms, lats, lons = [], [], [], []
+        for lt in lts:
+            if lt not in workbook:
+                continue
+            km, lat, lon = _km_e_coordenadas(workbook.sheet(lt), comprimentos.get(lt))
+            if len(km) < 2:
+                continue
+            lts_ok.append(lt)
+            kms.append(km)
+            lats.append(lat)
+            lons.append(lon)
+        offsets = np.concatenate([[0], np.cumsum([len(k) for k in kms], dtype=np.int64)])
+        juntar = lambda partes: np.concatenate(partes) if partes else np.empty(0)
+        return cls(lts_ok, offsets, juntar(kms), juntar(lats), juntar(lons))
+
+    def __contains__(self, lt):
+        return lt in self._posicao
+
+    def _fatia(self, lt):
+        i = self._posicao[lt]
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def comprimento_tracado(self, lt):
+        """Comprimento (km) do traçado pelas coordenadas das torres: o estaqueamento da última."""
+        return float(self.estaqueamento[self._fatia(lt)][-1])
+
+    def km_para_coordenadas(self, lt, km_alvos):
+        """
+        (lat, lon) de cada KM da LT, interpolados entre as torres anterior e
+        posterior. KMs fora da LT (ou LT sem coordenadas) dão NaN.
+        """
+        alvos = np.atleast_1d(np.asarray(km_alvos, dtype=float))
+        if lt not in self:
+            return np.full(alvos.shape, np.nan), np.full(alvos.shape, np.nan)
+        fatia = self._fatia(lt)
+        km = self.km[fatia]
+        lat = np.interp(alvos, km, self.lat[fatia], left=np.nan, right=np.nan)
+        lon = np.interp(alvos, km, self.lon[fatia], left=np.nan, right=np.nan)
+        return lat, lon
+
+    def km_para_coordenadas_lote(self, lts, km_alvos):
+        """Versão em lote para eventos de LTs diferentes (lts e km_alvos do mesmo tamanho)."""
+        km = np.asarray(km_alvos, dtype=float)
+        lts = np.asarray(lts, dtype=object)
+        lat = np.full(km.shape, np.nan)
+        lon = np.full(km.shape, np.nan)
+        for lt in pd.unique(lts[pd.notna(lts)]):
+            if lt not in self:
+                continue
+            linhas = np.flatnonzero(lts == lt)
+            lat[linhas], lon[linhas] = self.km_para_coordenadas(lt, km[linhas])
+        return lat, lon
+
+    def coordenadas_para_km(self, lt, lats, lons):
+        """
+        Projeta cada coordenada no segmento mais próximo do traçado da LT.
+        Retorna (km, afastamento em km da linha). A projeção usa o plano
+        tangente no centro da LT, com erro desprezível na escala de um vão.
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=float))
+        lons = np.atleast_1d(np.asarray(lons, dtype=float))
+        km_saida = np.full(lats.shape, np.nan)
+        afastamento = np.full(lats.shape, np.nan)
+        if lt not in self:
+            return km_saida, afastamento
+
+        fatia = self._fatia(lt)
+        km, lat, lon = self.km[fatia], self.lat[fatia], self.lon[fatia]
+        lat0, lon0 = lat.mean(), lon.mean()
+        escala_lon = math.cos(math.radians(lat0)) * KM_POR_GRAU
+        torres = np.column_stack([(lon - lon0) * escala_lon, (lat - lat0) * KM_POR_GRAU])
+        inicio, vetor = torres[:-1], np.diff(torres, axis=0)
+        comprimento2 = np.einsum("ij,ij->i", vetor, vetor)
+
+        validos = np.flatnonzero(~np.isnan(lats) & ~np.isnan(lons))
+        for bloco in range(0, len(validos), PONTOS_POR_BLOCO):
+            linhas = validos[bloco:bloco + PONTOS_POR_BLOCO]
+            pontos = np.column_stack([(lons[linhas] - lon0) * escala_lon, (lats[linhas] - lat0) * KM_POR_GRAU])
+            relativo = pontos[:, None, :] - inicio[None, :, :]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                t = np.where(comprimento2 > 0, np.einsum("pij,ij->pi", relativo, vetor) / comprimento2, 0.0)
+            t = np.clip(t, 0.0, 1.0)
+            resto = relativo - t[:, :, None] * vetor[None, :, :]
+            distancia2 = np.einsum("pij,pij->pi", resto, resto)
+            j = np.argmin(distancia2, axis=1)
+            t_j = t[np.arange(len(linhas)), j]
+            km_saida[linhas] = km[j] + t_j * (km[j + 1] - km[j])
+            afastamento[linhas] = np.sqrt(distancia2[np.arange(len(linhas)), j])
+        return km_saida, afastamento
+
+
+def _valor_json(valor):
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return None
+    if hasattr(valor, "isoformat"):
+        return valor.isoformat()
+    return valor.item() if isinstance(valor, np.generic) else valor
+
+
+def pontos_geojson(df, col_lat="Latitude", col_lon="Longitude"):
+    """
+    FeatureCollection (dict) com um ponto por linha de df que tenha
+    coordenada; as demais colunas viram propriedades (NaN vira null, datas
+    viram texto).
+    """
+    lat = pd.to_numeric(df[col_lat], errors="coerce")
+    lon = pd.to_numeric(df[col_lon], errors="coerce")
+    com_ponto = lat.notna() & lon.notna()
+    propriedades = df.loc[com_ponto].drop(columns=[col_lat, col_lon])
+    propriedades.columns = [str(c) for c in propriedades.columns]
+    features = [
+        {"type": "Feature",
+         "geometry": {"type": "Point", "coordinates": [round(x, 6), round(y, 6)]},
+         "properties": {k: _valor_json(v) for k, v in props.items()}}
+        for x, y, props in zip(lon[com_ponto].tolist(), lat[com_ponto].tolist(),
+                               propriedades.to_dict(orient="records"))
+    ]
+    return {"type": "FeatureCollection", "features": features}
+
+
+@st.cache_resource(max_entries=4)
+def _referencia_compartilhada(fingerprint, lts, chave_comprimentos, _workbook, _comprimentos):
+    return ReferenciaLinear.construir(_workbook, lts, _comprimentos)
+
+
+def referencia_linear(workbook, lts, comprimentos=None):
+    """
+    Referência linear das LTs informadas, montada uma vez por conteúdo da
+    planilha (fingerprint) e compartilhada entre sessões. comprimentos
+    ({LT: km}, ver localizacao_falta.comprimentos_lt) ajusta o estaqueamento
+    das LTs sem KM nas torres.
+    """
+    comprimentos = comprimentos or {}
+    chave = repr(sorted(comprimentos.items()))
+    return _referencia_compartilhada(workbook.fingerprint, tuple(lts), chave, workbook, comprimentos)
@@ -0,0 +1,156 @@
+"""
+Métodos de localização de falta do seletor "Método" da aba de localização.
+Cada método transforma as leituras dos terminais (distância da proteção e
+das ondas viajantes, em km a partir do próprio terminal) e o comprimento da
+LT (aba KM_LT) num KM estimado a partir do Terminal A e numa faixa de
+incerteza. Tudo opera sobre arrays NumPy: o mesmo código serve para um
+evento do formulário ou para todo o histórico (ver retroanalise).
+"""
+import numpy as np
+import pandas as pd
+
+from modules.km_utils import km_numerico
+
+METODOS = ["Sequência Negativa", "TW", "SIGRA 1 Terminal", "SIGRA 2 Terminais"]
+
+# Incerteza típica de cada método. Impedância de um terminal: fração do
+# comprimento (efeito da resistência de falta e do infeed); ondas viajantes:
+# valor fixo em km (resolução de amostragem ~ um vão).
+ERRO_RELATIVO = {
+    "Sequência Negativa": 0.03,
+    "SIGRA 1 Terminal": 0.02,
+    "SIGRA 2 Terminais": 0.01,
+}
+ERRO_TW_KM = {"dois terminais": 0.3, "um terminal": 0.6}
+
+# Colunas das leituras na base (nomes originais e os de map_oc_columns)
+COLUNAS_LEITURAS = {
+    "prot_a": ['Terminal A - Prot. (km)', 'terminal_a_prot_km'],
+    "prot_b": ['Terminal B - Prot. (km)', 'terminal_b_prot_km'],
+    "tw_a": ['Terminal A - TW', 'terminal_a_tw', 'TW - Terminal A'],
+    "tw_b": ['Terminal B - TW', 'terminal_b_tw', 'TW - Terminal B', 'TW - Terminal B '],
+    "erro_tw_a": ['Erro TW TA'],
+    "erro_tw_b": ['Erro TW - TB'],
+}
+
+
+def _array(valor):
+    if valor is None:
+        return np.full(1, np.nan)
+    return np.atleast_1d(np.asarray(valor, dtype=float))
+
+
+def _de_b_para_a(leitura_b, comprimento):
+    """Leitura medida a partir do Terminal B convertida para KM a partir do Terminal A."""
+    return comprimento - leitura_b
+
+
+def _um_terminal(prot_a, prot_b, comprimento, erro_relativo, preferir_mais_proximo):
+    """
+    Estimativa de um terminal: usa a leitura de A (ou a de B convertida se A
+    estiver vazia). Com preferir_mais_proximo, havendo as duas, fica a do
+    terminal mais próximo da falta (menor distância lida = erro absoluto menor).
+    """
+    de_b = _de_b_para_a(prot_b, comprimento)
+    usar_b = np.isnan(prot_a) & ~np.isnan(de_b)
+    if preferir_mais_proximo:
+        usar_b |= ~np.isnan(prot_a) & ~np.isnan(prot_b) & (prot_b < prot_a)
+    km = np.where(usar_b, de_b, prot_a)
+    distancia_lida = np.where(usar_b, prot_b, prot_a)
+    # erro cresce com a distância até o terminal usado, com piso na fração do comprimento
+    if preferir_mais_proximo:
+        incerteza = erro_relativo * np.fmax(distancia_lida, 0.25 * comprimento)
+    else:
+        incerteza = erro_relativo * comprimento
+    terminal = np.where(usar_b, "B", "A")
+    return km, incerteza, terminal
+
+
+def _dois_terminais(leitura_a, leitura_b, comprimento, erro_base):
+    """
+    Combinação de dois terminais: média de A e de B convertida. Metade da
+    discordância entre as duas entra na incerteza; com só um lado disponível
+    cai para a leitura de um terminal com o dobro do erro.
+    """
+    de_b = _de_b_para_a(leitura_b, comprimento)
+    tem_a, tem_b = ~np.isnan(leitura_a), ~np.isnan(de_b)
+    dois = tem_a & tem_b
+    with np.errstate(invalid="ignore"):
+        km = np.where(dois, (leitura_a + de_b) / 2, np.where(tem_a, leitura_a, de_b))
+        incerteza = np.where(dois, erro_base + np.abs(leitura_a - de_b) / 2, 2 * erro_base)
+    terminal = np.where(dois, "A+B", np.where(tem_a, "A", np.where(tem_b, "B", "")))
+    return km, incerteza, terminal
+
+
+def estimar_km(metodo, comprimento, prot_a=None, prot_b=None, tw_a=None, tw_b=None,
+               erro_tw_a=None, erro_tw_b=None):
+    """
+    KM estimado (a partir do Terminal A) e faixa de incerteza por evento.
+    Todas as leituras são arrays (ou escalares) em km a partir do próprio
+    terminal; ausentes = NaN/None. Retorna dict de arrays: km, km_min,
+    km_max, incerteza, terminal ('A', 'B' ou 'A+B') e valido. O KM é
+    limitado a [0, comprimento]; sem comprimento conhecido, a conversão das
+    leituras de B e os métodos relativos ao comprimento ficam inválidos.
+    """
+    if metodo not in METODOS:
+        raise ValueError(f"Método desconhecido: {metodo!r} (opções: {', '.join(METODOS)})")
+
+    arrays = [_array(v) for v in (comprimento, prot_a, prot_b, tw_a, tw_b, erro_tw_a, erro_tw_b)]
+    n = max(len(a) for a in arrays)
+    comprimento, prot_a, prot_b, tw_a, tw_b, erro_tw_a, erro_tw_b = (
+        np.broadcast_to(a, (n,)).astype(float) for a in arrays)
+
+    if metodo == "TW":
+        # erro informado pelo equipamento, quando houver, substitui o típico
+        erro_informado = np.fmax(np.abs(erro_tw_a), np.abs(erro_tw_b))
+        erro_base = np.where(np.isnan(erro_informado), ERRO_TW_KM["dois terminais"], erro_informado)
+        km, incerteza, terminal = _dois_terminais(tw_a, tw_b, comprimento, erro_base)
+        um_lado = terminal != "A+B"
+        incerteza = np.where(um_lado, np.fmax(incerteza, ERRO_TW_KM["um terminal"]), incerteza)
+    elif metodo == "SIGRA 2 Terminais":
+        erro_base = ERRO_RELATIVO[metodo] * comprimento
+        km, incerteza, terminal = _dois_terminais(prot_a, prot_b, comprimento, erro_base)
+    else:
+        km, incerteza, terminal = _um_terminal(prot_a, prot_b, comprimento, ERRO_RELATIVO[metodo],
+                                               preferir_mais_proximo=metodo == "SIGRA 1 Terminal")
+
+    with np.errstate(invalid="ignore"):
+        km_limitado = np.where(np.isnan(comprimento), km, np.clip(km, 0.0, comprimento))
+        km_min = np.fmax(km_limitado - incerteza, 0.0)
+        km_max = np.where(np.isnan(comprimento), km_limitado + incerteza,
+                          np.fmin(km_limitado + incerteza, comprimento))
+    valido = ~np.isnan(km_limitado) & ~np.isnan(incerteza)
+    return {
+        "km": km_limitado,
+        "km_min": np.where(valido, km_min, np.nan),
+        "km_max": np.where(valido, km_max, np.nan),
+        "incerteza": np.where(valido, incerteza, np.nan),
+        "terminal": np.where(valido, terminal, ""),
+        "valido": valido,
+    }
+
+
+def leituras_do_dataframe(df):
+    """Leituras dos terminais (arrays float) a partir das colunas presentes na base."""
+    leituras = {}
+    for chave, candidatas in COLUNAS_LEITURAS.items():
+        coluna = next((c for c in candidatas if c in df.columns), None)
+        leituras[chave] = (km_numerico(df[coluna]).to_numpy() if coluna is not None
+                           else np.full(len(df), np.nan))
+    return leituras
+
+
+def comprimentos_lt(df_km):
+    """{LT: comprimento em km} a partir da aba KM_LT (coluna A = LT, coluna B = KM)."""
+    if df_km is None or df_km.empty or len(df_km.columns) < 2:
+        return {}
+    lts = df_km.iloc[:, 0].astype(str).str.strip()
+    km = pd.to_numeric(df_km.iloc[:, 1], errors="coerce")
+    validos = km.notna() & (lts != "")
+    return dict(zip(lts[validos], km[validos].astype(float)))
+
+
+def estimar_km_dataframe(df, metodo, comprimento):
+    """estimar_km sobre todas as linhas de df; comprimento é array/Series alinhado (ou escalar)."""
+    leituras = leituras_do_dataframe(df)
+    return estimar_km(metodo, np.asarray(comprimento, dtype=float), **leituras)
@@ -1,41 +1,362 @@
+from io import BytesIO
+
 import matplotlib.pyplot as plt
 import numpy as np
+import pandas as pd
 import streamlit as st
-from modules.km_utils import encontrar_torres
+from matplotlib.collections import LineCollection
+from modules.data_loader import iter_sheet_rows
+from modules.km_utils import localizar_km
+
+# Colunas de altitude aceitas na aba da LT (nomes sem espaço, minúsculos)
+COLUNAS_ALTITUDE = ["altitude", "altitude(m)", "elevação", "elevacao", "elevação(m)", "elevacao(m)",
+                    "cota", "cota(m)", "altura", "altura(m)"]
+
+
+def coluna_altitude(df):
+    """
+    Coluna de altitude de df (ver COLUNAS_ALTITUDE, sem diferenciar
+    maiúsculas e espaços) ou None. Aceita também só o cabeçalho (nomes).
+    """
+    normalizadas = {str(c).strip().lower().replace(" ", ""): c for c in getattr(df, "columns", df)}
+    return next((normalizadas[c] for c in COLUNAS_ALTITUDE if c in normalizadas), None)
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _dados_altitude(fingerprint, lt, _workbook):
+    # o cabeçalho basta para saber se há altitude: a aba inteira só é lida quando há
+    if coluna_altitude(next(iter_sheet_rows(_workbook.source, lt), ())) is None:
+        return None
+    # mesmos nomes de coluna do índice de torres: "km" e a descrição na coluna D
+    df = _workbook.sheet(lt)
+    df.columns = [str(c).strip().lower().replace(" ", "") for c in df.columns]
+    if "km" not in df.columns:
+        return None
+    df["torre"] = df.iloc[:, 3].astype(str).str.strip()
+    return df[["km", coluna_altitude(df), "torre"]]
+
 
-def plot_lt(df, km_busca=None, torre_central=None, titulo="LT"):
+def dados_altitude(workbook, lt):
+    """
+    Colunas km, altitude e torre da aba da LT (entrada de plot_lt), ou None
+    quando a aba não tem coluna de altitude. Lido uma vez por planilha e LT,
+    fora do fragmento da busca.
+    """
+    return _dados_altitude(workbook.fingerprint, lt, workbook)
+
+
+def lttb(x, y, n_pontos):
+    """
+    Largest-Triangle-Three-Buckets: índices de n_pontos pontos que preservam
+    a forma da curva (picos e vales). O primeiro e o último ponto sempre
+    ficam; os demais são divididos em n_pontos - 2 baldes e de cada um fica o
+    ponto que forma o maior triângulo com o escolhido no balde anterior e a
+    média do próximo. x deve estar em ordem crescente.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_pontos >= n or n_pontos < 3:
+        return np.arange(n)
+
+    limites = np.linspace(1, n - 1, n_pontos - 1).astype(np.int64)
+    indices = np.empty(n_pontos, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(n_pontos - 2):
+        inicio, fim = limites[i], limites[i + 1]
+        proximo = slice(limites[i + 1], limites[i + 2]) if i + 2 < len(limites) else slice(n - 1, n)
+        x_medio, y_medio = x[proximo].mean(), y[proximo].mean()
+        area = np.abs((x[a] - x_medio) * (y[inicio:fim] - y[a]) - (x[a] - x[inicio:fim]) * (y_medio - y[a]))
+        a = inicio + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
+def plot_lt(df, km_busca=None, torre_central=None, titulo="LT", max_pontos=2000):
+    """
+    Perfil de altitude das torres (colunas "km", "torre" e uma de
+    COLUNAS_ALTITUDE). Sem altitude na aba o perfil é plano. Com mais de
+    max_pontos torres a linha é reduzida por LTTB; torre central e KM de
+    busca usam sempre os dados completos.
+    """
+    km = pd.to_numeric(df["km"], errors="coerce").to_numpy(dtype=float)
+    coluna = coluna_altitude(df)
+    alturas = (pd.to_numeric(df[coluna], errors="coerce").to_numpy(dtype=float) if coluna is not None
+               else np.full(len(df), np.nan))
+    validos = ~np.isnan(km)
+    ordem = np.argsort(km[validos], kind="stable")
+    km = km[validos][ordem]
+    alturas = alturas[validos][ordem]
+    torres = (df["torre"].to_numpy(dtype=object)[validos][ordem] if "torre" in df.columns
+              else np.full(len(km), None, dtype=object))
+
+    # altitudes faltando: interpoladas entre as torres vizinhas; nenhuma = perfil plano
+    com_altitude = ~np.isnan(alturas)
+    if com_altitude.any():
+        alturas = np.interp(km, km[com_altitude], alturas[com_altitude])
+        rotulo_y = str(coluna)
+    else:
+        alturas = np.zeros(len(km))
+        rotulo_y = "Altitude (m) — não informada na aba"
 
-    alturas = np.random.uniform(20, 40, len(df))  # simulando altura
     fig, ax = plt.subplots(figsize=(13, 6))
 
-    # plota linha base
-    ax.plot(df["km"], alturas, marker="o", color="gray", linewidth=2)
+    # plota linha base (reduzida por LTTB em perfis grandes)
+    manter = lttb(km, alturas, max_pontos)
+    ax.plot(km[manter], alturas[manter], marker="o" if len(manter) <= 200 else None, markersize=3,
+            color="gray", linewidth=2)
 
     # destaca torre central
-    if torre_central:
-        idx = df.index[df["torre"] == torre_central]
+    if torre_central is not None:
+        idx = np.flatnonzero(torres == torre_central)
         if len(idx) > 0:
             i = idx[0]
-            ax.scatter(df.loc[i, "km"], alturas[i], s=200, c="red", label="Torre Central")
-            ax.text(df.loc[i, "km"], alturas[i] + 1, f"Torre {torre_central}", color="red")
+            ax.scatter(km[i], alturas[i], s=200, c="red", label="Torre Central")
+            ax.text(km[i], alturas[i] + 1, f"Torre {torre_central}", color="red")
 
     # plota ponto por KM
     if km_busca is not None:
-        km_list = df["km"].tolist()
-        a, p = encontrar_torres(km_busca, km_list)
+        anteriores, posteriores, fracoes = localizar_km(km_busca, km)
+        a, p, frac = int(anteriores[0]), int(posteriores[0]), fracoes[0]
 
-        if a is not None:
+        if a >= 0:
             # interpolação de altura
-            frac = (km_busca - km_list[a]) / (km_list[p] - km_list[a])
             altura_interp = alturas[a] + frac * (alturas[p] - alturas[a])
 
             ax.scatter(km_busca, altura_interp, s=200, c="blue", label=f"KM {km_busca:.2f}")
             ax.text(km_busca, altura_interp + 1, f"KM {km_busca:.2f}", color="blue")
 
-    ax.set_title(titulo)
+    ax.set_title(titulo if len(manter) == len(km) else f"{titulo} ({len(manter)} de {len(km)} pontos, LTTB)")
     ax.set_xlabel("KM")
-    ax.set_ylabel("Altura (m)")
+    ax.set_ylabel(rotulo_y)
     ax.grid(True)
-    ax.legend()
+    if ax.get_legend_handles_labels()[0]:
+        ax.legend()
+
+    return fig
+
+
+# Diagrama de transposição (aba de localização): posição 1 (superior) em y=3 ... 3 (inferior) em y=1
+Y_POSICAO = {1: 3, 2: 2, 3: 1}
+CORES_FASE = {"A": "orange", "B": "green", "C": "purple"}
+Y_TORRE = (0.8, 3.2)
+
+
+def _trajetos_fases(x, sequencias):
+    """{fase: (xs, ys)} com o ponto de cada fase em cada torre de sequência com 3 letras."""
+    trajetos = {}
+    for xi, seq in zip(x, sequencias):
+        if len(seq) != 3:
+            continue
+        for posicao, fase in enumerate(seq, start=1):
+            xs, ys = trajetos.setdefault(fase, ([], []))
+            xs.append(xi)
+            ys.append(Y_POSICAO[posicao])
+    return {fase: (np.asarray(xs), np.asarray(ys, dtype=float)) for fase, (xs, ys) in trajetos.items()}
+
+
+def diagrama_transposicao(km, descricao, sequencias, posicao_central, fase, km_busca, km_faixa=None):
+    """
+    Diagrama das torres de uma janela: cada torre é uma linha vertical com a
+    sequência de fases e cada fase um trajeto entre as torres. Torres e
+    trajetos saem como duas LineCollection (uma chamada cada); posicao_central
+    é a posição (na janela) da primeira torre com KM >= km_busca.
+    """
+    km = np.asarray(km, dtype=float)
+    sequencias = [str(s).strip().upper() for s in sequencias]
+    x = np.linspace(1, 9, len(km))
+    fase_letra = str(fase)[:1].upper()
 
+    fig, ax = plt.subplots(figsize=(12, 5))
+    ax.set_xlim(0, 10)
+    ax.set_ylim(0, 5)
+    ax.axis("off")
+
+    # 1. trajetos das fases (transposição)
+    trajetos = _trajetos_fases(x, sequencias)
+    if trajetos:
+        destaque = [f == fase_letra for f in trajetos]
+        ax.add_collection(LineCollection(
+            [np.column_stack(xy) for xy in trajetos.values()],
+            colors=[CORES_FASE.get(f, "gray") for f in trajetos],
+            linewidths=[3 if d else 1.5 for d in destaque],
+            linestyles=["-" if d else "--" for d in destaque],
+            alpha=0.7, zorder=1))
+        for f, (xs, ys) in trajetos.items():
+            ax.text(xs[-1] + 0.1, ys[-1], f"Fase {f}", va="center", fontsize=10, color=CORES_FASE.get(f, "gray"))
+
+    # 2. torres e rótulos
+    central = np.arange(len(km)) == posicao_central
+    ax.add_collection(LineCollection(
+        [[(xi, Y_TORRE[0]), (xi, Y_TORRE[1])] for xi in x],
+        colors=np.where(central, "red", "gray"),
+        linewidths=np.where(central, 3, 1.5),
+        linestyles=["-" if c else "--" for c in central],
+        zorder=3))
+    for xi, km_i, desc, seq, c in zip(x, km, descricao, sequencias, central):
+        ax.text(xi, 0.7, f"Torre: {str(desc).strip()}\n{km_i:.2f} km", ha="center", fontsize=9,
+                color="red" if c else "black")
+        ax.text(xi, Y_TORRE[1] + 0.1, f"Seq: {seq}", ha="center", fontsize=9,
+                bbox=dict(facecolor='white', alpha=0.8, edgecolor="red" if c else 'gray', boxstyle='round,pad=0.3'),
+                zorder=4)
+
+    # 3. KM de busca: interpolado no vão entre a torre anterior e a central
+    x_busca = x[posicao_central]
+    if km_busca != km[posicao_central] and posicao_central > 0:
+        km_ant, km_prox = km[posicao_central - 1], km[posicao_central]
+        if km_prox > km_ant:
+            proporcao = (km_busca - km_ant) / (km_prox - km_ant)
+            x_busca = x[posicao_central - 1] + proporcao * (x[posicao_central] - x[posicao_central - 1])
+
+    # faixa de incerteza, posicionada pela mesma interpolação KM -> x
+    if km_faixa is not None:
+        x_faixa = np.interp(km_faixa, km, x)
+        ax.axvspan(x_faixa[0], x_faixa[1], color="lightblue", alpha=0.3, zorder=0)
+
+    ax.vlines(x_busca, *Y_TORRE, colors="blue", linestyles="dotted", linewidth=2, zorder=5)
+    ax.text(x_busca, 0.4, f"KM de Busca: {km_busca:.2f}", ha="center", color="blue", fontsize=10,
+            bbox=dict(facecolor='lightblue', alpha=0.7, edgecolor='blue', boxstyle='round,pad=0.3'), zorder=6)
+
+    # ponto do KM de busca na fase em defeito
+    if fase_letra in trajetos:
+        xs, ys = trajetos[fase_letra]
+        if xs[0] <= x_busca <= xs[-1] and len(xs) > 1:
+            ax.plot(x_busca, np.interp(x_busca, xs, ys), 'o', markersize=10, color='red',
+                    markeredgecolor='black', zorder=10)
     return fig
+
+
+def figura_png(fig, dpi=150):
+    """Bytes PNG da figura; a figura é fechada (o pyplot não guarda mais a referência)."""
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png", dpi=dpi, bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _diagrama_png(fingerprint, lt, inicio, fim, posicao_central, fase, km_busca, km_faixa, com_codigos,
+                  _indice, _codigos):
+    janela = _indice.janela(lt, inicio, fim)
+    sequencias = janela["fases"].astype(str).str.strip().str.upper()
+    if com_codigos:
+        sequencias = sequencias.map(lambda c: _codigos.get(c, c))
+    fig = diagrama_transposicao(janela["km"], janela["descricao"], sequencias, posicao_central - inicio,
+                                fase, km_busca, km_faixa)
+    return figura_png(fig)
+
+
+def diagrama_png(workbook, indice, lt, inicio, fim, posicao_central, fase, km_busca, km_faixa=None, codigos=None):
+    """
+    PNG do diagrama das torres inicio..fim (posições locais, inclusive) da LT,
+    guardado num cache LRU por (planilha, LT, janela, fase, KM, faixa): rever
+    um KM já desenhado não passa pelo matplotlib. codigos: {código da torre:
+    sequência} para LTs cuja coluna FASES traz códigos (Torres JBJU).
+    """
+    km_faixa = None if km_faixa is None else (float(km_faixa[0]), float(km_faixa[1]))
+    return _diagrama_png(workbook.fingerprint, lt, int(inicio), int(fim), int(posicao_central), fase,
+                         float(km_busca), km_faixa, bool(codigos), indice, codigos or {})
+
+
+# Perfil da LT inteira: acima de MAX_TORRES_PERFIL torres visíveis só os pontos de
+# transposição são desenhados; rótulos de torre só até MAX_ROTULOS_PERFIL
+MAX_TORRES_PERFIL = 300
+MAX_ROTULOS_PERFIL = 40
+NOMES_Y = {1: "inferior", 2: "meio", 3: "superior"}
+
+
+def perfil_transposicao(km_torres, descricao, trechos, km_min, km_max, fase=None, km_busca=None,
+                        janela_km=None, titulo="LT"):
+    """
+    Perfil de transposição da LT entre km_min e km_max. As fases são
+    desenhadas por trecho (TabelaTransposicao.trechos: uma linha por mudança
+    de sequência), não por torre, então o custo depende do número de
+    transposições e não do de torres. Com poucas torres visíveis (zoom) as
+    torres aparecem como marcas e, com menos ainda, com rótulo.
+    janela_km destaca a janela do diagrama de torres; km_busca, o KM buscado.
+    """
+    km_torres = np.asarray(km_torres, dtype=float)
+    a = int(np.searchsorted(km_torres, km_min, side="left"))
+    b = int(np.searchsorted(km_torres, km_max, side="right"))
+    n_visiveis = max(0, b - a)
+    fase_letra = str(fase)[:1].upper() if fase else None
+
+    fig, ax = plt.subplots(figsize=(13, 4))
+    ax.set_xlim(km_min, km_max)
+    ax.set_ylim(0.3, 3.9)
+
+    inicio = trechos["KM Início"].to_numpy(dtype=float)
+    fim = trechos["KM Fim"].to_numpy(dtype=float)
+    visiveis = (fim >= km_min) & (inicio <= km_max)
+    x = np.column_stack([np.clip(inicio[visiveis], km_min, km_max),
+                         np.clip(fim[visiveis], km_min, km_max)]).ravel()
+
+    # 1. fases: um degrau por trecho (posição desconhecida vira lacuna)
+    for f, cor in CORES_FASE.items():
+        posicao = trechos[f"Posição {f}"].to_numpy()[visiveis]
+        y = np.repeat(np.where(posicao > 0, 4 - posicao, np.nan), 2)
+        destaque = f == fase_letra
+        ax.plot(x, y, color=cor, linewidth=3 if destaque else 1.5, linestyle="-" if destaque else "--",
+                alpha=0.8, label=f"Fase {f}")
+
+    # 2. pontos de transposição (início de cada trecho, menos o primeiro da LT)
+    pontos = inicio[1:][visiveis[1:]]
+    pontos = pontos[(pontos >= km_min) & (pontos <= km_max)]
+    ax.vlines(pontos, 0.6, 3.4, colors="black", linestyles="dotted", linewidth=1, zorder=2)
+    if len(pontos) <= MAX_ROTULOS_PERFIL:
+        for p in pontos:
+            ax.text(p, 3.5, f"{p:.2f}", rotation=90, ha="center", va="bottom", fontsize=7)
+
+    # 3. torres, só quando aproximado
+    if n_visiveis <= MAX_TORRES_PERFIL:
+        ax.vlines(km_torres[a:b], 0.8, 3.2, colors="lightgray", linewidth=0.8, zorder=0)
+        if n_visiveis <= MAX_ROTULOS_PERFIL:
+            for km_i, desc in zip(km_torres[a:b], np.asarray(descricao, dtype=object)[a:b]):
+                ax.text(km_i, 0.7, str(desc).strip(), rotation=90, ha="center", va="top", fontsize=7)
+        detalhe = f"{n_visiveis} torres"
+    else:
+        detalhe = f"{n_visiveis} torres (só pontos de transposição; aproxime para ver as torres)"
+
+    if janela_km is not None:
+        ax.axvspan(janela_km[0], janela_km[1], color="lightblue", alpha=0.3, zorder=0, label="Janela do diagrama")
+    if km_busca is not None:
+        ax.axvline(km_busca, color="blue", linestyle="dotted", linewidth=2, label=f"KM {km_busca:.2f}")
+
+    ax.set_yticks(list(NOMES_Y), list(NOMES_Y.values()))
+    ax.set_xlabel("KM")
+    ax.set_title(f"{titulo} — {detalhe}, {len(pontos)} transposições")
+    ax.legend(loc="upper right", fontsize=8, ncol=5)
+    return fig
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _perfil_png(fingerprint, lt, km_min, km_max, fase, janela_km, _indice, _transposicao):
+    fig = perfil_transposicao(_indice.km_da_lt(lt), _indice.tabela(lt)["descricao"], _transposicao.trechos(lt),
+                              km_min, km_max, fase, janela_km=janela_km, titulo=lt)
+    return figura_png(fig, dpi=110)
+
+
+def perfil_png(workbook, indice, transposicao, lt, km_min, km_max, fase=None, janela_km=None):
+    """
+    PNG do perfil de transposição (ver perfil_transposicao), com cache LRU
+    próprio como o do diagrama. Sem o KM buscado na chave: a janela do
+    diagrama já marca a região, e cada KM digitado não gera uma imagem nova.
+    """
+    janela_km = None if janela_km is None else (float(janela_km[0]), float(janela_km[1]))
+    return _perfil_png(workbook.fingerprint, lt, float(km_min), float(km_max), fase, janela_km, indice, transposicao)
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _altitude_png(fingerprint, lt, torre_central, km_busca, _df_altitude):
+    return figura_png(plot_lt(_df_altitude, km_busca, torre_central, titulo=lt), dpi=110)
+
+
+def altitude_png(workbook, df_altitude, lt, torre_central=None, km_busca=None):
+    """
+    PNG do perfil de altitude (ver plot_lt) com cache LRU como o do
+    diagrama. df_altitude (saída de dados_altitude) não entra na chave: é
+    sempre o mesmo para a planilha (fingerprint) e a LT.
+    """
+    return _altitude_png(workbook.fingerprint, lt, None if torre_central is None else str(torre_central),
+                         None if km_busca is None else float(km_busca), df_altitude)
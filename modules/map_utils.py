@@ -1,14 +1,159 @@
+import hashlib
+import html
+import json
+
 import folium
-from streamlit_folium import st_folium
+import numpy as np
+import pandas as pd
+from folium.plugins import FastMarkerCluster
+
+from modules.data_loader import gravar_json_cache, ler_json_cache
+from modules.spatial_index import coordenadas_torres
+from modules.store import COLUNA_RESISTENCIA
+
+# Marcador de cada ponto do FastMarkerCluster: [lat, lon, popup]
+_CALLBACK_MARCADOR = """
+function (row) {
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    marker.bindPopup(row[2]);
+    return marker;
+};
+"""
+
+
+def _chave_torre(torre):
+    # mesma normalização da aba de aterramento: 'Torre 019' e '19' casam pelo número sem zeros à esquerda
+    texto = str(torre).strip()
+    return texto.lstrip("0") or texto
+
+
+def torres_geojson(df_lt, lt=None, desligamentos=None, resistencias=None):
+    """
+    FeatureCollection (dict) com um ponto por torre de df_lt (colunas de
+    latitude/longitude, ver spatial_index.coordenadas_torres, "torre" e
+    opcionalmente "km"). desligamentos e resistencias: {torre: valor} viram
+    as propriedades "desligamentos" e "resistencia" de cada feature (torres
+    comparadas sem zeros à esquerda). Torres sem coordenada válida ficam de fora.
+    """
+    lat, lon, validas = coordenadas_torres(df_lt)
+    if not validas.any():
+        return {"type": "FeatureCollection", "features": []}
+    torres = (df_lt["torre"] if "torre" in df_lt.columns else pd.Series(df_lt.index, index=df_lt.index))
+    torres = torres.astype(str).str.strip()[validas]
+    km = (pd.to_numeric(df_lt["km"], errors="coerce")[validas] if "km" in df_lt.columns
+          else pd.Series(np.nan, index=torres.index))
+    chaves = torres.map(_chave_torre)
+    n_desligamentos = chaves.map({_chave_torre(t): n for t, n in (desligamentos or {}).items()}).fillna(0).astype(int)
+    resistencia = chaves.map({_chave_torre(t): r for t, r in (resistencias or {}).items()}).astype(float)
+
+    features = [
+        {"type": "Feature",
+         "geometry": {"type": "Point", "coordinates": [round(x, 6), round(y, 6)]},
+         "properties": {"lt": lt, "torre": t, "km": None if k != k else round(k, 3),
+                        "desligamentos": d, "resistencia": None if r != r else round(r, 2)}}
+        for x, y, t, k, d, r in zip(lon[validas].tolist(), lat[validas].tolist(), torres.tolist(),
+                                    km.astype(float).tolist(), n_desligamentos.tolist(), resistencia.tolist())
+    ]
+    return {"type": "FeatureCollection", "features": features}
+
+
+def camada_torres(workbook, lt, desligamentos=None, resistencias=None):
+    """
+    torres_geojson da aba da LT com cache em disco por planilha
+    (fingerprint), LT e propriedades: o GeoJSON de cada LT é montado uma vez
+    (a aba só é lida nessa hora) e reaproveitado entre execuções enquanto a
+    planilha e as contagens não mudarem.
+    """
+    propriedades = json.dumps([sorted((str(k), v) for k, v in (desligamentos or {}).items()),
+                               sorted((str(k), v) for k, v in (resistencias or {}).items())], default=str)
+    chave = f"geojson|{lt}|{hashlib.sha1(propriedades.encode('utf-8')).hexdigest()[:12]}"
+    geojson = ler_json_cache(workbook.fingerprint, chave)
+    if geojson is None:
+        # mesmas colunas do índice de torres: "km" e a descrição na coluna D
+        df_lt = workbook.sheet(lt)
+        df_lt.columns = [str(c).strip().lower().replace(' ', '') for c in df_lt.columns]
+        if len(df_lt.columns) >= 4:
+            df_lt["torre"] = df_lt.iloc[:, 3].astype(str).str.strip()
+        geojson = torres_geojson(df_lt, lt, desligamentos, resistencias)
+        gravar_json_cache(geojson, workbook.fingerprint, chave)
+    return geojson
 
-def gerar_mapa(df_lt):
+
+def contar_desligamentos(resultado):
+    """{LT: {torre: nº de desligamentos}} a partir do resultado de retroanalise.retroanalisar (torre anterior)."""
+    localizados = resultado.dropna(subset=["LT", "Torre Anterior"])
+    contagem = localizados.groupby(["LT", "Torre Anterior"]).size()
+    return {lt: {str(t).strip(): int(n) for t, n in grupo.droplevel(0).items()}
+            for lt, grupo in contagem.groupby(level=0)}
+
+
+def resistencias_por_lt(df_resistencia):
+    """
+    {LT: {torre: resistência}} das medições de aterramento (colunas do banco
+    local: 'Linha de Transmissão', 'Número Operação' e COLUNA_RESISTENCIA).
+    Com mais de uma linha para a mesma torre vale a última.
+    """
+    colunas = ['Linha de Transmissão', 'Número Operação', COLUNA_RESISTENCIA]
+    if df_resistencia is None or df_resistencia.empty or not set(colunas) <= set(df_resistencia.columns):
+        return {}
+    df = df_resistencia[colunas].dropna()
+    df = df.assign(**{COLUNA_RESISTENCIA: pd.to_numeric(df[COLUNA_RESISTENCIA], errors="coerce")}).dropna()
+    return {str(lt).strip(): dict(zip(grupo['Número Operação'].map(_chave_torre), grupo[COLUNA_RESISTENCIA].astype(float)))
+            for lt, grupo in df.groupby('Linha de Transmissão', sort=False)}
+
+
+def camadas_retroanalise(workbook, resultado, resistencias=None):
+    """
+    {LT: GeoJSON} para gerar_mapa: uma camada por LT com desligamentos
+    localizados na retroanálise (contagem pela torre anterior) e, quando
+    houver medição para a LT, a resistência de aterramento de cada torre
+    (resistencias: saída de resistencias_por_lt, casada pelo nome da LT).
+    LTs sem coordenadas nas torres ficam de fora.
+    """
+    resistencias = resistencias or {}
+    camadas = {}
+    for lt, contagem in contar_desligamentos(resultado).items():
+        if lt not in workbook:
+            continue
+        geojson = camada_torres(workbook, lt, contagem, resistencias.get(lt))
+        if geojson["features"]:
+            camadas[lt] = geojson
+    return camadas
+
+
+def _popup(propriedades):
+    # nomes de torre e LT vêm da planilha: escapados antes de virar HTML
+    linhas = [f"Torre {html.escape(str(propriedades['torre']))}"]
+    if propriedades.get("lt"):
+        linhas.insert(0, f"<b>{html.escape(str(propriedades['lt']))}</b>")
+    if propriedades.get("km") is not None:
+        linhas.append(f"KM {propriedades['km']:.2f}")
+    linhas.append(f"Desligamentos: {propriedades.get('desligamentos', 0)}")
+    if propriedades.get("resistencia") is not None:
+        linhas.append(f"Resistência: {propriedades['resistencia']:.1f} Ω")
+    return "<br>".join(linhas)
+
+
+def gerar_mapa(df_lt, camadas=None):
+    """
+    Mapa com as torres agrupadas (FastMarkerCluster): uma camada por LT.
+    camadas: {LT: GeoJSON} já montados (ver camada_torres); sem elas, o
+    GeoJSON é montado de df_lt, separado pela coluna "lt" se existir.
+    """
     m = folium.Map(location=[-15.89, -47.99], zoom_start=5)
 
-    for _, row in df_lt.iterrows():
-        if "latitude" in row and "longitude" in row:
-            folium.Marker(
-                location=[row["latitude"], row["longitude"]],
-                popup=f"Torre {row['torre']}"
-            ).add_to(m)
+    if camadas is None:
+        if "lt" in df_lt.columns:
+            camadas = {lt: torres_geojson(grupo, lt) for lt, grupo in df_lt.groupby("lt", sort=False)}
+        else:
+            camadas = {None: torres_geojson(df_lt)}
+
+    for lt, geojson in camadas.items():
+        pontos = [[f["geometry"]["coordinates"][1], f["geometry"]["coordinates"][0], _popup(f["properties"])]
+                  for f in geojson["features"]]
+        if pontos:
+            FastMarkerCluster(pontos, callback=_CALLBACK_MARCADOR, name=lt or "Torres").add_to(m)
 
+    if len(camadas) > 1:
+        folium.LayerControl().add_to(m)
     return m
@@ -0,0 +1,227 @@
+"""
+Retroanálise em lote: roda o localizador de torres sobre todo o histórico de
+desligamentos de uma vez, em vez de um KM por vez no formulário da aba de
+localização.
+
+    python -m modules.retroanalise --localizador "Localizador de Vão.xlsx" \\
+        --desligamentos "Desligamentos forçados Taesa.xlsx" --saida retroanalise.csv
+"""
+import argparse
+import json
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from modules.data_loader import open_workbook, read_sheet_cached, sheet_names_cached
+from modules.km_utils import km_numerico
+from modules.linear_referencing import pontos_geojson, referencia_linear
+from modules.localizacao_falta import METODOS, comprimentos_lt, estimar_km_dataframe
+from modules.tower_index import abas_lt, indice_torres
+from modules.transposicao import codigos_transposicao, tabela_transposicao
+
+# Colunas de KM na ordem de preferência (nomes da base e de map_oc_columns);
+# em cada evento vale a primeira preenchida
+COLUNAS_KM = ['KM Real', 'km_real', 'Terminal A - Prot. (km)', 'terminal_a_prot_km', 'KM', 'km']
+COLUNAS_FT = ['FT', 'ft']
+COLUNAS_FASE = ['Fase', 'fase']
+
+
+def _primeira_coluna(df, candidatas):
+    return next((c for c in candidatas if c in df.columns), None)
+
+
+def _coalescer_km(df):
+    """Primeiro KM preenchido entre as colunas de COLUNAS_KM e o nome da coluna usada."""
+    km = pd.Series(np.nan, index=df.index)
+    origem = pd.Series(None, index=df.index, dtype=object)
+    for coluna in COLUNAS_KM:
+        if coluna not in df.columns:
+            continue
+        valores = km_numerico(df[coluna])
+        vazios = km.isna() & valores.notna()
+        km[vazios] = valores[vazios]
+        origem[vazios] = coluna
+    return km, origem
+
+
+def lt_da_ft(ft, lts):
+    """
+    Aba do Localizador correspondente a uma FT da base ('LT SMSB C3' -> 'LT SMSB3'):
+    primeiro o nome exato, depois sem o espaço antes do circuito. None se não houver.
+    """
+    if ft is None or ft != ft:
+        return None
+    ft = " ".join(str(ft).split())
+    if ft in lts:
+        return ft
+    sem_espaco = re.sub(r"\s+C(\d+)$", r"\1", ft)
+    return sem_espaco if sem_espaco in lts else None
+
+
+def _fases_em_defeito(fase):
+    """Letras de fase (A/B/C) envolvidas num código como 'AN', 'BCN', 'CG'."""
+    return fase.astype(object).fillna("").astype(str).str.upper().str.replace(r"[^ABC]", "", regex=True)
+
+
+def retroanalisar(df_desligamentos, indice, metodo=None, comprimentos=None, transposicao=None, referencia=None):
+    """
+    Localiza todos os eventos da base consolidada de uma vez.
+    Cada linha é ligada à aba da sua LT (coluna FT) e ao primeiro KM
+    preenchido (KM Real, depois Terminal A - Prot. (km)...). Retorna um
+    DataFrame alinhado ao original com LT, KM usado, torres anterior e
+    posterior, vão, fração no vão, sequência de fases das duas torres, fase
+    em defeito e sua posição (1 = superior) na torre anterior, e um status.
+    Com metodo (ver localizacao_falta.METODOS) e comprimentos {LT: km}, o KM
+    passa a ser a estimativa do método a partir das leituras dos terminais,
+    com a faixa de incerteza e o erro contra o KM Real quando houver.
+    Com transposicao (TabelaTransposicao), a posição da fase vem da tabela de
+    trechos, que também resolve os códigos de torre (Torres JBJU).
+    Com referencia (ReferenciaLinear), o KM de cada evento também vira
+    Latitude/Longitude sobre o traçado da LT.
+    """
+    df = df_desligamentos
+    col_ft = _primeira_coluna(df, COLUNAS_FT)
+    col_fase = _primeira_coluna(df, COLUNAS_FASE)
+    if col_ft is None:
+        raise ValueError("A base de desligamentos não tem a coluna 'FT'.")
+
+    # FT -> aba resolvido só nos valores distintos
+    fts = df[col_ft].astype(object)
+    lts_conhecidas = set(indice.lts) | set(indice.ignoradas)
+    de_para = {ft: lt_da_ft(ft, lts_conhecidas) for ft in pd.unique(fts)}
+    lt = fts.map(de_para)
+    km, origem_km = _coalescer_km(df)
+    estimativa = None
+    if metodo is not None:
+        comprimento = lt.map(comprimentos or {}).astype(float).to_numpy()
+        estimativa = estimar_km_dataframe(df, metodo, comprimento)
+        km_real = km.where(origem_km.isin(['KM Real', 'km_real']))
+        km = pd.Series(estimativa["km"], index=df.index)
+        origem_km = pd.Series(np.where(estimativa["valido"], np.char.add(metodo + " (", np.char.add(estimativa["terminal"], ")")), None),
+                              index=df.index, dtype=object)
+
+    anterior, posterior, fracao = indice.localizar_lote(lt.to_numpy(dtype=object), km.to_numpy())
+    achados = anterior >= 0
+
+    # posições globais -> número da torre dentro da LT (1 = primeira)
+    pos_lt = pd.Index(indice.lts, dtype=object).get_indexer(pd.Index(lt.to_numpy(dtype=object), dtype=object))
+    base = np.where(pos_lt >= 0, indice.offsets[np.maximum(pos_lt, 0)], 0)
+
+    def _pegar(array, posicoes, vazio=None):
+        saida = np.full(len(posicoes), vazio, dtype=object if vazio is None else float)
+        saida[achados] = array[posicoes[achados]]
+        return saida
+
+    km_ant = _pegar(indice.km, anterior, np.nan)
+    km_post = _pegar(indice.km, posterior, np.nan)
+    fases_ant = pd.Series(_pegar(indice.fases, anterior), index=df.index, dtype=object)
+
+    resultado = pd.DataFrame({
+        "LT": lt,
+        "KM": km,
+        "Origem KM": origem_km,
+        "Nº Torre Anterior": pd.array(np.where(achados, anterior - base + 1, 0), dtype="Int64"),
+        "Torre Anterior": _pegar(indice.descricao, anterior),
+        "KM Anterior": km_ant,
+        "Nº Torre Posterior": pd.array(np.where(achados, posterior - base + 1, 0), dtype="Int64"),
+        "Torre Posterior": _pegar(indice.descricao, posterior),
+        "KM Posterior": km_post,
+        "Vão (km)": km_post - km_ant,
+        "Fração no Vão": fracao,
+        "Fases Anterior": fases_ant,
+        "Fases Posterior": _pegar(indice.fases, posterior),
+    }, index=df.index)
+    for coluna in ("Nº Torre Anterior", "Nº Torre Posterior"):
+        resultado.loc[~achados, coluna] = pd.NA
+    if estimativa is not None:
+        resultado.insert(3, "KM Mín", estimativa["km_min"])
+        resultado.insert(4, "KM Máx", estimativa["km_max"])
+        resultado.insert(5, "Erro vs KM Real", km - km_real)
+        # torres candidatas dentro da faixa de incerteza (o que a equipe de inspeção precisa percorrer)
+        inicio_faixa, fim_faixa = indice.faixa_km_lote(lt.to_numpy(dtype=object), estimativa["km_min"],
+                                                       estimativa["km_max"])
+        resultado.insert(6, "Torres na Faixa", fim_faixa - inicio_faixa)
+
+    if col_fase is not None:
+        fases_defeito = _fases_em_defeito(df[col_fase])
+        resultado["Fase em Defeito"] = fases_defeito
+        # posição (1 a 3, de cima para baixo) da fase em defeito na sequência da torre anterior;
+        # só faz sentido para faltas monofásicas com sequência de 3 letras
+        monofasica = (fases_defeito.str.len() == 1).to_numpy()
+        posicao = pd.Series(pd.NA, index=df.index, dtype="Int64")
+        if transposicao is not None:
+            posicoes, sequencias = transposicao.posicao_lote(lt.to_numpy(dtype=object), km.to_numpy(),
+                                                             fases_defeito.to_numpy(dtype=object))
+            conhecida = monofasica & (posicoes > 0)
+            posicao[conhecida] = posicoes[conhecida]
+            resultado["Sequência no Trecho"] = sequencias
+        else:
+            seq = fases_ant.fillna("").astype(str).str.strip().str.upper()
+            monofasica = monofasica & (seq.str.len() == 3).to_numpy()
+            for i in range(3):
+                posicao[monofasica & (seq.str[i] == fases_defeito).to_numpy()] = i + 1
+        resultado["Posição da Fase"] = posicao
+
+    if referencia is not None:
+        lat, lon = referencia.km_para_coordenadas_lote(lt.to_numpy(dtype=object), km.to_numpy())
+        resultado["Latitude"] = lat
+        resultado["Longitude"] = lon
+
+    status = np.full(len(df), "ok", dtype=object)
+    status[~achados & km.notna().to_numpy()] = "KM fora da LT"
+    status[km.isna().to_numpy()] = "sem KM"
+    status[lt.isna().to_numpy()] = "LT sem aba no Localizador"
+    ignoradas = lt.isin(list(indice.ignoradas)).to_numpy()
+    status[ignoradas] = "aba da LT não indexada"
+    resultado["Status"] = status
+    return resultado
+
+
+def retroanalisar_planilhas(localizador, desligamentos, aba=None, metodo=None):
+    """
+    Abre o Localizador e a base (primeira aba, ou a informada) e retorna (df
+    base, resultado), com a mesma tabela de transposição da aba de
+    localização (códigos da 'Torres JBJU' nas LTs da BRASNORTE).
+    """
+    workbook = open_workbook(localizador)
+    df_dados = read_sheet_cached(workbook.source, "DADOS")
+    lts = abas_lt(workbook, df_dados["LT"].dropna())
+    indice = indice_torres(workbook, lts)
+    comprimentos = comprimentos_lt(workbook.sheet("KM_LT")) if "KM_LT" in workbook else {}
+    referencia = referencia_linear(workbook, lts, comprimentos)
+    df_jbju = workbook.sheet("Torres JBJU") if "Torres JBJU" in workbook else None
+    codigos_por_lt = codigos_transposicao(df_dados, df_jbju)
+    transposicao = tabela_transposicao(workbook, indice, {lt: c for lt, c in codigos_por_lt.items() if lt in indice})
+    df = read_sheet_cached(desligamentos, aba if aba is not None else sheet_names_cached(desligamentos)[0])
+    return df, retroanalisar(df, indice, metodo, comprimentos, transposicao, referencia)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Localiza as torres de todos os desligamentos da base.")
+    parser.add_argument("--localizador", default="Localizador de Vão.xlsx")
+    parser.add_argument("--desligamentos", required=True, help="base consolidada de desligamentos (.xlsx)")
+    parser.add_argument("--aba", default=None, help="aba da base (padrão: a primeira)")
+    parser.add_argument("--metodo", choices=METODOS, default=None,
+                        help="estima o KM pelas leituras dos terminais em vez de usar o KM registrado")
+    parser.add_argument("--saida", default="retroanalise.csv",
+                        help="arquivo .csv, .xlsx ou .geojson (pontos dos eventos com coordenada) de saída")
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    df, resultado = retroanalisar_planilhas(args.localizador, args.desligamentos, args.aba, args.metodo)
+    saida = pd.concat([df, resultado.add_prefix("Localização: ")], axis=1)
+    if args.saida.lower().endswith(".xlsx"):
+        saida.to_excel(args.saida, index=False)
+    elif args.saida.lower().endswith(".geojson"):
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(pontos_geojson(saida, "Localização: Latitude", "Localização: Longitude"), f, ensure_ascii=False)
+    else:
+        saida.to_csv(args.saida, index=False, sep=";", decimal=",", encoding="utf-8-sig")
+    print(f"{len(df)} eventos em {time.perf_counter() - inicio:.2f}s -> {args.saida}")
+    print(resultado["Status"].value_counts().to_string())
+
+
+if __name__ == "__main__":
+    main()
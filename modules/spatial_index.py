@@ -0,0 +1,185 @@
+"""
+Índice espacial das torres: dada uma posição GPS (ou um lote delas), as k
+torres mais próximas com LT, KM e distância. Com SciPy disponível usa uma
+KD-tree sobre as coordenadas no espaço (x, y, z da esfera); sem ela, as
+torres ficam ordenadas por latitude e cada consulta examina só a faixa de
+latitude que pode conter as mais próximas (mesma ideia da busca binária do
+índice de KM). As distâncias são sempre de grande círculo (haversine).
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+try:
+    from scipy.spatial import cKDTree  # opcional: sem SciPy vale a busca por faixa de latitude
+    _TEM_SCIPY = True
+except ImportError:
+    _TEM_SCIPY = False
+
+RAIO_TERRA_KM = 6371.0088
+KM_POR_GRAU = RAIO_TERRA_KM * np.pi / 180
+
+# Nomes aceitos para as coordenadas das torres (sem diferenciar maiúsculas e espaços)
+COLUNAS_LATITUDE = ["latitude", "lat"]
+COLUNAS_LONGITUDE = ["longitude", "lon", "long"]
+
+# Meia largura inicial (graus de latitude) da faixa examinada sem SciPy; dobra até conter as k torres
+FAIXA_INICIAL_GRAUS = 0.05
+
+
+def coluna_por_nome(df, candidatas):
+    """Primeira coluna de df cujo nome (minúsculo, sem espaços) está em candidatas, ou None."""
+    normalizadas = {str(c).strip().lower().replace(" ", ""): c for c in df.columns}
+    return next((normalizadas[c] for c in candidatas if c in normalizadas), None)
+
+
+def coordenadas_torres(df):
+    """(lat, lon, validas): arrays float das colunas de coordenada e máscara das posições válidas."""
+    col_lat, col_lon = coluna_por_nome(df, COLUNAS_LATITUDE), coluna_por_nome(df, COLUNAS_LONGITUDE)
+    if col_lat is None or col_lon is None:
+        vazio = np.full(len(df), np.nan)
+        return vazio, vazio.copy(), np.zeros(len(df), dtype=bool)
+    lat = pd.to_numeric(df[col_lat], errors="coerce").to_numpy(dtype=float)
+    lon = pd.to_numeric(df[col_lon], errors="coerce").to_numpy(dtype=float)
+    with np.errstate(invalid="ignore"):
+        validas = ~np.isnan(lat) & ~np.isnan(lon) & (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+    return lat, lon, validas
+
+
+def distancia_km(lat1, lon1, lat2, lon2):
+    """Distância de grande círculo (haversine) em km; aceita arrays (com broadcast)."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RAIO_TERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _xyz(lat, lon):
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+class IndiceEspacial:
+    """
+    Coordenadas de todas as torres do Localizador (ordenadas por latitude)
+    com LT, KM e descrição de cada uma. As posições devolvidas pelas
+    consultas indexam esses arrays.
+    """
+
+    def __init__(self, lat, lon, lt, km, torre):
+        ordem = np.argsort(np.asarray(lat, dtype=float), kind="stable")
+        self.lat = np.asarray(lat, dtype=np.float64)[ordem]
+        self.lon = np.asarray(lon, dtype=np.float64)[ordem]
+        self.lt = np.asarray(lt, dtype=object)[ordem]
+        self.km = np.asarray(km, dtype=np.float64)[ordem]
+        self.torre = np.asarray(torre, dtype=object)[ordem]
+        self._arvore = cKDTree(_xyz(self.lat, self.lon)) if _TEM_SCIPY and len(self.lat) else None
+        # o índice é compartilhado entre sessões: ninguém deve alterá-lo
+        for array in (self.lat, self.lon, self.lt, self.km, self.torre):
+            array.flags.writeable = False
+
+    @classmethod
+    def construir(cls, workbook, lts):
+        """Monta o índice com as torres das abas de LT que têm colunas de latitude e longitude."""
+        partes = []
+        for lt in lts:
+            if lt not in workbook:
+                continue
+            df_lt = workbook.sheet(lt)
+            lat, lon, validas = coordenadas_torres(df_lt)
+            if not validas.any():
+                continue
+            # mesmas colunas do índice de torres: "km" e a descrição na coluna D
+            df_lt.columns = [str(c).strip().lower().replace(' ', '') for c in df_lt.columns]
+            km = (pd.to_numeric(df_lt["km"], errors="coerce").to_numpy(dtype=float) if "km" in df_lt.columns
+                  else np.full(len(df_lt), np.nan))
+            torre = (df_lt.iloc[:, 3].astype(str).str.strip().to_numpy(dtype=object) if len(df_lt.columns) >= 4
+                     else np.full(len(df_lt), None, dtype=object))
+            partes.append((lat[validas], lon[validas], np.full(validas.sum(), lt, dtype=object),
+                           km[validas], torre[validas]))
+        if not partes:
+            return cls([], [], [], [], [])
+        return cls(*(np.concatenate(coluna) for coluna in zip(*partes)))
+
+    def __len__(self):
+        return len(self.lat)
+
+    def proximas_lote(self, lats, lons, k=1):
+        """
+        As k torres mais próximas de cada ponto. Retorna (posicoes, distancias)
+        com forma (n_pontos, k): posições nos arrays do índice (ordem crescente
+        de distância) e distâncias em km. Pontos inválidos recebem -1 e NaN.
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=float))
+        lons = np.atleast_1d(np.asarray(lons, dtype=float))
+        k = max(1, int(k))
+        posicoes = np.full((len(lats), k), -1, dtype=np.int64)
+        distancias = np.full((len(lats), k), np.nan)
+        validos = ~np.isnan(lats) & ~np.isnan(lons)
+        k_real = min(k, len(self))
+        if not validos.any() or k_real == 0:
+            return posicoes, distancias
+
+        if self._arvore is not None:
+            _, pos = self._arvore.query(_xyz(lats[validos], lons[validos]), k=k_real)
+            pos = np.asarray(pos, dtype=np.int64).reshape(-1, k_real)
+        else:
+            pos = np.stack([self._proximas_na_faixa(la, lo, k_real)
+                            for la, lo in zip(lats[validos], lons[validos])])
+        posicoes[validos, :k_real] = pos
+        distancias[validos, :k_real] = distancia_km(lats[validos, None], lons[validos, None],
+                                                    self.lat[pos], self.lon[pos])
+        return posicoes, distancias
+
+    def _proximas_na_faixa(self, lat, lon, k):
+        """
+        Sem SciPy: examina só as torres com latitude em [lat - d, lat + d]
+        (duas buscas binárias), dobrando d até que a k-ésima mais próxima esteja
+        a no máximo d graus de latitude. Nenhuma torre fora da faixa pode estar
+        mais perto que isso, então o resultado é exato.
+        """
+        n = len(self.lat)
+        d = FAIXA_INICIAL_GRAUS
+        while True:
+            a = int(np.searchsorted(self.lat, lat - d, side="left"))
+            b = int(np.searchsorted(self.lat, lat + d, side="right"))
+            tudo = a == 0 and b == n
+            if b - a >= k:
+                dist = distancia_km(lat, lon, self.lat[a:b], self.lon[a:b])
+                melhores = np.argpartition(dist, k - 1)[:k]
+                melhores = melhores[np.argsort(dist[melhores], kind="stable")]
+                if tudo or dist[melhores[-1]] <= d * KM_POR_GRAU:
+                    return a + melhores
+            d *= 2
+
+    def proximas(self, lat, lon, k=1):
+        """DataFrame com as k torres mais próximas de um ponto: LT, Torre, KM, coordenadas e distância."""
+        posicoes, distancias = self.proximas_lote([lat], [lon], k)
+        return self.tabela(posicoes[0], distancias[0])
+
+    def tabela(self, posicoes, distancias=None):
+        """DataFrame das torres nas posições informadas (posições -1 são descartadas)."""
+        posicoes = np.asarray(posicoes, dtype=np.int64).ravel()
+        achadas = posicoes >= 0
+        tabela = pd.DataFrame({
+            "LT": self.lt[posicoes[achadas]],
+            "Torre": self.torre[posicoes[achadas]],
+            "KM": self.km[posicoes[achadas]],
+            "Latitude": self.lat[posicoes[achadas]],
+            "Longitude": self.lon[posicoes[achadas]],
+        })
+        if distancias is not None:
+            tabela["Distância (km)"] = np.asarray(distancias, dtype=float).ravel()[achadas]
+        return tabela
+
+
+@st.cache_resource(max_entries=4)
+def _indice_espacial_compartilhado(fingerprint, lts, _workbook):
+    return IndiceEspacial.construir(_workbook, lts)
+
+
+def indice_espacial(workbook, lts):
+    """
+    Índice espacial das torres das LTs informadas, montado uma vez por
+    conteúdo da planilha (fingerprint) e compartilhado entre sessões.
+    """
+    return _indice_espacial_compartilhado(workbook.fingerprint, tuple(lts), workbook)
@@ -0,0 +1,297 @@
+"""
+Base local (SQLite, arquivo único, sem servidor) com desligamentos e medições
+de resistência de aterramento, indexada pelas colunas usadas nos filtros das
+abas de análises e de aterramento. As torres continuam no Localizador de Vão:
+a aba de localização consulta o índice em memória (IndiceTorres), montado uma
+vez por planilha e compartilhado entre sessões. Cada importação fica marcada com a impressão
+digital da planilha de origem ('fonte'), então sessões com arquivos
+diferentes (upload x padrão) não se misturam.
+
+Importação única a partir das planilhas existentes:
+    python -m modules.store --desligamentos "Desligamentos forçados Taesa.xlsx" \\
+        --resistencias "Controle Resistência Aterramento.xlsx"
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import date, datetime, time
+
+import pandas as pd
+
+from modules.codebook import categorizar
+from modules.concorrencia import trava_arquivo
+from modules.data_loader import fingerprint_source, read_sheet_cached, sheet_names_cached
+
+DB_PATH = os.environ.get("LOCALIZADOR_DB", "localizador.sqlite")
+# Quantas importações (fontes) de cada tabela ficam guardadas
+FONTES_MANTIDAS = 3
+
+# Cabeçalho padronizado da aba 'LT Torre' do controle de aterramento
+COLUNAS_RESISTENCIA = ['ID', 'Linha de Transmissão', 'Número Operação', 'Tipo de Torre', 'Fase de Aterramento',
+                       'Data da medição da resistência do aterramento',
+                       'Última Medição Resistência de aterramento (Ω)', 'Supervisor', 'Melhoria Aterramento',
+                       'Data Medição', 'Medição Paralelo Antes (Ω)', 'Medição Paralelo Depois (Ω)',
+                       'Medição Oposto Antes (Ω)', 'Medição Oposto Depois (Ω)', 'Fases Implementadas']
+COLUNA_RESISTENCIA = 'Última Medição Resistência de aterramento (Ω)'
+
+
+# Índices por tabela (sempre precedidos de 'fonte')
+INDICES = {
+    'desligamentos': [['Concessão'], ['Ano'], ['FT'], ['Causa'], ['Torre'], ['Concessão', 'Ano']],
+    'resistencias': [['Linha de Transmissão'], ['Número Operação'], [COLUNA_RESISTENCIA]],
+}
+
+
+def _q(nome):
+    """Identificador SQL entre aspas (as colunas têm acento e espaço)."""
+    return '"' + str(nome).replace('"', '""') + '"'
+
+
+@contextmanager
+def conectar(db_path=None):
+    """Conexão curta (uma por chamada): sqlite3 não compartilha conexões entre as threads do Streamlit."""
+    con = sqlite3.connect(db_path or DB_PATH, timeout=30)
+    try:
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("""CREATE TABLE IF NOT EXISTS importacoes (
+                           tabela TEXT, fonte TEXT, origem TEXT, linhas INTEGER, importado_em TEXT,
+                           PRIMARY KEY (tabela, fonte))""")
+        yield con
+        con.commit()
+    finally:
+        con.close()
+
+
+def _existe_tabela(con, tabela):
+    return con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (tabela,)).fetchone() is not None
+
+
+def _colunas_tabela(con, tabela):
+    return [linha[1] for linha in con.execute(f"PRAGMA table_info({_q(tabela)})")]
+
+
+def _para_sql(df):
+    """Converte tipos que o sqlite3 não aceita (date/time/category) em texto ISO ou objeto simples."""
+    df = df.copy()
+    df.columns = [str(c) for c in df.columns]
+    for coluna in df.columns:
+        serie = df[coluna]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            serie = serie.astype(object)
+        if serie.dtype == object:
+            serie = serie.map(lambda v: v.isoformat() if isinstance(v, (date, datetime, time)) else v)
+        df[coluna] = serie
+    return df
+
+
+def ja_importada(tabela, fonte, db_path=None):
+    with conectar(db_path) as con:
+        return con.execute("SELECT 1 FROM importacoes WHERE tabela=? AND fonte=?", (tabela, fonte)).fetchone() is not None
+
+
+def _importar(tabela, df, fonte, origem, db_path=None):
+    """Grava df como a fonte indicada da tabela (substitui a mesma fonte) e poda as fontes antigas."""
+    df = _para_sql(df)
+    df.insert(0, "fonte", fonte)
+    db_path = db_path or DB_PATH
+    with trava_arquivo(db_path), conectar(db_path) as con:
+        if _existe_tabela(con, tabela):
+            # colunas novas na planilha: acrescenta na tabela em vez de recriar
+            existentes = set(_colunas_tabela(con, tabela))
+            for coluna in df.columns:
+                if coluna not in existentes:
+                    con.execute(f"ALTER TABLE {_q(tabela)} ADD COLUMN {_q(coluna)}")
+            con.execute(f"DELETE FROM {_q(tabela)} WHERE fonte=?", (fonte,))
+        df.to_sql(tabela, con, if_exists="append", index=False, chunksize=5000)
+        indices = set()
+        for colunas in INDICES.get(tabela, []):
+            if all(c in df.columns for c in colunas):
+                nome = _nome_indice(tabela, colunas)
+                indices.add(nome)
+                con.execute(f"CREATE INDEX IF NOT EXISTS {_q(nome)} ON {_q(tabela)} "
+                            f"(fonte, {', '.join(_q(c) for c in colunas)})")
+        # índices com nomes de versões anteriores (hash() muda a cada processo) ficariam duplicados
+        for (nome,) in con.execute("SELECT name FROM sqlite_master WHERE type='index' AND tbl_name=? "
+                                   "AND name LIKE ?", (tabela, f"ix_{tabela}_%")).fetchall():
+            if nome not in indices:
+                con.execute(f"DROP INDEX IF EXISTS {_q(nome)}")
+        con.execute("INSERT OR REPLACE INTO importacoes VALUES (?, ?, ?, ?, ?)",
+                    (tabela, fonte, str(origem), len(df), datetime.now().isoformat(timespec="seconds")))
+        antigas = [linha[0] for linha in con.execute(
+            "SELECT fonte FROM importacoes WHERE tabela=? ORDER BY importado_em DESC, rowid DESC LIMIT -1 OFFSET ?",
+            (tabela, FONTES_MANTIDAS))]
+        for antiga in antigas:
+            con.execute(f"DELETE FROM {_q(tabela)} WHERE fonte=?", (antiga,))
+            con.execute("DELETE FROM importacoes WHERE tabela=? AND fonte=?", (tabela, antiga))
+    return fonte
+
+
+def _nome_indice(tabela, colunas):
+    """Nome estável do índice (as colunas têm acentos e espaços): digest das colunas, igual em todo processo."""
+    digest = hashlib.sha1("\x1f".join(colunas).encode("utf-8")).hexdigest()[:12]
+    return f"ix_{tabela}_{digest}"
+
+
+def _origem(path_or_buffer):
+    return path_or_buffer if isinstance(path_or_buffer, str) else getattr(path_or_buffer, "name", "upload")
+
+
+def importar_desligamentos(path_or_buffer, db_path=None):
+    """Importa a base consolidada (primeira aba) se essa versão ainda não estiver no banco. Retorna a fonte."""
+    fonte = fingerprint_source(path_or_buffer)
+    if ja_importada("desligamentos", fonte, db_path):
+        return fonte
+    df = read_sheet_cached(path_or_buffer, sheet_names_cached(path_or_buffer)[0])
+    if 'Data' in df.columns:
+        df['Data'] = pd.to_datetime(df['Data'], errors='coerce')
+        if 'Ano' not in df.columns:
+            df['Ano'] = df['Data'].dt.year.astype('Int64')
+    return _importar("desligamentos", df, fonte, _origem(path_or_buffer), db_path)
+
+
+def importar_resistencias(path_or_buffer, db_path=None):
+    """Importa a aba 'LT Torre' do controle de aterramento (cabeçalho padronizado). Retorna a fonte."""
+    fonte = fingerprint_source(path_or_buffer)
+    if ja_importada("resistencias", fonte, db_path):
+        return fonte
+    abas = sheet_names_cached(path_or_buffer)
+    df = read_sheet_cached(path_or_buffer, 'LT Torre' if 'LT Torre' in abas else abas[0])
+    if len(df.columns) == len(COLUNAS_RESISTENCIA):
+        df.columns = COLUNAS_RESISTENCIA
+    if COLUNA_RESISTENCIA in df.columns:
+        df[COLUNA_RESISTENCIA] = pd.to_numeric(df[COLUNA_RESISTENCIA], errors='coerce')
+    return _importar("resistencias", df, fonte, _origem(path_or_buffer), db_path)
+
+
+def importar_planilhas(desligamentos=None, resistencias=None, db_path=None):
+    """Importação única das planilhas informadas; retorna {tabela: fonte}."""
+    fontes = {}
+    if desligamentos is not None:
+        fontes["desligamentos"] = importar_desligamentos(desligamentos, db_path)
+    if resistencias is not None:
+        fontes["resistencias"] = importar_resistencias(resistencias, db_path)
+    return fontes
+
+
+def fonte_recente(tabela, db_path=None):
+    """Fonte importada mais recentemente para a tabela, ou None."""
+    with conectar(db_path) as con:
+        linha = con.execute("SELECT fonte FROM importacoes WHERE tabela=? ORDER BY importado_em DESC, rowid DESC LIMIT 1",
+                            (tabela,)).fetchone()
+    return linha[0] if linha else None
+
+
+def _where(fonte, filtros, entre):
+    """
+    Cláusula WHERE parametrizada. filtros: {coluna: valor ou lista de valores};
+    entre: {coluna: (mínimo, máximo)}, com None para aberto.
+    """
+    condicoes, parametros = ["fonte = ?"], [fonte]
+    for coluna, valor in (filtros or {}).items():
+        if valor is None:
+            continue
+        if isinstance(valor, (list, tuple, set, pd.Index)):
+            valores = list(valor)
+            condicoes.append(f"{_q(coluna)} IN ({', '.join('?' * len(valores))})" if valores else "0")
+            parametros.extend(valores)
+        else:
+            condicoes.append(f"{_q(coluna)} = ?")
+            parametros.append(valor)
+    for coluna, (minimo, maximo) in (entre or {}).items():
+        if minimo is not None:
+            condicoes.append(f"{_q(coluna)} >= ?")
+            parametros.append(minimo)
+        if maximo is not None:
+            condicoes.append(f"{_q(coluna)} <= ?")
+            parametros.append(maximo)
+    return " AND ".join(condicoes), parametros
+
+
+def consultar(tabela, fonte=None, filtros=None, entre=None, colunas=None, db_path=None):
+    """SELECT com os filtros aplicados no banco (usando os índices); retorna DataFrame sem a coluna fonte."""
+    fonte = fonte or fonte_recente(tabela, db_path)
+    if fonte is None:
+        return pd.DataFrame()
+    where, parametros = _where(fonte, filtros, entre)
+    with conectar(db_path) as con:
+        if not _existe_tabela(con, tabela):
+            return pd.DataFrame()
+        selecao = ", ".join(_q(c) for c in colunas) if colunas else "*"
+        df = pd.read_sql_query(f"SELECT {selecao} FROM {_q(tabela)} WHERE {where} ORDER BY rowid", con,
+                               params=parametros)
+    return df.drop(columns=["fonte"], errors="ignore")
+
+
+def valores_distintos(tabela, coluna, fonte=None, filtros=None, db_path=None):
+    """Valores distintos (não nulos, ordenados) de uma coluna, respeitando os filtros."""
+    fonte = fonte or fonte_recente(tabela, db_path)
+    if fonte is None:
+        return []
+    where, parametros = _where(fonte, filtros, None)
+    with conectar(db_path) as con:
+        linhas = con.execute(f"SELECT DISTINCT {_q(coluna)} FROM {_q(tabela)} "
+                             f"WHERE {where} AND {_q(coluna)} IS NOT NULL ORDER BY 1", parametros).fetchall()
+    return [linha[0] for linha in linhas]
+
+
+def contar_por(tabela, coluna, fonte=None, filtros=None, entre=None, db_path=None):
+    """Contagem por valor (GROUP BY no banco), em ordem decrescente como value_counts."""
+    fonte = fonte or fonte_recente(tabela, db_path)
+    if fonte is None:
+        return pd.Series(dtype="int64", name="count")
+    where, parametros = _where(fonte, filtros, entre)
+    with conectar(db_path) as con:
+        df = pd.read_sql_query(f"SELECT {_q(coluna)} AS valor, COUNT(*) AS n FROM {_q(tabela)} WHERE {where} "
+                               f"AND {_q(coluna)} IS NOT NULL GROUP BY 1 ORDER BY 2 DESC", con, params=parametros)
+    return pd.Series(df["n"].to_numpy(), index=pd.Index(df["valor"], name=coluna), name="count")
+
+
+def faixa(tabela, coluna, fonte=None, filtros=None, db_path=None):
+    """(mínimo, máximo) de uma coluna numérica com os filtros aplicados; (None, None) se vazio."""
+    fonte = fonte or fonte_recente(tabela, db_path)
+    if fonte is None:
+        return None, None
+    where, parametros = _where(fonte, filtros, None)
+    with conectar(db_path) as con:
+        return con.execute(f"SELECT MIN({_q(coluna)}), MAX({_q(coluna)}) FROM {_q(tabela)} WHERE {where}",
+                           parametros).fetchone()
+
+
+def consultar_desligamentos(fonte=None, filtros=None, db_path=None):
+    """Desligamentos filtrados no banco, com Data em datetime e Causa/FT/Fase como category."""
+    df = consultar("desligamentos", fonte, filtros, db_path=db_path)
+    if df.empty:
+        return df
+    if 'Data' in df.columns:
+        df['Data'] = pd.to_datetime(df['Data'], errors='coerce')
+    # o banco guarda a base já normalizada: só converte para category
+    df, _ = categorizar(df)
+    return df
+
+
+def consultar_resistencias(fonte=None, lt=None, resistencia=None, db_path=None):
+    """Medições de aterramento filtradas por LT e faixa de resistência (mínimo, máximo)."""
+    filtros = {'Linha de Transmissão': lt} if lt is not None else None
+    entre = {COLUNA_RESISTENCIA: resistencia} if resistencia is not None else None
+    return consultar("resistencias", fonte, filtros, entre, db_path=db_path)
+
+
+def main(argv=None):
+    """Importação pela linha de comando; retorna {tabela: linhas importadas} para o resumo impresso."""
+    parser = argparse.ArgumentParser(description="Importa as planilhas para a base local SQLite.")
+    parser.add_argument("--desligamentos", help="base consolidada de desligamentos (.xlsx)")
+    parser.add_argument("--resistencias", help="controle de resistência de aterramento (.xlsx)")
+    parser.add_argument("--db", default=None, help=f"arquivo do banco (padrão: {DB_PATH})")
+    args = parser.parse_args(argv)
+    fontes = importar_planilhas(args.desligamentos, args.resistencias, db_path=args.db)
+    with conectar(args.db) as con:
+        return {tabela: (con.execute("SELECT linhas FROM importacoes WHERE tabela=? AND fonte=?",
+                                     (tabela, fonte)).fetchone() or (0,))[0]
+                for tabela, fonte in fontes.items()}
+
+
+if __name__ == "__main__":
+    for tabela, linhas in main().items():
+        print(f"{tabela}: {linhas} linhas")
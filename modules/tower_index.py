@@ -0,0 +1,237 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from modules.km_utils import indice_proxima_torre, localizar_km
+
+
+def _normalizar_aba_lt(df_lt):
+    """
+    Mesma preparação que a aba de localização fazia a cada clique: nomes de
+    coluna minúsculos sem espaço, KM numérico sem vazios e em ordem.
+    Retorna (km, descrição, fases) ou levanta ValueError com o motivo.
+    """
+    df_lt = df_lt.copy()
+    df_lt.columns = [str(c).strip().lower().replace(' ', '') for c in df_lt.columns]
+    if "km" not in df_lt.columns or "fases" not in df_lt.columns:
+        raise ValueError("Colunas esperadas (KM e FASES) não encontradas")
+    if len(df_lt.columns) < 4:
+        raise ValueError("a aba deve ter pelo menos 4 colunas (A, B, C, D) para ler a descrição na Coluna D")
+
+    desc_col = df_lt.columns[3]
+    km = pd.to_numeric(df_lt["km"], errors="coerce").to_numpy(dtype=float)
+    validos = ~np.isnan(km)
+    ordem = np.argsort(km[validos], kind="stable")
+    return (km[validos][ordem],
+            df_lt[desc_col].to_numpy(dtype=object)[validos][ordem],
+            df_lt["fases"].to_numpy(dtype=object)[validos][ordem])
+
+
+class IndiceTorres:
+    """
+    Índice de KM de todas as LTs de um Localizador, montado uma vez por
+    planilha: arrays concatenados (km float64 ordenado por LT, descrição e
+    código de fases) e offsets por LT. A LT i ocupa [offsets[i], offsets[i+1]);
+    qualquer consulta (LT, km) é uma fatia mais uma busca binária.
+    Posições devolvidas pelos métodos são locais à LT (0 = primeira torre).
+    """
+
+    def __init__(self, lts, offsets, km, descricao, fases, ignoradas=None):
+        self.lts = list(lts)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.km = np.asarray(km, dtype=np.float64)
+        self.descricao = np.asarray(descricao, dtype=object)
+        self.fases = np.asarray(fases, dtype=object)
+        # LT -> motivo, para abas que não puderam ser indexadas
+        self.ignoradas = dict(ignoradas or {})
+        self._posicao = {lt: i for i, lt in enumerate(self.lts)}
+        self._chave = None
+        # o índice é compartilhado entre sessões: ninguém deve alterá-lo
+        for array in (self.offsets, self.km, self.descricao, self.fases):
+            array.flags.writeable = False
+
+    @classmethod
+    def construir(cls, workbook, lts, usecols="A:E"):
+        """Monta o índice a partir das abas de LT de um Workbook (ver data_loader.open_workbook)."""
+        lts_ok, kms, descricoes, fases, ignoradas = [], [], [], [], {}
+        for lt in lts:
+            if lt not in workbook:
+                ignoradas[lt] = "aba não encontrada"
+                continue
+            try:
+                km, descricao, fase = _normalizar_aba_lt(workbook.sheet(lt, usecols=usecols))
+            except ValueError as e:
+                ignoradas[lt] = str(e)
+                continue
+            lts_ok.append(lt)
+            kms.append(km)
+            descricoes.append(descricao)
+            fases.append(fase)
+        tamanhos = [len(k) for k in kms]
+        offsets = np.concatenate([[0], np.cumsum(tamanhos, dtype=np.int64)])
+        juntar = lambda partes, dtype: np.concatenate(partes) if partes else np.empty(0, dtype=dtype)
+        return cls(lts_ok, offsets, juntar(kms, float), juntar(descricoes, object), juntar(fases, object), ignoradas)
+
+    def __contains__(self, lt):
+        return lt in self._posicao
+
+    def __len__(self):
+        return len(self.km)
+
+    def _fatia(self, lt):
+        i = self._posicao[lt]
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def km_da_lt(self, lt):
+        """KMs (ordenados, somente leitura) das torres da LT."""
+        return self.km[self._fatia(lt)]
+
+    def fases_da_lt(self, lt):
+        """Código de fases (texto da coluna FASES) de cada torre da LT, na ordem de KM."""
+        return self.fases[self._fatia(lt)]
+
+    def quantidade(self, lt):
+        i = self._posicao[lt]
+        return int(self.offsets[i + 1] - self.offsets[i])
+
+    def proxima_torre(self, lt, km_alvo):
+        """Posição da primeira torre com KM >= km_alvo, ou None se o KM passa do fim da LT."""
+        return indice_proxima_torre(self.km_da_lt(lt), km_alvo)
+
+    def faixa_km(self, lt, km_min, km_max):
+        """
+        Posições [inicio, fim) das torres da LT com KM em [km_min, km_max]
+        (duas buscas binárias); inicio == fim quando nenhuma torre cai na faixa.
+        """
+        km = self.km_da_lt(lt)
+        inicio = int(np.searchsorted(km, km_min, side="left"))
+        fim = int(np.searchsorted(km, km_max, side="right"))
+        return inicio, max(inicio, fim)
+
+    def torres_na_faixa(self, lt, km_min, km_max):
+        """DataFrame (km, descricao, fases) de todas as torres da LT com KM em [km_min, km_max]."""
+        inicio, fim = self.faixa_km(lt, km_min, km_max)
+        return self.janela(lt, inicio, fim - 1)
+
+    def localizar(self, lt, km_alvos):
+        """(anterior, posterior, fracao) de cada KM dentro da LT (ver km_utils.localizar_km)."""
+        return localizar_km(km_alvos, self.km_da_lt(lt))
+
+    def localizar_lote(self, lts, km_alvos):
+        """
+        Localiza vários eventos de LTs diferentes numa única busca binária.
+        lts e km_alvos têm o mesmo tamanho; retorna (anterior, posterior, fracao)
+        com posições globais nos arrays do índice (-1 e NaN para LT não
+        indexada, KM vazio ou fora da LT). Mesmas regras de km_utils.localizar_km.
+        """
+        km = np.asarray(km_alvos, dtype=float)
+        pos_lt = pd.Index(self.lts, dtype=object).get_indexer(pd.Index(lts, dtype=object))
+        anterior = np.full(km.shape, -1, dtype=np.int64)
+        posterior = np.full(km.shape, -1, dtype=np.int64)
+        fracao = np.full(km.shape, np.nan)
+        conhecidas = (pos_lt >= 0) & ~np.isnan(km)
+        if not conhecidas.any() or not len(self.km):
+            return anterior, posterior, fracao
+
+        # cada LT ganha um deslocamento maior que qualquer KM: o array concatenado
+        # fica globalmente ordenado e uma busca resolve todos os eventos
+        chave_torres, passo, km_min = self._chave_global()
+        inicio = self.offsets[pos_lt[conhecidas]]
+        fim = self.offsets[pos_lt[conhecidas] + 1]
+        alvo = km[conhecidas]
+        j = np.searchsorted(chave_torres, alvo - km_min + pos_lt[conhecidas] * passo, side="left")
+        # alvo exatamente na primeira torre da LT cai no primeiro vão
+        no_inicio = (j == inicio) & (fim - inicio >= 2) & (alvo == self.km[np.minimum(inicio, len(self.km) - 1)])
+        j = np.where(no_inicio, inicio + 1, j)
+        validos = (j > inicio) & (j < fim)
+
+        j = j[validos]
+        km_ant = self.km[j - 1]
+        vao = self.km[j] - km_ant
+        linhas = np.flatnonzero(conhecidas)[validos]
+        anterior[linhas] = j - 1
+        posterior[linhas] = j
+        with np.errstate(invalid="ignore", divide="ignore"):
+            fracao[linhas] = np.where(vao > 0, (alvo[validos] - km_ant) / vao, 0.0)
+        return anterior, posterior, fracao
+
+    def faixa_km_lote(self, lts, km_min, km_max):
+        """
+        Versão em lote de faixa_km com posições globais: duas buscas binárias
+        para todos os eventos. Retorna (inicio, fim); fim - inicio é o número de
+        torres candidatas (0 para LT não indexada ou faixa vazia).
+        """
+        km_min = np.asarray(km_min, dtype=float)
+        km_max = np.asarray(km_max, dtype=float)
+        pos_lt = pd.Index(self.lts, dtype=object).get_indexer(pd.Index(lts, dtype=object))
+        inicio = np.zeros(km_min.shape, dtype=np.int64)
+        fim = np.zeros(km_min.shape, dtype=np.int64)
+        validos = (pos_lt >= 0) & ~np.isnan(km_min) & ~np.isnan(km_max)
+        if not validos.any() or not len(self.km):
+            return inicio, fim
+
+        chave_torres, passo, km_min_global = self._chave_global()
+        deslocamento = pos_lt[validos] * passo - km_min_global
+        primeiro = self.offsets[pos_lt[validos]]
+        ultimo = self.offsets[pos_lt[validos] + 1]
+        a = np.clip(np.searchsorted(chave_torres, km_min[validos] + deslocamento, side="left"), primeiro, ultimo)
+        b = np.clip(np.searchsorted(chave_torres, km_max[validos] + deslocamento, side="right"), primeiro, ultimo)
+        inicio[validos] = a
+        fim[validos] = np.maximum(a, b)
+        return inicio, fim
+
+    def _chave_global(self):
+        if self._chave is None:
+            km_min = float(self.km.min())
+            passo = 2.0 * (float(self.km.max()) - km_min + 1.0)
+            tamanhos = np.diff(self.offsets)
+            chave = self.km - km_min + np.repeat(np.arange(len(self.lts)) * passo, tamanhos)
+            chave.flags.writeable = False
+            self._chave = (chave, passo, km_min)
+        return self._chave
+
+    def lt_da_posicao(self, posicoes):
+        """Nome da LT de cada posição global (-1 vira None)."""
+        posicoes = np.asarray(posicoes, dtype=np.int64)
+        i = np.searchsorted(self.offsets, posicoes, side="right") - 1
+        nomes = np.asarray(self.lts + [None], dtype=object)
+        return nomes[np.where(posicoes >= 0, i, len(self.lts))]
+
+    def janela(self, lt, inicio, fim):
+        """DataFrame (km, descricao, fases) das torres nas posições inicio..fim (inclusive)."""
+        fatia = self._fatia(lt)
+        inicio = max(0, int(inicio))
+        fim = min(fatia.stop - fatia.start - 1, int(fim))
+        base = fatia.start
+        return pd.DataFrame({
+            "km": self.km[base + inicio:base + fim + 1],
+            "descricao": self.descricao[base + inicio:base + fim + 1],
+            "fases": self.fases[base + inicio:base + fim + 1],
+        }, index=pd.RangeIndex(inicio, fim + 1))
+
+    def tabela(self, lt):
+        """Todas as torres da LT como DataFrame (km, descricao, fases)."""
+        return self.janela(lt, 0, self.quantidade(lt) - 1)
+
+
+def abas_lt(workbook, lts_dados=()):
+    """
+    Abas de LT do Localizador: as listadas na DADOS que existem na planilha,
+    na ordem da DADOS, mais as abas 'LT ...' que a DADOS não lista (ex.: a
+    DADOS traz 'LT GUMI2', sem aba, e não traz a aba 'LT GUMC2').
+    """
+    listadas = [lt for lt in dict.fromkeys(str(lt).strip() for lt in lts_dados) if lt in workbook]
+    return listadas + [aba for aba in workbook.sheet_names if aba.startswith("LT ") and aba not in listadas]
+
+
+@st.cache_resource(max_entries=4)
+def _indice_compartilhado(fingerprint, lts, _workbook):
+    return IndiceTorres.construir(_workbook, lts)
+
+
+def indice_torres(workbook, lts):
+    """
+    Índice de torres das LTs informadas, montado uma vez por conteúdo da
+    planilha (fingerprint) e compartilhado por todas as sessões do processo.
+    """
+    return _indice_compartilhado(workbook.fingerprint, tuple(lts), workbook)
@@ -0,0 +1,157 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+FASES = "ABC"
+# Posição física do condutor: 1 = superior, 2 = meio, 3 = inferior (0 = desconhecida)
+NOMES_POSICAO = {0: "desconhecida", 1: "superior", 2: "meio", 3: "inferior"}
+
+
+def _sequencia_real(codigos, mapa_codigos):
+    """Sequência de fases de cada torre: o próprio texto ou, se for código mapeado (Torres JBJU), a sequência dele."""
+    texto = pd.Series(codigos, dtype=object).fillna("").astype(str).str.strip().str.upper()
+    if mapa_codigos:
+        texto = texto.map(lambda c: mapa_codigos.get(c, c))
+    return texto.to_numpy(dtype=object)
+
+
+def _posicoes(sequencias):
+    """Array (n, 3) com a posição de A, B e C em cada sequência de 3 letras (0 se inválida)."""
+    posicoes = np.zeros((len(sequencias), 3), dtype=np.int8)
+    for i, seq in enumerate(sequencias):
+        if len(seq) == 3 and sorted(seq) == list(FASES):
+            for posicao, fase in enumerate(seq, start=1):
+                posicoes[i, FASES.index(fase)] = posicao
+    return posicoes
+
+
+class TabelaTransposicao:
+    """
+    Trechos de transposição de todas as LTs: cada trecho vai do KM da torre
+    onde a sequência de fases muda até a torre da próxima mudança, com a
+    posição física de A, B e C. Trechos de todas as LTs ficam concatenados
+    (ordenados por KM dentro de cada LT) com offsets por LT, como no
+    IndiceTorres; a fase numa posição (LT, km) é uma busca binária.
+    """
+
+    def __init__(self, lts, offsets, km_inicio, km_fim, sequencia, posicoes):
+        self.lts = list(lts)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.km_inicio = np.asarray(km_inicio, dtype=np.float64)
+        self.km_fim = np.asarray(km_fim, dtype=np.float64)
+        self.sequencia = np.asarray(sequencia, dtype=object)
+        self.posicoes = np.asarray(posicoes, dtype=np.int8).reshape(-1, 3)
+        self._posicao_lt = {lt: i for i, lt in enumerate(self.lts)}
+        for array in (self.offsets, self.km_inicio, self.km_fim, self.sequencia, self.posicoes):
+            array.flags.writeable = False
+
+    @classmethod
+    def construir(cls, indice, codigos_por_lt=None):
+        """
+        Monta a tabela a partir de um IndiceTorres. codigos_por_lt: {LT: {código: sequência}}
+        para LTs cujas torres trazem códigos em vez da sequência (ex.: Torres JBJU da BRASNORTE).
+        """
+        codigos_por_lt = codigos_por_lt or {}
+        inicios, fins, sequencias, tamanhos = [], [], [], []
+        for lt in indice.lts:
+            km = indice.km_da_lt(lt)
+            seq = _sequencia_real(indice.fases_da_lt(lt), codigos_por_lt.get(lt))
+            if len(km) == 0:
+                tamanhos.append(0)
+                continue
+            # uma nova linha da tabela a cada mudança de sequência (run-length)
+            mudou = np.ones(len(seq), dtype=bool)
+            mudou[1:] = seq[1:] != seq[:-1]
+            pos = np.flatnonzero(mudou)
+            inicios.append(km[pos])
+            fins.append(np.append(km[pos[1:]], km[-1]))
+            sequencias.append(seq[pos])
+            tamanhos.append(len(pos))
+        offsets = np.concatenate([[0], np.cumsum(tamanhos, dtype=np.int64)])
+        juntar = lambda partes, dtype: np.concatenate(partes) if partes else np.empty(0, dtype=dtype)
+        sequencia = juntar(sequencias, object)
+        return cls(indice.lts, offsets, juntar(inicios, float), juntar(fins, float), sequencia, _posicoes(sequencia))
+
+    def __contains__(self, lt):
+        return lt in self._posicao_lt
+
+    def trechos(self, lt):
+        """DataFrame com os trechos da LT: km inicial/final, sequência e posição de A, B e C."""
+        i = self._posicao_lt[lt]
+        fatia = slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+        return pd.DataFrame({
+            "KM Início": self.km_inicio[fatia],
+            "KM Fim": self.km_fim[fatia],
+            "Sequência": self.sequencia[fatia],
+            **{f"Posição {f}": self.posicoes[fatia, j] for j, f in enumerate(FASES)},
+        })
+
+    def trecho_lote(self, lts, km_alvos):
+        """
+        Índice global do trecho que contém cada (LT, km): o último trecho com
+        km_inicio <= km. -1 para LT desconhecida, KM vazio ou fora da LT.
+        """
+        km = np.asarray(km_alvos, dtype=float)
+        pos_lt = pd.Index(self.lts, dtype=object).get_indexer(pd.Index(lts, dtype=object))
+        trecho = np.full(km.shape, -1, dtype=np.int64)
+        for i in np.unique(pos_lt[pos_lt >= 0]):
+            inicio, fim = int(self.offsets[i]), int(self.offsets[i + 1])
+            if fim == inicio:
+                continue
+            linhas = np.flatnonzero((pos_lt == i) & ~np.isnan(km))
+            alvo = km[linhas]
+            j = np.searchsorted(self.km_inicio[inicio:fim], alvo, side="right") - 1
+            dentro = (j >= 0) & (alvo <= self.km_fim[fim - 1])
+            trecho[linhas[dentro]] = inicio + j[dentro]
+        return trecho
+
+    def posicao_lote(self, lts, km_alvos, fases):
+        """
+        Posição física (1 superior, 2 meio, 3 inferior; 0 desconhecida) da fase
+        informada ('A', 'B', 'C' ou códigos como 'AG'/'AN', vale a 1ª letra de fase)
+        em cada (LT, km). Retorna (posicao, sequencia no trecho).
+        """
+        trecho = self.trecho_lote(lts, km_alvos)
+        letras = pd.Series(fases, dtype=object).fillna("").astype(str).str.upper().str.extract(r"([ABC])")[0]
+        coluna = letras.map({f: j for j, f in enumerate(FASES)}).fillna(-1).astype(int).to_numpy()
+        validos = (trecho >= 0) & (coluna >= 0)
+        posicao = np.zeros(len(trecho), dtype=np.int8)
+        posicao[validos] = self.posicoes[trecho[validos], coluna[validos]]
+        sequencia = np.full(len(trecho), None, dtype=object)
+        sequencia[trecho >= 0] = self.sequencia[trecho[trecho >= 0]]
+        return posicao, sequencia
+
+    def posicao(self, lt, km, fase):
+        """Versão de um evento de posicao_lote: (posição, sequência)."""
+        posicao, sequencia = self.posicao_lote([lt], [km], [fase])
+        return int(posicao[0]), sequencia[0]
+
+
+def codigos_transposicao(df_dados, df_jbju):
+    """
+    {LT: {código da torre: sequência}} para as LTs da BRASNORTE, cuja coluna
+    FASES traz o código da torre da aba 'Torres JBJU' (coluna A -> sequência
+    na coluna C). df_dados é a aba DADOS (colunas CONCESSÕES e LT).
+    """
+    if df_jbju is None or len(df_jbju.columns) < 3 or not {"CONCESSÕES", "LT"} <= set(df_dados.columns):
+        return {}
+    codigos = dict(zip(df_jbju.iloc[:, 0].fillna("").astype(str).str.strip().str.upper(),
+                       df_jbju.iloc[:, 2].fillna("").astype(str).str.strip().str.upper()))
+    concessoes = df_dados["CONCESSÕES"].astype(str).str.strip()
+    lts = df_dados.loc[concessoes == "BRASNORTE", "LT"].dropna().astype(str).str.strip().unique()
+    return {lt: codigos for lt in lts}
+
+
+@st.cache_resource(max_entries=4)
+def _tabela_compartilhada(fingerprint, lts, _indice, _codigos_por_lt, chave_codigos):
+    return TabelaTransposicao.construir(_indice, _codigos_por_lt)
+
+
+def tabela_transposicao(workbook, indice, codigos_por_lt=None):
+    """
+    Tabela de transposição do índice de torres, montada uma vez por planilha
+    (e por conjunto de LTs com códigos) e compartilhada entre sessões.
+    """
+    codigos_por_lt = codigos_por_lt or {}
+    chave_codigos = repr(sorted((lt, sorted(m.items())) for lt, m in codigos_por_lt.items()))
+    return _tabela_compartilhada(workbook.fingerprint, tuple(indice.lts), indice, codigos_por_lt, chave_codigos)
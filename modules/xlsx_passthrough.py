@@ -0,0 +1,461 @@
+import math
+import os
+import posixpath
+import re
+import shutil
+import zipfile
+from datetime import date, datetime, time, timedelta
+from xml.sax.saxutils import escape, unescape
+
+import numpy as np
+import pandas as pd
+
+from modules.concorrencia import caminho_temporario, substituir_atomico
+from modules.data_loader import _sheet_parts_zip, iter_sheet_rows
+
+# Formatos numéricos nativos do Excel usados nas células de data/hora
+FMT_DATA = 14        # dd/mm/aaaa (conforme o idioma do Excel)
+FMT_HORA = 21        # hh:mm:ss
+FMT_DATA_HORA = 22   # dd/mm/aaaa hh:mm
+
+_LINHAS_POR_BLOCO = 1000
+_BLOCO_COPIA = 1 << 20
+
+# Caracteres de controle que não podem aparecer em XML 1.0
+_INVALIDOS_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_XF = re.compile(r"<xf\b[^>]*?(?:/>|>.*?</xf>)", re.S)
+_ROW_R = re.compile(rb'<row\b[^>]*?\br="(\d+)"')
+_REF = re.compile(r'\bref="([A-Z]+)(\d+):([A-Z]+)(\d+)"')
+# Elementos depois de <sheetData> que descrevem células dos dados antigos
+_CAUDA_INVALIDA = re.compile(r"<(sortState|mergeCells|hyperlinks)\b(?:[^>]*/>|.*?</\1>)", re.S)
+
+
+def _letra_coluna(indice):
+    """Índice 0-based -> letra da coluna (0 -> A, 26 -> AA)."""
+    letras = ""
+    indice += 1
+    while indice:
+        indice, resto = divmod(indice - 1, 26)
+        letras = chr(65 + resto) + letras
+    return letras
+
+
+def _copiar_parte(zin, zout, info, conteudo=None):
+    """Copia uma parte do zip (ou grava conteudo no lugar dela) mantendo nome, data e compressão."""
+    nova = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+    nova.compress_type = zipfile.ZIP_DEFLATED
+    nova.external_attr = info.external_attr
+    if conteudo is not None:
+        zout.writestr(nova, conteudo)
+        return
+    with zin.open(info) as origem, zout.open(nova, "w", force_zip64=True) as destino:
+        shutil.copyfileobj(origem, destino, _BLOCO_COPIA)
+
+
+def _rels_da_parte(parte):
+    pasta, nome = posixpath.split(parte)
+    return posixpath.join(pasta, "_rels", nome + ".rels")
+
+
+def _relacoes(rels_xml, parte, tipo):
+    """(elemento XML, Id, parte do zip) de cada relação interna de um .rels com o tipo indicado (ex.: 'table')."""
+    pasta = posixpath.dirname(parte)
+    relacoes = []
+    for rel in re.findall(r"<Relationship\b[^>]*/>", rels_xml):
+        tipo_rel = re.search(r'\bType="([^"]*)"', rel)
+        alvo = re.search(r'\bTarget="([^"]*)"', rel)
+        id_rel = re.search(r'\bId="([^"]*)"', rel)
+        if tipo_rel and alvo and tipo_rel.group(1).endswith("/" + tipo) and 'TargetMode="External"' not in rel:
+            caminho = alvo.group(1)
+            caminho = caminho.lstrip("/") if caminho.startswith("/") else posixpath.normpath(posixpath.join(pasta, caminho))
+            relacoes.append((rel, id_rel.group(1) if id_rel else None, caminho))
+    return relacoes
+
+
+def _alvos_rels(rels_xml, parte, tipo):
+    """Partes do zip referenciadas num .rels com o tipo de relação indicado (ex.: 'table')."""
+    return [caminho for _, _, caminho in _relacoes(rels_xml, parte, tipo)]
+
+
+def _numero_coluna(letras):
+    """Letra da coluna -> índice 0-based (A -> 0, AA -> 26)."""
+    numero = 0
+    for letra in letras:
+        numero = numero * 26 + ord(letra) - 64
+    return numero - 1
+
+
+def _estender_refs(xml, ultima, de=None):
+    """
+    Leva para a linha ultima o fim de cada intervalo ref="A1:C9" de xml;
+    com de, só os intervalos que terminam nessa linha (o fim dos dados antigos).
+    """
+    def novo(m):
+        if de is not None and int(m.group(4)) != de:
+            return m.group(0)
+        return f'ref="{m.group(1)}{m.group(2)}:{m.group(3)}{ultima}"'
+    return _REF.sub(novo, xml)
+
+
+def _estender_tabela(tabela_xml, ultima_antiga, ultima_nova):
+    """Tabela (ListObject) que terminava na última linha antiga, estendida até a nova (sem linha de totais)."""
+    if re.search(r'\btotalsRowCount="[1-9]', tabela_xml):
+        return tabela_xml
+    return _estender_refs(tabela_xml, ultima_nova, de=ultima_antiga)
+
+
+def _estender_cauda(cauda, ultima_antiga, ultima_nova):
+    """
+    Parte da aba depois de </sheetData> ao anexar linhas: o autofiltro que
+    terminava na última linha antiga passa a cobrir as novas (critérios
+    mantidos); o resto não muda.
+    """
+    return re.sub(r"<autoFilter\b(?:[^>]*/>|.*?</autoFilter>)",
+                  lambda m: _estender_refs(m.group(0), ultima_nova, de=ultima_antiga), cauda, flags=re.S)
+
+
+def _ajustar_tabela(tabela_xml, cabecalho, total_linhas):
+    """
+    XML de uma tabela (ListObject) da aba com o intervalo estendido até a
+    última linha nova, ou None se ela não cabe mais nos dados regenerados:
+    não começa na linha 1, tem linha de totais ou os nomes das colunas não
+    batem com o cabeçalho novo.
+    """
+    ref = _REF.search(tabela_xml)
+    if ref is None or ref.group(2) != "1" or re.search(r'\btotalsRowCount="[1-9]', tabela_xml):
+        return None
+    inicio, fim = _numero_coluna(ref.group(1)), _numero_coluna(ref.group(3))
+    nomes = [unescape(n, {"&quot;": '"', "&apos;": "'"})
+             for n in re.findall(r'<tableColumn\b[^>]*?\bname="([^"]*)"', tabela_xml)]
+    if nomes != [str(c) for c in cabecalho[inicio:fim + 1]]:
+        return None
+    # tabela precisa de ao menos uma linha de dados; todos os intervalos começam na linha 1
+    tabela_xml = _estender_refs(tabela_xml, max(total_linhas, 2))
+    tabela_xml = re.sub(r"<sortState\b(?:[^>]*/>|.*?</sortState>)", "", tabela_xml, flags=re.S)
+    return re.sub(r"<filterColumn\b(?:[^>]*/>|.*?</filterColumn>)", "", tabela_xml, flags=re.S)
+
+
+def _ajustar_cauda(cauda, total_linhas, tabelas_mantidas):
+    """
+    Parte da aba depois de </sheetData> (mesclagens, filtro, formatação
+    condicional, validações, configuração de impressão, desenhos, tabelas...)
+    sem o que descrevia células dos dados antigos: ordenação, mesclagens e
+    hiperlinks saem; o autofiltro passa a cobrir as linhas novas (sem os
+    critérios antigos); tableParts fica só com as tabelas mantidas.
+    """
+    cauda = _CAUDA_INVALIDA.sub("", cauda)
+
+    def autofiltro(m):
+        ref = _REF.search(m.group(0))
+        if ref is None or ref.group(2) != "1":
+            return ""
+        return f'<autoFilter ref="{ref.group(1)}1:{ref.group(3)}{max(total_linhas, 1)}"/>'
+    cauda = re.sub(r"<autoFilter\b(?:[^>]*/>|.*?</autoFilter>)", autofiltro, cauda, flags=re.S)
+
+    def partes_tabela(m):
+        partes = [t for t in re.findall(r"<tablePart\b[^>]*/>", m.group(0))
+                  if re.search(r'\bid="([^"]*)"', t).group(1) in tabelas_mantidas]
+        return f'<tableParts count="{len(partes)}">{"".join(partes)}</tableParts>' if partes else ""
+    return re.sub(r"<tableParts\b(?:[^>]*/>|.*?</tableParts>)", partes_tabela, cauda, flags=re.S)
+
+
+def _cauda_aba(zin, parte):
+    """Texto do XML original da aba depois de </sheetData> (ou <sheetData/>) até o fim, lido em blocos."""
+    resto = b""
+    with zin.open(parte) as f:
+        while True:
+            bloco = f.read(_BLOCO_COPIA)
+            texto = resto + bloco
+            fim = re.search(rb"</sheetData>|<sheetData/>", texto)
+            if fim is not None:
+                return (texto[fim.end():] + f.read()).decode("utf-8")
+            if not bloco:
+                return "</worksheet>"
+            resto = texto[-16:]
+
+
+def _garantir_estilos(styles_xml):
+    """
+    Garante em cellXfs um xf simples para cada formato de data/hora e retorna
+    (styles.xml, {numFmtId: índice do xf}). Reaproveita xfs já existentes, então
+    gravações repetidas não fazem o styles.xml crescer.
+    """
+    bloco = re.search(r"(<cellXfs\b[^>]*>)(.*?)(</cellXfs>)", styles_xml, re.S)
+    if bloco is None:
+        return styles_xml, {}
+    xfs = _XF.findall(bloco.group(2))
+    indices, novos = {}, []
+    for fmt in (FMT_DATA, FMT_HORA, FMT_DATA_HORA):
+        for i, xf in enumerate(xfs):
+            cabeca = xf.split(">", 1)[0]
+            atributos = dict(re.findall(r'(\w+)="([^"]*)"', cabeca))
+            if (atributos.get("numFmtId") == str(fmt) and "<" not in xf[1:]
+                    and all(atributos.get(a, "0") == "0" for a in ("fontId", "fillId", "borderId", "xfId"))):
+                indices[fmt] = i
+                break
+        else:
+            indices[fmt] = len(xfs) + len(novos)
+            novos.append(f'<xf numFmtId="{fmt}" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>')
+    if not novos:
+        return styles_xml, indices
+    abertura = re.sub(r'\bcount="\d+"', f'count="{len(xfs) + len(novos)}"', bloco.group(1))
+    novo_bloco = abertura + bloco.group(2) + "".join(novos) + bloco.group(3)
+    return styles_xml[:bloco.start()] + novo_bloco + styles_xml[bloco.end():], indices
+
+
+def _origem_datas(workbook_xml):
+    # Pastas de trabalho no sistema de datas 1904 (Mac antigo) contam a partir de 1904-01-01
+    if re.search(r'<workbookPr\b[^>]*\bdate1904="(1|true)"', workbook_xml):
+        return datetime(1904, 1, 1)
+    return datetime(1899, 12, 30)
+
+
+def _celula(ref, valor, estilos, origem):
+    """XML de uma célula (string vazia para vazios). Texto vai como inlineStr."""
+    if valor is None or valor is pd.NaT or valor is pd.NA:
+        return ""
+    if isinstance(valor, (bool, np.bool_)):
+        return f'<c r="{ref}" t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (int, np.integer)):
+        return f'<c r="{ref}"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (float, np.floating)):
+        if not math.isfinite(valor):
+            return ""
+        return f'<c r="{ref}"><v>{float(valor)!r}</v></c>'
+    if isinstance(valor, datetime):
+        valor = valor.replace(tzinfo=None)
+        serial = (valor - origem) / timedelta(days=1)
+        fmt = FMT_DATA if valor.time() == time(0) else FMT_DATA_HORA
+        return _celula_numero(ref, serial, estilos.get(fmt), valor.isoformat(sep=" "))
+    if isinstance(valor, date):
+        serial = (datetime(valor.year, valor.month, valor.day) - origem).days
+        return _celula_numero(ref, serial, estilos.get(FMT_DATA), valor.isoformat())
+    if isinstance(valor, time):
+        serial = (valor.hour * 3600 + valor.minute * 60 + valor.second + valor.microsecond / 1e6) / 86400
+        return _celula_numero(ref, serial, estilos.get(FMT_HORA), valor.isoformat())
+    if isinstance(valor, (timedelta, np.timedelta64)):
+        return _celula_numero(ref, pd.Timedelta(valor) / pd.Timedelta(days=1), estilos.get(FMT_HORA), str(valor))
+    texto = _INVALIDOS_XML.sub("", str(valor))
+    if not texto:
+        return ""
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{escape(texto)}</t></is></c>'
+
+
+def _celula_numero(ref, serial, estilo, texto):
+    # sem estilo de data disponível, grava o texto ISO para não perder a informação
+    if estilo is None:
+        return f'<c r="{ref}" t="inlineStr"><is><t>{escape(texto)}</t></is></c>'
+    return f'<c r="{ref}" s="{estilo}"><v>{serial!r}</v></c>'
+
+
+def _xml_linhas(linhas, primeira_linha, estilos, origem, estilo_cabecalho=None):
+    """Gera blocos de XML <row> (em bytes) a partir de um iterável de tuplas, sem materializar tudo."""
+    letras = []
+    bloco = []
+    for n, linha in enumerate(linhas, start=primeira_linha):
+        while len(letras) < len(linha):
+            letras.append(_letra_coluna(len(letras)))
+        celulas = "".join(_celula(f"{letras[i]}{n}", v, estilos, origem) for i, v in enumerate(linha))
+        if n == 1 and estilo_cabecalho is not None:
+            celulas = celulas.replace("<c r=", f'<c s="{estilo_cabecalho}" r=')
+        bloco.append(f'<row r="{n}">{celulas}</row>')
+        if len(bloco) >= _LINHAS_POR_BLOCO:
+            yield "".join(bloco).encode("utf-8")
+            bloco = []
+    if bloco:
+        yield "".join(bloco).encode("utf-8")
+
+
+def _linhas_dataframe(df, colunas=None):
+    """Cabeçalho + linhas de df (na ordem de colunas, se informada) como tuplas."""
+    if colunas is not None:
+        df = df.reindex(columns=list(colunas))
+    else:
+        yield tuple(df.columns)
+    yield from df.astype(object).itertuples(index=False, name=None)
+
+
+def _cabeca_aba(zin, parte):
+    """
+    Início do XML original da aba até <sheetData> (raiz com os namespaces,
+    sheetPr, sheetViews, sheetFormatPr, cols) e o estilo da célula A1.
+    """
+    lido = b""
+    with zin.open(parte) as f:
+        while b"</row>" not in lido and b"<sheetData/>" not in lido:
+            bloco = f.read(1 << 16)
+            if not bloco:
+                break
+            lido += bloco
+    texto = lido.decode("utf-8", errors="ignore")
+    inicio = re.search(r"<sheetData\b", texto)
+    cabeca = texto[:inicio.start()] if inicio else texto[:texto.index(">", texto.index("<worksheet")) + 1]
+    cabeca = re.sub(r"<dimension\b[^>]*/>", "", cabeca)
+    # o filtro da aba original não vale para os dados regenerados
+    cabeca = re.sub(r'(<sheetPr\b[^>]*?)\s+filterMode="[^"]*"', r"\1", cabeca)
+    a1 = re.search(r'<c\b[^>]*\br="A1"[^>]*>', texto)
+    estilo = re.search(r'\bs="(\d+)"', a1.group(0)) if a1 else None
+    return cabeca, (estilo.group(1) if estilo else None)
+
+
+def substituir_aba_xlsx(origem, destino, aba, df):
+    """
+    Grava em destino uma cópia de origem em que só a aba indicada é
+    regenerada a partir de df; as demais partes do pacote (abas, estilos,
+    tabelas, fórmulas, links externos) são copiadas byte a byte.
+    A aba nova é escrita em streaming (blocos de linhas com texto inline);
+    a aparência da aba (colunas, painéis congelados, estilo do cabeçalho) é
+    mantida, assim como o que vem depois dos dados (formatação condicional,
+    validações, configuração de impressão, desenhos, comentários) e as
+    relações da aba. Perdas: ordenação salva, células mescladas e hiperlinks
+    de célula (apontavam para os dados antigos); critérios do autofiltro
+    (o intervalo passa a cobrir as linhas novas); tabelas (ListObject) que
+    não começam na linha 1 ou cujas colunas não batem com o cabeçalho novo
+    (as demais são estendidas até a última linha). Formatação condicional e
+    validações continuam nos intervalos originais, sem acompanhar a nova
+    quantidade de linhas, e comentários/desenhos ficam ancorados nas mesmas
+    células. calcChain.xml é descartado para o Excel recriá-lo.
+    """
+    dimensoes = (tuple(df.columns), len(df) + 1)
+    _gravar_pacote(origem, destino, aba, _linhas_dataframe(df), anexar=False, dimensoes=dimensoes)
+
+
+def anexar_linhas_xlsx(origem, destino, aba, df):
+    """
+    Grava em destino uma cópia de origem com as linhas de df acrescentadas ao
+    fim da aba, na ordem do cabeçalho existente. O XML da aba é copiado em
+    streaming e as novas linhas são inseridas antes de </sheetData>; nada do
+    conteúdo existente é reinterpretado. O autofiltro e as tabelas que
+    terminavam na última linha antiga passam a terminar na última nova.
+    """
+    cabecalho = next(iter_sheet_rows(origem, aba), ())
+    _gravar_pacote(origem, destino, aba, _linhas_dataframe(df, cabecalho), anexar=True)
+
+
+def _gravar_pacote(origem, destino, aba, linhas, anexar, dimensoes=None):
+    # grava ao lado e troca no fim: quem estiver lendo o destino nunca vê um zip pela metade
+    tmp = caminho_temporario(destino)
+    try:
+        _escrever_pacote(origem, tmp, aba, linhas, anexar, dimensoes)
+        substituir_atomico(tmp, destino)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _escrever_pacote(origem, tmp, aba, linhas, anexar, dimensoes=None):
+    with zipfile.ZipFile(origem) as zin, zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zout:
+        parte = _sheet_parts_zip(zin).get(aba)
+        if parte is None or parte not in zin.namelist():
+            raise KeyError(f"Aba '{aba}' não encontrada em {origem}")
+        nomes = set(zin.namelist())
+        origem_datas = _origem_datas(zin.read("xl/workbook.xml").decode("utf-8"))
+
+        # dimensoes: (cabeçalho, total de linhas com o cabeçalho) da aba regenerada
+        descartar, substituir, tabelas_mantidas, tabelas_anexar = set(), {}, set(), []
+        if anexar:
+            # o intervalo novo das tabelas só se sabe depois de copiar a aba: elas vão depois dela
+            rels = _rels_da_parte(parte)
+            if rels in nomes:
+                tabelas_anexar = [alvo for _, _, alvo in _relacoes(zin.read(rels).decode("utf-8"), parte, "table")
+                                  if alvo in nomes]
+        else:
+            cabecalho, total_linhas = dimensoes
+            rels = _rels_da_parte(parte)
+            if rels in nomes:
+                rels_xml = zin.read(rels).decode("utf-8")
+                for rel, id_rel, alvo in _relacoes(rels_xml, parte, "table"):
+                    tabela = _ajustar_tabela(zin.read(alvo).decode("utf-8"), cabecalho, total_linhas) \
+                        if alvo in nomes else None
+                    if tabela is None:
+                        descartar.add(alvo)
+                        rels_xml = rels_xml.replace(rel, "")
+                    else:
+                        substituir[alvo] = tabela.encode("utf-8")
+                        tabelas_mantidas.add(id_rel)
+                # os hiperlinks de célula saem da aba (ver _ajustar_cauda)
+                rels_xml = re.sub(r'<Relationship\b[^>]*\bType="[^"]*/hyperlink"[^>]*/>', "", rels_xml)
+                substituir[rels] = rels_xml.encode("utf-8")
+            descartar.add("xl/calcChain.xml")
+
+        estilos = {}
+        for info in zin.infolist():
+            nome = info.filename
+            if nome in descartar:
+                continue
+            if nome == "xl/styles.xml":
+                styles_xml, estilos = _garantir_estilos(zin.read(nome).decode("utf-8"))
+                _copiar_parte(zin, zout, info, styles_xml.encode("utf-8"))
+            elif nome == "[Content_Types].xml" and descartar:
+                tipos = zin.read(nome).decode("utf-8")
+                for removida in descartar:
+                    tipos = re.sub(rf'<Override\b[^>]*\bPartName="/{re.escape(removida)}"[^>]*/>', "", tipos)
+                _copiar_parte(zin, zout, info, tipos.encode("utf-8"))
+            elif nome == "xl/_rels/workbook.xml.rels" and "xl/calcChain.xml" in descartar:
+                rels_xml = zin.read(nome).decode("utf-8")
+                rels_xml = re.sub(r'<Relationship\b[^>]*\bTarget="[^"]*calcChain\.xml"[^>]*/>', "", rels_xml)
+                _copiar_parte(zin, zout, info, rels_xml.encode("utf-8"))
+            elif nome in substituir:
+                _copiar_parte(zin, zout, info, substituir[nome])
+            elif nome != parte and nome not in tabelas_anexar:
+                _copiar_parte(zin, zout, info)
+
+        # a aba alvo vai por último: os estilos de data/hora já estão resolvidos
+        info = zin.getinfo(parte)
+        nova = zipfile.ZipInfo(parte, date_time=info.date_time)
+        nova.compress_type = zipfile.ZIP_DEFLATED
+        with zout.open(nova, "w", force_zip64=True) as saida:
+            if anexar:
+                ultima_antiga, ultima_nova = _anexar_na_aba(zin, parte, saida, linhas, estilos, origem_datas)
+            else:
+                cabeca, estilo_cabecalho = _cabeca_aba(zin, parte)
+                saida.write(cabeca.encode("utf-8") + b"<sheetData>")
+                for bloco in _xml_linhas(linhas, 1, estilos, origem_datas, estilo_cabecalho):
+                    saida.write(bloco)
+                cauda = _ajustar_cauda(_cauda_aba(zin, parte), total_linhas, tabelas_mantidas)
+                saida.write(b"</sheetData>" + cauda.encode("utf-8"))
+        for alvo in tabelas_anexar:
+            tabela = _estender_tabela(zin.read(alvo).decode("utf-8"), ultima_antiga, ultima_nova)
+            _copiar_parte(zin, zout, zin.getinfo(alvo), tabela.encode("utf-8"))
+
+
+def _anexar_na_aba(zin, parte, saida, linhas, estilos, origem_datas):
+    """
+    Copia o XML da aba em blocos, guardando o número da última linha, e
+    insere as novas antes do fim. Retorna (última linha antiga, última nova).
+    """
+    ultima, contagem = 0, 0
+    resto = b""
+    cabeca_pendente = True
+    with zin.open(parte) as f:
+        while True:
+            bloco = f.read(_BLOCO_COPIA)
+            texto = resto + bloco
+            if cabeca_pendente and (b"<sheetData" in texto or not bloco):
+                # a dimensão antiga deixaria de valer; o elemento é opcional
+                texto = re.sub(rb"<dimension\b[^>]*/>", b"", texto, count=1)
+                cabeca_pendente = False
+            fim = re.search(rb"</sheetData>|<sheetData/>", texto)
+            for m in _ROW_R.finditer(texto if fim is None else texto[:fim.start()]):
+                ultima = max(ultima, int(m.group(1)))
+            if fim is not None:
+                contagem += texto.count(b"<row", 0, fim.start())
+                saida.write(texto[:fim.start()])
+                if fim.group(0) == b"<sheetData/>":
+                    saida.write(b"<sheetData>")
+                ultima_antiga = ultima_nova = max(ultima, contagem)
+                for xml in _xml_linhas(linhas, ultima_antiga + 1, estilos, origem_datas):
+                    ultima_nova += xml.count(b'<row r="')
+                    saida.write(xml)
+                # depois de </sheetData> só vêm elementos curtos (filtro, mesclagens, impressão...)
+                cauda = (texto[fim.end():] + f.read()).decode("utf-8")
+                saida.write(b"</sheetData>" + _estender_cauda(cauda, ultima_antiga, ultima_nova).encode("utf-8"))
+                return ultima_antiga, ultima_nova
+            if not bloco:
+                raise ValueError(f"XML da aba {parte} sem </sheetData>")
+            # mantém o fim do bloco para não cortar uma tag <row ...> ao meio
+            corte = max(0, len(texto) - 256) if not cabeca_pendente else 0
+            contagem += texto.count(b"<row", 0, corte + 3)
+            saida.write(texto[:corte])
+            resto = texto[corte:]
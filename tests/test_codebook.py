@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+
+from modules.codebook import CODEBOOKS, DE_FASE, Codebook, aplicar_mapeamentos, categorizar
+
+BRUTO = pd.DataFrame({
+    'Causa': list(CODEBOOKS['Causa'].de_para) + ['valor fora', None],
+    'FT': (list(CODEBOOKS['FT'].de_para) * 3)[:len(CODEBOOKS['Causa'].de_para) + 2],
+    'Fase': (list(DE_FASE) * 3)[:len(CODEBOOKS['Causa'].de_para) + 2],
+})
+
+
+def _textos(df):
+    return {c: df[c].astype(object).where(df[c].notna(), None).tolist() for c in CODEBOOKS}
+
+
+def test_categorizar_apos_aplicar_nao_altera_valores():
+    uma_vez, _ = aplicar_mapeamentos(BRUTO)
+    duas_vezes, _ = categorizar(uma_vez)
+    assert _textos(duas_vezes) == _textos(uma_vez)
+    assert list(duas_vezes['Fase'].cat.categories[:len(CODEBOOKS['Fase'].categorias)]) == list(CODEBOOKS['Fase'].categorias)
+
+
+@pytest.mark.parametrize("coluna", [c for c, cb in CODEBOOKS.items() if cb.idempotente])
+def test_aplicar_duas_vezes_igual_a_uma(coluna):
+    codebook = CODEBOOKS[coluna]
+    uma_vez, _ = codebook.aplicar(BRUTO[coluna])
+    duas_vezes, _ = codebook.aplicar(uma_vez)
+    assert uma_vez.astype(object).tolist() == duas_vezes.astype(object).tolist()
+
+
+def test_fase_preserva_fase_terra_ja_normalizada():
+    normalizado, _ = CODEBOOKS['Fase'].aplicar(pd.Series(['ABG', 'BCT', 'CAN']))
+    assert normalizado.tolist() == ['ABN', 'BCN', 'CA']
+    categorizado, fora = CODEBOOKS['Fase'].categorizar(normalizado)
+    assert categorizado.tolist() == ['ABN', 'BCN', 'CA']
+    assert fora == {}
+
+
+def test_destino_encadeado_e_sinalizado():
+    assert CODEBOOKS['Fase'].encadeados == {'ABN': 'AB', 'BCN': 'BC', 'CAN': 'CA'}
+    with pytest.raises(ValueError, match="ABN"):
+        Codebook(DE_FASE, 'Fase')
@@ -0,0 +1,54 @@
+import json
+import os
+import time
+
+import pytest
+
+from modules.concorrencia import trava_arquivo
+
+
+def _gravar_trava(caminho, token, idade=0.0):
+    with open(caminho, "w", encoding="utf-8") as f:
+        json.dump({"token": token, "pid": 0, "host": "outra", "desde": time.time() - idade}, f)
+    antigo = time.time() - idade
+    os.utime(caminho, (antigo, antigo))
+
+
+def _token(caminho):
+    with open(caminho, encoding="utf-8") as f:
+        return json.load(f)["token"]
+
+
+def test_trava_criada_e_removida(tmp_path):
+    base = str(tmp_path / "base.xlsx")
+    with trava_arquivo(base):
+        assert os.path.exists(base + ".lock")
+    assert not os.path.exists(base + ".lock")
+
+
+def test_trava_ocupada_esgota_a_espera(tmp_path):
+    base = str(tmp_path / "base.xlsx")
+    _gravar_trava(base + ".lock", "outra")
+    with pytest.raises(TimeoutError):
+        with trava_arquivo(base, espera=0, validade=60):
+            pass
+    assert _token(base + ".lock") == "outra"
+
+
+def test_trava_abandonada_e_assumida(tmp_path):
+    base = str(tmp_path / "base.xlsx")
+    _gravar_trava(base + ".lock", "antiga", idade=120)
+    with trava_arquivo(base, espera=1, validade=60):
+        assert _token(base + ".lock") != "antiga"
+    assert not os.path.exists(base + ".lock")
+
+
+def test_nao_remove_nem_renova_trava_de_outra_sessao(tmp_path):
+    base = str(tmp_path / "base.xlsx")
+    with trava_arquivo(base) as renovar:
+        # a trava expirou e outra sessão assumiu no meio do trabalho
+        _gravar_trava(base + ".lock", "outra", idade=30)
+        mtime = os.stat(base + ".lock").st_mtime
+        renovar()
+        assert os.stat(base + ".lock").st_mtime == mtime
+    assert _token(base + ".lock") == "outra"
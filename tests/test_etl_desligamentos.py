@@ -0,0 +1,108 @@
+import datetime as dt
+
+import openpyxl
+import pandas as pd
+import pytest
+
+from modules import data_loader
+from modules.codebook import Codebook
+from modules.etl_desligamentos import (
+    _crc_abas, ler_estado, reconstruir_base, sincronizar_desligamentos, sincronizar_incremental,
+)
+
+COLUNAS = ["Concessão", "Data", "FT", "Hora", "Causa"]
+MAPEAMENTOS = {"Causa": {"QUEIMADA ": "Queimada"}}
+
+
+def _linha(dia, hora, ft="LT A", causa="Queimada"):
+    return ["GUMC", dt.datetime(2024, 1, dia), ft, hora, causa]
+
+
+def _gravar(caminho, linhas, outras=None):
+    wb = openpyxl.Workbook()
+    aba = wb.active
+    aba.title = "Ocorrencia"
+    aba.append(COLUNAS)
+    for linha in linhas:
+        aba.append(linha)
+    for nome, valor in (outras or {}).items():
+        wb.create_sheet(nome)["A1"] = valor
+    wb.save(caminho)
+
+
+@pytest.fixture
+def planilhas(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_loader, "CACHE_DIR", str(tmp_path / "cache"))
+    p1, p2, saida = (str(tmp_path / nome) for nome in ("p1.xlsx", "p2.xlsx", "base.xlsx"))
+    _gravar(p1, [_linha(1, "08:00"), _linha(2, "09:30", causa="QUEIMADA ")])
+    _gravar(p2, [_linha(3, "10:00"), _linha(1, "08:00")], outras={"Resumo": "fixo"})
+    return p1, p2, saida
+
+
+def _base(saida):
+    return pd.read_excel(saida, sheet_name="Ocorrencia")
+
+
+def test_primeira_execucao_reconstroi(planilhas):
+    p1, p2, saida = planilhas
+    r = sincronizar_desligamentos(p1, p2, saida, mapeamentos=MAPEAMENTOS)
+    assert (r["modo"], r["novas"], r["atrasadas"]) == ("completo", 3, 0)
+    base = _base(saida)
+    # duplicada entre P1 e P2 removida; dicionário aplicado
+    assert len(base) == 3 and set(base["Causa"]) == {"Queimada"}
+    assert openpyxl.load_workbook(saida)["Resumo"]["A1"].value == "fixo"
+    assert ler_estado(saida)["watermark"] == "2024-01-03T10:00:00"
+
+
+def test_reexecucao_sem_mudancas_fica_atualizado(planilhas):
+    p1, p2, saida = planilhas
+    sincronizar_desligamentos(p1, p2, saida, mapeamentos=MAPEAMENTOS)
+    r = sincronizar_desligamentos(p1, p2, saida, mapeamentos=MAPEAMENTOS)
+    assert (r["modo"], r["novas"], r["atrasadas"]) == ("atualizado", 0, 0)
+    assert len(_base(saida)) == 3
+
+
+def test_nova_linha_e_anexada(planilhas):
+    p1, p2, saida = planilhas
+    sincronizar_desligamentos(p1, p2, saida, mapeamentos=MAPEAMENTOS)
+    _gravar(p1, [_linha(1, "08:00"), _linha(2, "09:30", causa="QUEIMADA "), _linha(5, "07:15", ft="LT B")])
+    r = sincronizar_desligamentos(p1, p2, saida, mapeamentos=MAPEAMENTOS)
+    assert (r["modo"], r["novas"], r["atrasadas"]) == ("incremental", 1, 0)
+    base = _base(saida)
+    assert len(base) == 4 and base["FT"].iloc[-1] == "LT B"
+    assert ler_estado(saida)["watermark"] == "2024-01-05T07:15:00"
+    # a mesma execução de novo não anexa nada
+    assert sincronizar_desligamentos(p1, p2, saida, mapeamentos=MAPEAMENTOS)["modo"] == "atualizado"
+
+
+def test_linha_anterior_a_marca_dagua_conta_como_atrasada(planilhas):
+    p1, p2, saida = planilhas
+    reconstruir_base(p1, p2, saida, MAPEAMENTOS)
+    _gravar(p1, [_linha(1, "08:00"), _linha(2, "09:30", causa="QUEIMADA "), _linha(2, "11:00", ft="LT C")])
+    r = sincronizar_incremental(p1, p2, saida, MAPEAMENTOS, ler_estado(saida), _crc_abas(p2))
+    assert (r["modo"], r["novas"], r["atrasadas"]) == ("incremental", 0, 1)
+    assert len(_base(saida)) == 3
+    # a reconstrução completa recupera a atrasada
+    assert reconstruir_base(p1, p2, saida, MAPEAMENTOS)["novas"] == 4
+
+
+def test_outra_aba_alterada_forca_reconstrucao(planilhas):
+    p1, p2, saida = planilhas
+    sincronizar_desligamentos(p1, p2, saida, mapeamentos=MAPEAMENTOS)
+    _gravar(p2, [_linha(3, "10:00"), _linha(1, "08:00")], outras={"Resumo": "alterado"})
+    r = sincronizar_desligamentos(p1, p2, saida, mapeamentos=MAPEAMENTOS)
+    assert r["modo"] == "completo"
+    assert openpyxl.load_workbook(saida)["Resumo"]["A1"].value == "alterado"
+
+
+def test_nao_mapeados_so_das_linhas_novas(planilhas):
+    p1, p2, saida = planilhas
+    mapeamentos = {"Causa": Codebook({"QUEIMADA": "Queimada"}, "Causa")}
+    _gravar(p1, [_linha(1, "08:00"), _linha(2, "09:30", causa="Vento")])
+    assert reconstruir_base(p1, p2, saida, mapeamentos)["nao_mapeados"] == {"Causa": {"Vento": 1}}
+    _gravar(p1, [_linha(1, "08:00"), _linha(2, "09:30", causa="Vento"),
+                 _linha(6, "12:00", causa="Raio"), _linha(7, "12:00", causa="Raio")])
+    r = sincronizar_incremental(p1, p2, saida, mapeamentos, ler_estado(saida), _crc_abas(p2))
+    assert r["novas"] == 2
+    assert r["nao_mapeados"] == {"Causa": {"Raio": 2}}
+    assert list(_base(saida)["Causa"].iloc[-2:]) == ["Raio", "Raio"]
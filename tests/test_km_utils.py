@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from modules.km_utils import encontrar_torres, localizar_km
+
+
+def _varredura(km_alvo, km_list):
+    """Busca linear original (primeiro vão com km_i <= alvo <= km_i+1), usada como referência."""
+    for i in range(len(km_list) - 1):
+        if km_list[i] <= km_alvo <= km_list[i + 1]:
+            return i, i + 1
+    return None, None
+
+
+KMS = [0.0, 0.4, 1.0, 1.0, 1.0, 2.5, 3.0]
+
+
+@pytest.mark.parametrize("km_alvo, esperado", [
+    (0.2, (0, 1)),
+    # KM exato de uma torre: vão que termina nela
+    (0.4, (0, 1)),
+    (2.5, (4, 5)),
+    # KM repetido (vãos de comprimento zero): primeiro vão que contém o alvo
+    (1.0, (1, 2)),
+    (1.7, (4, 5)),
+    # extremos da linha
+    (0.0, (0, 1)),
+    (3.0, (5, 6)),
+    # antes da primeira / depois da última torre
+    (-0.01, (None, None)),
+    (3.01, (None, None)),
+])
+def test_encontrar_torres(km_alvo, esperado):
+    assert encontrar_torres(km_alvo, KMS) == esperado
+    assert encontrar_torres(km_alvo, KMS) == _varredura(km_alvo, KMS)
+
+
+@pytest.mark.parametrize("km_list", [[], [1.0], [2.0, 2.0, 2.0]])
+def test_encontrar_torres_linhas_curtas(km_list):
+    for km_alvo in (0.0, 1.0, 2.0, 3.0):
+        assert encontrar_torres(km_alvo, km_list) == _varredura(km_alvo, km_list)
+
+
+@pytest.mark.parametrize("km_alvo", [None, float("nan")])
+def test_encontrar_torres_km_invalido(km_alvo):
+    assert encontrar_torres(km_alvo, KMS) == (None, None)
+
+
+def test_localizar_km_igual_a_encontrar_torres():
+    alvos = np.array([-0.01, 0.0, 0.2, 0.4, 1.0, 1.7, 2.5, 3.0, 3.01, np.nan])
+    anterior, posterior, fracao = localizar_km(alvos, KMS)
+    for i, km_alvo in enumerate(alvos):
+        esperado = encontrar_torres(km_alvo, KMS)
+        obtido = (None, None) if anterior[i] < 0 else (int(anterior[i]), int(posterior[i]))
+        assert obtido == esperado
+    np.testing.assert_allclose(fracao[[2, 4, 5]], [0.5, 1.0, 0.7 / 1.5])
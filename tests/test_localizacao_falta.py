@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.localizacao_falta import comprimentos_lt, estimar_km, estimar_km_dataframe
+
+
+def _escalar(resultado, chave):
+    valor = resultado[chave][0]
+    return valor.item() if isinstance(valor, np.generic) else valor
+
+
+def test_dois_terminais_simetrico():
+    # A lê 40 km, B lê 60 km numa LT de 100 km: os dois apontam o KM 40
+    r = estimar_km("SIGRA 2 Terminais", 100.0, prot_a=40.0, prot_b=60.0)
+    assert _escalar(r, "km") == pytest.approx(40.0)
+    assert _escalar(r, "incerteza") == pytest.approx(1.0)  # 1% de 100 km, sem discordância
+    assert (_escalar(r, "km_min"), _escalar(r, "km_max")) == pytest.approx((39.0, 41.0))
+    assert _escalar(r, "terminal") == "A+B"
+
+
+def test_dois_terminais_discordantes():
+    # A: 42 km; B: 60 km -> 40 km de A. Média 41, metade da discordância (1 km) soma à incerteza
+    r = estimar_km("SIGRA 2 Terminais", 100.0, prot_a=42.0, prot_b=60.0)
+    assert _escalar(r, "km") == pytest.approx(41.0)
+    assert _escalar(r, "incerteza") == pytest.approx(2.0)
+
+
+def test_tw_dois_terminais():
+    r = estimar_km("TW", 100.0, tw_a=25.0, tw_b=75.0)
+    assert _escalar(r, "km") == pytest.approx(25.0)
+    assert _escalar(r, "incerteza") == pytest.approx(0.3)
+
+
+@pytest.mark.parametrize("metodo, leituras, km, km_min, km_max", [
+    # além do Terminal B: média 104 limitada a 100; faixa 98..100
+    ("SIGRA 2 Terminais", {"prot_a": 105.0, "prot_b": -3.0}, 100.0, 98.0, 100.0),
+    # antes do Terminal A: KM 0 e faixa 0..3 (3% de 100 km)
+    ("Sequência Negativa", {"prot_a": -2.0}, 0.0, 0.0, 3.0),
+    ("TW", {"tw_b": 101.0}, 0.0, 0.0, 0.6),
+])
+def test_limita_ao_comprimento(metodo, leituras, km, km_min, km_max):
+    r = estimar_km(metodo, 100.0, **leituras)
+    assert (_escalar(r, "km"), _escalar(r, "km_min"), _escalar(r, "km_max")) == pytest.approx((km, km_min, km_max))
+    assert _escalar(r, "valido")
+
+
+def test_sem_leitura_do_terminal_b():
+    # dois terminais com só um lado: leitura de A com o dobro do erro
+    r = estimar_km("SIGRA 2 Terminais", 100.0, prot_a=30.0, prot_b=None)
+    assert (_escalar(r, "km"), _escalar(r, "incerteza"), _escalar(r, "terminal")) == (30.0, 2.0, "A")
+    # TW com um lado: erro típico de um terminal, ou o informado pelo equipamento se maior
+    r = estimar_km("TW", 100.0, tw_a=30.0, tw_b=np.nan)
+    assert _escalar(r, "incerteza") == pytest.approx(0.6)
+    r = estimar_km("TW", 100.0, tw_a=30.0, erro_tw_a=-0.5)
+    assert _escalar(r, "incerteza") == pytest.approx(1.0)
+
+
+def test_um_terminal_prefere_o_mais_proximo():
+    # B está a 15 km da falta (A a 80): usa B -> KM 85, erro 2% de max(15, 25)
+    r = estimar_km("SIGRA 1 Terminal", 100.0, prot_a=80.0, prot_b=15.0)
+    assert (_escalar(r, "km"), _escalar(r, "terminal")) == (85.0, "B")
+    assert _escalar(r, "incerteza") == pytest.approx(0.5)
+    # Sequência Negativa fica com A mesmo com B mais perto
+    r = estimar_km("Sequência Negativa", 100.0, prot_a=80.0, prot_b=15.0)
+    assert (_escalar(r, "km"), _escalar(r, "terminal")) == (80.0, "A")
+
+
+def test_sem_comprimento_e_sem_leituras():
+    r = estimar_km("SIGRA 2 Terminais", np.nan, prot_a=10.0)
+    assert not _escalar(r, "valido")
+    r = estimar_km("TW", 100.0)
+    assert not _escalar(r, "valido") and np.isnan(_escalar(r, "km_min")) and _escalar(r, "terminal") == ""
+
+
+def test_metodo_desconhecido():
+    with pytest.raises(ValueError):
+        estimar_km("Impedância", 100.0, prot_a=1.0)
+
+
+@pytest.mark.parametrize("metodo", ["Sequência Negativa", "TW", "SIGRA 1 Terminal", "SIGRA 2 Terminais"])
+def test_vetorizado_igual_ao_escalar(metodo):
+    df = pd.DataFrame({
+        "Terminal A - Prot. (km)": [40, None, "12,5", 130, 70, None],
+        "Terminal B - Prot. (km)": [60, 20, None, -5, 10, None],
+        "Terminal A - TW": [41, None, 12.4, 120, None, 3],
+        "Terminal B - TW": [59, 21, None, None, 12, None],
+        "Erro TW TA": [None, None, 0.8, None, None, None],
+    })
+    comprimento = np.array([100.0, 50.0, 80.0, 110.0, np.nan, 90.0])
+    lote = estimar_km_dataframe(df, metodo, comprimento)
+    def valor(v):
+        return np.nan if v is None or v != v else float(str(v).replace(",", "."))
+    for i, linha in enumerate(df.itertuples(index=False)):
+        um = estimar_km(metodo, comprimento[i], prot_a=valor(linha[0]), prot_b=valor(linha[1]),
+                        tw_a=valor(linha[2]), tw_b=valor(linha[3]), erro_tw_a=valor(linha[4]))
+        for chave in ("km", "km_min", "km_max", "incerteza"):
+            np.testing.assert_allclose(lote[chave][i], um[chave][0], equal_nan=True)
+        assert lote["terminal"][i] == um["terminal"][0]
+        assert lote["valido"][i] == um["valido"][0]
+
+
+def test_comprimentos_lt():
+    df_km = pd.DataFrame({"LT": [" LT A ", "LT B", "", "LT C"], "KM": [10, "x", 5, 7.5]})
+    assert comprimentos_lt(df_km) == {"LT A": 10.0, "LT C": 7.5}
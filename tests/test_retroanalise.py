@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.retroanalise import lt_da_ft, retroanalisar
+from modules.tower_index import IndiceTorres, abas_lt
+
+LTS = {"LT GUMC2", "LT JUJB C1", "LT SMSB3"}
+
+
+@pytest.mark.parametrize("ft, esperado", [
+    ("LT JUJB C1", "LT JUJB C1"),     # nome exato
+    ("LT GUMC C2", "LT GUMC2"),       # sem o espaço antes do circuito
+    ("  LT  SMSB   C3 ", "LT SMSB3"),  # espaços extras
+    ("LT GUMI C2", None),
+    (None, None),
+    (np.nan, None),
+])
+def test_lt_da_ft(ft, esperado):
+    assert lt_da_ft(ft, LTS) == esperado
+
+
+class _Workbook:
+    sheet_names = ["DADOS", "KM_LT", "LT SMSB3", "LT GUMC2", "Torres JBJU"]
+
+    def __contains__(self, aba):
+        return aba in self.sheet_names
+
+
+def test_abas_lt_inclui_abas_fora_da_dados():
+    assert abas_lt(_Workbook(), ["LT SMSB3", "LT GUMI2", " LT SMSB3 "]) == ["LT SMSB3", "LT GUMC2"]
+
+
+def _indice():
+    return IndiceTorres(["LT GUMC2"], [0, 3], [0.0, 1.0, 2.0], ["T1", "T2", "T3"], ["ABC", "BCA", "CAB"],
+                        ignoradas={"LT GUMI2": "aba não encontrada"})
+
+
+def test_status_da_retroanalise():
+    df = pd.DataFrame({
+        "FT": ["LT GUMC C2", "LT GUMC C2", "LT GUMC C2", "LT XPTO C1", "LT GUMI C2"],
+        "KM": [1.5, 9.0, np.nan, 1.0, 1.0],
+        "Fase": ["AN", "AN", "AN", "AN", "AN"],
+    })
+    resultado = retroanalisar(df, _indice())
+    assert resultado["Status"].tolist() == ["ok", "KM fora da LT", "sem KM", "LT sem aba no Localizador",
+                                            "aba da LT não indexada"]
+    assert resultado["LT"].tolist()[:3] == ["LT GUMC2"] * 3
+    assert resultado.loc[0, "Torre Anterior"] == "T2"
+    assert resultado.loc[0, "Torre Posterior"] == "T3"
+    assert resultado.loc[0, "Fração no Vão"] == pytest.approx(0.5)
@@ -0,0 +1,89 @@
+import openpyxl
+import pandas as pd
+import pytest
+from openpyxl.worksheet.table import Table
+
+from modules.xlsx_passthrough import anexar_linhas_xlsx, substituir_aba_xlsx
+
+
+@pytest.fixture
+def pasta(tmp_path):
+    """Planilha com autofiltro (Dados), tabela (Tab) e fórmulas (Resumo)."""
+    wb = openpyxl.Workbook()
+    dados = wb.active
+    dados.title = "Dados"
+    dados.append(["A", "B", "C"])
+    for i in range(1, 6):
+        dados.append([i, f"x{i}", i * 2])
+    dados.auto_filter.ref = "A1:C6"
+    tab = wb.create_sheet("Tab")
+    tab.append(["Torre", "KM"])
+    for i in range(1, 4):
+        tab.append([f"T{i}", i * 0.5])
+    tab.add_table(Table(displayName="Torres", ref="A1:B4"))
+    resumo = wb.create_sheet("Resumo")
+    resumo["A1"] = "=SUM(Dados!A2:A6)"
+    resumo["A2"] = "=COUNTA(Tab!A:A)"
+    resumo["B1"] = "fixo"
+    caminho = tmp_path / "origem.xlsx"
+    wb.save(caminho)
+    return caminho
+
+
+def _demais_preservadas(caminho, alterada):
+    wb = openpyxl.load_workbook(caminho)
+    assert wb.sheetnames == ["Dados", "Tab", "Resumo"]
+    assert wb["Resumo"]["A1"].value == "=SUM(Dados!A2:A6)"
+    assert wb["Resumo"]["A2"].value == "=COUNTA(Tab!A:A)"
+    assert wb["Resumo"]["B1"].value == "fixo"
+    if alterada != "Tab":
+        assert [[c.value for c in linha] for linha in wb["Tab"].iter_rows()][:2] == [["Torre", "KM"], ["T1", 0.5]]
+    return wb
+
+
+def test_anexar_estende_autofiltro(pasta, tmp_path):
+    destino = tmp_path / "destino.xlsx"
+    anexar_linhas_xlsx(str(pasta), str(destino), "Dados", pd.DataFrame({"C": [14, 16], "A": [7, 8], "B": ["x7", "x8"]}))
+    wb = _demais_preservadas(destino, "Dados")
+    linhas = [[c.value for c in linha] for linha in wb["Dados"].iter_rows()]
+    assert linhas[0] == ["A", "B", "C"]
+    assert linhas[-2:] == [[7, "x7", 14], [8, "x8", 16]]
+    assert len(linhas) == 8
+    assert wb["Dados"].auto_filter.ref == "A1:C8"
+
+
+def test_anexar_estende_tabela(pasta, tmp_path):
+    destino = tmp_path / "destino.xlsx"
+    anexar_linhas_xlsx(str(pasta), str(destino), "Tab", pd.DataFrame({"Torre": ["T4", "T5"], "KM": [2.0, 2.5]}))
+    wb = _demais_preservadas(destino, "Tab")
+    assert wb["Tab"].tables["Torres"].ref == "A1:B6"
+    assert wb["Tab"].tables["Torres"].autoFilter.ref == "A1:B6"
+    assert [c.value for c in wb["Tab"][6]] == ["T5", 2.5]
+
+
+def test_anexar_duas_vezes_no_mesmo_arquivo(pasta):
+    for i in (4, 5):
+        anexar_linhas_xlsx(str(pasta), str(pasta), "Tab", pd.DataFrame({"Torre": [f"T{i}"], "KM": [i * 0.5]}))
+    wb = _demais_preservadas(pasta, "Tab")
+    assert wb["Tab"].tables["Torres"].ref == "A1:B6"
+    assert [c.value for c in wb["Tab"]["A"]] == ["Torre", "T1", "T2", "T3", "T4", "T5"]
+
+
+def test_substituir_regenera_aba_e_ajusta_intervalos(pasta, tmp_path):
+    destino = tmp_path / "destino.xlsx"
+    substituir_aba_xlsx(str(pasta), str(destino), "Dados", pd.DataFrame({"A": range(10), "B": ["y"] * 10, "C": range(10)}))
+    substituir_aba_xlsx(str(destino), str(destino), "Tab", pd.DataFrame({"Torre": ["T9"], "KM": [9.0]}))
+    wb = _demais_preservadas(destino, "Tab")
+    assert wb["Dados"].max_row == 11
+    assert wb["Dados"].auto_filter.ref == "A1:C11"
+    assert [c.value for c in wb["Dados"][11]] == [9, "y", 9]
+    # tabela com o mesmo cabeçalho continua, com no mínimo uma linha de dados
+    assert wb["Tab"].tables["Torres"].ref == "A1:B2"
+    assert [c.value for c in wb["Tab"][2]] == ["T9", 9.0]
+
+
+def test_substituir_descarta_tabela_com_outro_cabecalho(pasta, tmp_path):
+    destino = tmp_path / "destino.xlsx"
+    substituir_aba_xlsx(str(pasta), str(destino), "Tab", pd.DataFrame({"Outra": [1], "KM": [1.0]}))
+    wb = _demais_preservadas(destino, "Tab")
+    assert dict(wb["Tab"].tables) == {}